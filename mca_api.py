@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""无控制台输出的库接口：只返回带类型的数据，进度通过回调或logging获取
+
+示例：
+    from mca_api import MCAClient
+
+    client = MCAClient(progress=lambda stage, done, total, name: ...)
+    package = client.list_packages()[0]
+    version = client.list_package_versions(package.id)[0]
+    outline = client.get_outline(package.id, version.id)
+    result = client.enrich(outline)
+    files = client.render_markdown(result.output_file)
+
+过程信息写入名为"mca"的logger，默认不输出；需要时用logging.basicConfig(level=logging.INFO)打开。
+"""
+
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional, Callable
+
+from mca_lazy import LazyOutline
+from mca_request import MCARequest
+
+
+@dataclass
+class CoursePackage:
+    """课程包"""
+    id: Any
+    title: str
+    description: str = ""
+    price: Any = None
+    raw: Dict[str, Any] = field(default_factory=dict, repr=False)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "CoursePackage":
+        return cls(
+            id=data.get("id"),
+            title=(data.get("title") or data.get("name") or "").strip(),
+            description=data.get("description") or "",
+            price=data.get("price"),
+            raw=data,
+        )
+
+
+@dataclass
+class PackageVersion:
+    """课程包版本"""
+    id: Any
+    name: str
+    raw: Dict[str, Any] = field(default_factory=dict, repr=False)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "PackageVersion":
+        return cls(id=data.get("id"), name=data.get("name") or data.get("title") or "", raw=data)
+
+
+@dataclass
+class Outline:
+    """课程大纲
+
+    Attributes:
+        items: 阶段列表、课程列表或嵌套大纲的子节点
+        source: 数据来源，"child"为systemCourse/child接口，"legacy"为旧的大纲接口
+        course_id: 课程包ID
+        package_version_id: 课程包版本ID
+    """
+    items: List[Dict[str, Any]]
+    source: str
+    course_id: Any = None
+    package_version_id: Any = None
+
+    @property
+    def is_simple_format(self) -> bool:
+        """是否为简单列表格式（课程带courseNo字段）"""
+        return bool(self.items) and isinstance(self.items[0], dict) and "courseNo" in self.items[0]
+
+
+@dataclass
+class EnrichResult:
+    """丰富结果
+
+    Attributes:
+        items: 丰富后的大纲（与输入为同一对象）
+        output_file: 丰富结果的保存路径
+        failures: 获取失败的课程（死信队列）
+        request_stats: 各接口的请求统计
+    """
+    items: List[Dict[str, Any]]
+    output_file: Optional[str]
+    failures: List[Dict[str, Any]]
+    request_stats: Dict[str, Dict[str, Any]]
+
+
+class MCAClient:
+    """MCARequest的静默封装，所有方法只返回数据，不向控制台打印
+
+    Args:
+        mca: 已配置的MCARequest实例，为None时新建一个静默实例
+        progress: 进度回调，参数为 (阶段, 已完成数, 总数, 当前项名称)
+        **kwargs: 新建MCARequest时传入的其他参数（hedging、timeouts、profiler）
+    """
+
+    def __init__(self, mca: Optional[MCARequest] = None,
+                 progress: Optional[Callable[[str, int, int, str], None]] = None, **kwargs):
+        self.mca = mca or MCARequest(progress=progress, **kwargs)
+        self.mca.verbose = False
+        if progress is not None:
+            self.mca.progress = progress
+
+    def list_packages(self) -> List[CoursePackage]:
+        """获取全部课程包"""
+        return [CoursePackage.from_dict(item) for item in self.mca.get_course_list()]
+
+    def iter_packages(self):
+        """分页获取课程包，逐个返回，第一页到达即可开始处理"""
+        for item in self.mca.iter_course_packages():
+            yield CoursePackage.from_dict(item)
+
+    def list_package_versions(self, course_package_id) -> List[PackageVersion]:
+        """获取课程包的版本列表"""
+        return [PackageVersion.from_dict(item) for item in self.mca.get_course_package_versions(course_package_id)]
+
+    def get_outline(self, course_id, package_version_id) -> Optional[Outline]:
+        """获取课程大纲，先使用systemCourse/child接口，失败时使用旧的大纲接口
+
+        Returns:
+            Outline: 课程大纲，两个接口都没有数据时返回None
+        """
+        course_data = self.mca.fetch_course_child(course_id, package_version_id)
+        if course_data:
+            items = course_data.get("stageList") or course_data.get("courseItemList") or []
+            if items:
+                return Outline(items, "child", course_id, package_version_id)
+        items = self.mca.get_course_outline(package_version_id)
+        if items:
+            return Outline(items, "legacy", course_id, package_version_id)
+        return None
+
+    def enrich(self, outline) -> EnrichResult:
+        """丰富课程大纲并保存结果
+
+        Args:
+            outline: Outline对象或大纲列表
+        """
+        items = outline.items if isinstance(outline, Outline) else outline
+        self.mca.enrich_course_outline(items)
+        return EnrichResult(
+            items=items,
+            output_file=self.mca.last_enriched_file,
+            failures=list(self.mca.dead_letters),
+            request_stats=self.mca.hedger.report(),
+        )
+
+    def lazy_outline(self, outline, prefetch: int = 0) -> LazyOutline:
+        """把大纲中的课程替换为按需获取的代理，访问章节或详情字段时才发出请求
+
+        Args:
+            outline: Outline对象或大纲列表
+            prefetch: 访问某个课程时在后台预取其后的课程数
+
+        Returns:
+            LazyOutline: courses为课程代理列表，save结果用MCARequest.save_lazy_outline
+        """
+        items = outline.items if isinstance(outline, Outline) else outline
+        return self.mca.lazy_course_outline(items, prefetch)
+
+    def render_markdown(self, json_file_path: Optional[str] = None, output_file: Optional[str] = None,
+                        max_chars_per_file: Optional[int] = None) -> List[str]:
+        """从丰富后的JSON生成Markdown文件
+
+        Returns:
+            list: 生成的文件路径，输入无效时返回空列表
+        """
+        return self.mca.generate_markdown_from_enriched_json(json_file_path, output_file, max_chars_per_file) or []
+
+    def render_course(self, course: Dict[str, Any]) -> str:
+        """把单个丰富后的课程渲染为Markdown文本"""
+        return self.mca.render_course_markdown(course)
@@ -0,0 +1,401 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""基准测试与性能回归检查：对丰富、Markdown渲染、结构提取和JSON读写运行基准，按提交和机器保存结果，并与基线比较
+
+用法：
+    python mca_bench.py [--cases enrich,render_markdown,extract_structure,dump_json,...] [--repeat 5] [--scale 1]
+                        [--workers 4] [--baseline COMMIT] [--threshold 0.1] [--results data/bench/results.json]
+                        [--no-save]
+
+结果按 <提交>@<机器> 保存在结果文件中。未指定--baseline时，与同一台机器上最近一次其他提交的结果比较；
+任何基准出现超过阈值且超出测量噪声的退化时，打印对比表并以退出码1结束。
+"""
+
+import copy
+import gc
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Callable
+
+from mca_fakegateway import FakeGateway, SyntheticCatalog
+from mca_request import MCARequest, pop_option
+from mca_storage import atomic_write, load_json_file, write_json_file
+from mca_transport import CircuitBreaker
+
+# 结果文件的默认路径和格式标识
+DEFAULT_RESULTS_FILE = os.path.join("data", "bench", "results.json")
+RESULTS_FORMAT = "mca-bench"
+
+# 每次测量的最短耗时（秒），单次运行更快的基准在一次测量中循环多次，减少计时噪声
+MIN_SAMPLE_SECONDS = 0.2
+
+# 判定退化的默认相对阈值
+DEFAULT_THRESHOLD = 0.10
+
+# 差值还需超过基线和本次结果离散程度（按正态换算的MAD）的这个倍数，才视为真实变化
+NOISE_FACTOR = 3.0
+
+# 各指标的比较方式：方向（lower表示越小越好）、相对阈值（None使用命令行阈值）和最小可判定差值
+METRICS = {
+    "seconds": {"better": "lower", "threshold": None, "min_delta": 0.002, "label": "耗时(s)"},
+    "throughput": {"better": "higher", "threshold": None, "min_delta": 0.0, "label": "吞吐量(/s)"},
+    "peak_memory": {"better": "lower", "threshold": None, "min_delta": 512 * 1024, "label": "内存峰值(B)"},
+    # 模拟网关没有错误注入时请求数是确定的，任何增加都视为退化
+    "requests": {"better": "lower", "threshold": 0.0, "min_delta": 0.5, "label": "请求数"},
+}
+
+
+def git_commit(repo_dir: Optional[str] = None) -> str:
+    """当前提交的短哈希，工作区有未提交的修改时加-dirty后缀；不在git仓库中时返回unknown"""
+    repo_dir = repo_dir or os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=repo_dir, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=repo_dir,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return f"{commit}-dirty" if dirty else commit
+
+
+def machine_id() -> str:
+    """机器标识：主机名、系统、架构和Python版本"""
+    return (f"{platform.node() or 'unknown'}-{platform.system().lower()}-{platform.machine()}"
+            f"-py{sys.version_info[0]}.{sys.version_info[1]}")
+
+
+def summarize(samples: List[float]) -> Dict[str, Any]:
+    """多次测量的中位数和离散程度（MAD按正态分布换算为标准差的估计）"""
+    median = statistics.median(samples)
+    mad = statistics.median(abs(s - median) for s in samples) * 1.4826
+    return {"median": median, "mad": mad, "samples": samples}
+
+
+class BenchContext:
+    """各基准共用的模拟网关、合成数据和临时目录
+
+    Args:
+        scale: 数据规模倍数，1为5个阶段、每个阶段20个课程
+        workers: 丰富时的并发线程数
+    """
+
+    def __init__(self, scale: int = 1, workers: int = 4):
+        self.scale = scale
+        self.workers = workers
+        self.catalog = SyntheticCatalog(stages=5, courses_per_stage=20 * scale)
+        self.gateway = None
+        self.work_dir = None
+        self.stage_list = None
+        self.enriched_file = None
+        self._tmp = None
+
+    def __enter__(self):
+        self._tmp = tempfile.TemporaryDirectory(prefix="mca-bench-")
+        self.work_dir = self._tmp.name
+        self.gateway = FakeGateway(self.catalog).start()
+        mca = self.new_request()
+        self.stage_list = mca.fetch_course_child("1", "101")["stageList"]
+        # Markdown渲染基准使用一份预先丰富好的结果
+        mca.enrich_course_outline(copy.deepcopy(self.stage_list))
+        self.enriched_file = mca.last_enriched_file
+        return self
+
+    def __exit__(self, *exc):
+        self.gateway.stop()
+        self._tmp.cleanup()
+
+    def new_request(self) -> MCARequest:
+        """指向模拟网关的静默MCARequest，使用独立的熔断器，结果写入临时目录"""
+        mca = MCARequest()
+        mca.data_dir = self.work_dir
+        mca.base_url = self.gateway.base_url
+        mca.breaker = CircuitBreaker(state_file=None)
+        mca.set_enrich_workers(self.workers)
+        return mca
+
+
+def bench_enrich(ctx: BenchContext) -> Callable[[int], Dict[str, float]]:
+    """丰富流程：获取每个课程的版本和章节并保存结果（耗时足够长，不做循环）"""
+    mca = ctx.new_request()
+
+    def run(loops=1):
+        outline = copy.deepcopy(ctx.stage_list)
+        requests_before = mca.requests_sent
+        started = time.perf_counter()
+        mca.enrich_course_outline(outline)
+        elapsed = time.perf_counter() - started
+        return {"seconds": elapsed, "throughput": ctx.catalog.course_count / elapsed,
+                "requests": mca.requests_sent - requests_before}
+    return run
+
+
+def bench_render_markdown(ctx: BenchContext) -> Callable[[int], Dict[str, float]]:
+    """generate_markdown_from_enriched_json：读取丰富结果并生成Markdown"""
+    mca = ctx.new_request()
+    output_file = os.path.join(ctx.work_dir, "bench_outline.md")
+
+    def run(loops=1):
+        started = time.perf_counter()
+        for _ in range(loops):
+            mca.generate_markdown_from_enriched_json(ctx.enriched_file, output_file)
+        elapsed = time.perf_counter() - started
+        return {"seconds": elapsed / loops, "throughput": ctx.catalog.course_count * loops / elapsed}
+    return run
+
+
+def bench_extract_structure(ctx: BenchContext) -> Callable[[int], Dict[str, float]]:
+    """extract_course_structure：把树形大纲展开为扁平目录"""
+    mca = ctx.new_request()
+    tree = ctx.catalog.outline_tree()
+
+    def run(loops=1):
+        started = time.perf_counter()
+        for _ in range(loops):
+            items = mca.extract_course_structure(tree)
+        elapsed = time.perf_counter() - started
+        return {"seconds": elapsed / loops, "throughput": len(items) * loops / elapsed}
+    return run
+
+
+def _json_benchmarks(compact: bool):
+    """丰富结果的保存和读取：indent=2（纯Python编码器）或紧凑格式（C编码器分块写入）"""
+
+    def bench_dump(ctx: BenchContext) -> Callable[[int], Dict[str, float]]:
+        payload = load_json_file(ctx.enriched_file)
+        output_file = os.path.join(ctx.work_dir, "bench_dump.json")
+
+        def run(loops=1):
+            started = time.perf_counter()
+            for _ in range(loops):
+                write_json_file(payload, output_file, compact=compact)
+            elapsed = time.perf_counter() - started
+            return {"seconds": elapsed / loops, "throughput": ctx.catalog.course_count * loops / elapsed}
+        return run
+
+    def bench_load(ctx: BenchContext) -> Callable[[int], Dict[str, float]]:
+        input_file = os.path.join(ctx.work_dir, "bench_load_compact.json" if compact else "bench_load.json")
+        write_json_file(load_json_file(ctx.enriched_file), input_file, compact=compact)
+
+        def run(loops=1):
+            started = time.perf_counter()
+            for _ in range(loops):
+                load_json_file(input_file)
+            elapsed = time.perf_counter() - started
+            return {"seconds": elapsed / loops, "throughput": ctx.catalog.course_count * loops / elapsed}
+        return run
+
+    return bench_dump, bench_load
+
+
+bench_dump_json, bench_load_json = _json_benchmarks(compact=False)
+bench_dump_json_compact, bench_load_json_compact = _json_benchmarks(compact=True)
+
+
+# 基准名称与构造函数
+BENCHMARKS = {
+    "enrich": bench_enrich,
+    "render_markdown": bench_render_markdown,
+    "extract_structure": bench_extract_structure,
+    "dump_json": bench_dump_json,
+    "dump_json_compact": bench_dump_json_compact,
+    "load_json": bench_load_json,
+    "load_json_compact": bench_load_json_compact,
+}
+
+
+def run_benchmark(run: Callable[[int], Dict[str, float]], repeat: int) -> Dict[str, Any]:
+    """预热并确定每次测量的循环次数，测量repeat次，再在tracemalloc下单独运行一次记录内存峰值（不计入耗时）
+
+    耗时和吞吐量按单次运行计算。
+    """
+    warmup = run(1)["seconds"]
+    loops = max(1, math.ceil(MIN_SAMPLE_SECONDS / warmup)) if warmup > 0 else 1
+    samples = {}
+    for _ in range(repeat):
+        gc.collect()
+        for metric, value in run(loops).items():
+            samples.setdefault(metric, []).append(value)
+
+    gc.collect()
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    run(1)
+    peak = tracemalloc.get_traced_memory()[1] - base
+    if not was_tracing:
+        tracemalloc.stop()
+
+    result = {metric: summarize(values) for metric, values in samples.items()}
+    result["peak_memory"] = summarize([peak])
+    result["loops"] = loops
+    return result
+
+
+def load_results(path: str) -> Dict[str, Any]:
+    """读取结果文件，不存在时返回空结果"""
+    if not os.path.exists(path):
+        return {"format": RESULTS_FORMAT, "runs": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_results(results: Dict[str, Any], path: str):
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    atomic_write(path, json.dumps(results, ensure_ascii=False, indent=2).encode("utf-8"))
+
+
+def find_baseline(results: Dict[str, Any], run: Dict[str, Any],
+                  commit: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """选择基线：指定提交时使用该提交在本机的结果，否则使用本机最近一次其他提交的结果
+
+    只比较数据规模相同的结果。
+    """
+    key = f"{run['commit']}@{run['machine']}"
+    candidates = [r for k, r in results.get("runs", {}).items()
+                  if r["machine"] == run["machine"] and r["config"].get("scale") == run["config"].get("scale")]
+    if commit:
+        matches = [r for r in candidates if r["commit"] in (commit, f"{commit}-dirty")]
+        return max(matches, key=lambda r: r["timestamp"]) if matches else None
+    candidates = [r for r in candidates if f"{r['commit']}@{r['machine']}" != key]
+    return max(candidates, key=lambda r: r["timestamp"]) if candidates else None
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any],
+            threshold: float = DEFAULT_THRESHOLD) -> List[Dict[str, Any]]:
+    """逐项比较两次运行的基准指标
+
+    变化超过相对阈值、超过NOISE_FACTOR倍的测量离散程度并且超过最小可判定差值时，
+    才判定为退化或改善，否则为持平。
+
+    Returns:
+        list: 每个基准指标一行，status为regression、improvement或same
+    """
+    rows = []
+    for name, metrics in current["benchmarks"].items():
+        base_metrics = baseline["benchmarks"].get(name)
+        if not base_metrics:
+            continue
+        for metric, spec in METRICS.items():
+            if metric not in metrics or metric not in base_metrics:
+                continue
+            base, cur = base_metrics[metric], metrics[metric]
+            # worse > 0 表示变差
+            worse = cur["median"] - base["median"]
+            if spec["better"] == "higher":
+                worse = -worse
+            limit = spec["threshold"] if spec["threshold"] is not None else threshold
+            noise = NOISE_FACTOR * max(base["mad"], cur["mad"])
+            significant = (abs(worse) > abs(base["median"]) * limit and abs(worse) > noise
+                           and abs(worse) > spec["min_delta"])
+            status = "same"
+            if significant:
+                status = "regression" if worse > 0 else "improvement"
+            rows.append({
+                "benchmark": name,
+                "metric": metric,
+                "baseline": base["median"],
+                "current": cur["median"],
+                "change": (cur["median"] - base["median"]) / base["median"] if base["median"] else 0.0,
+                "noise": noise,
+                "status": status,
+            })
+    return rows
+
+
+def _format_value(metric: str, value: float) -> str:
+    if metric == "seconds":
+        return f"{value:.4f}"
+    if metric == "peak_memory":
+        return f"{value / 1024:.0f}K"
+    if metric == "requests":
+        return f"{value:.0f}"
+    return f"{value:.1f}"
+
+
+def format_diff(rows: List[Dict[str, Any]], baseline: Dict[str, Any], current: Dict[str, Any]) -> str:
+    """生成基线与本次结果的对比表"""
+    status_text = {"regression": "退化", "improvement": "改善", "same": "持平"}
+    lines = [f"基线 {baseline['commit']} ({baseline['timestamp']}) -> 本次 {current['commit']} ({current['timestamp']})",
+             f"{'基准':<20} {'指标':<14} {'基线':>12} {'本次':>12} {'变化':>9} {'噪声':>10} {'结果':>4}"]
+    for row in rows:
+        metric = row["metric"]
+        lines.append(f"{row['benchmark']:<20} {METRICS[metric]['label']:<14} "
+                     f"{_format_value(metric, row['baseline']):>12} {_format_value(metric, row['current']):>12} "
+                     f"{row['change']:>+9.1%} {_format_value(metric, row['noise']):>10} "
+                     f"{status_text[row['status']]:>4}")
+    return "\n".join(lines)
+
+
+def run_suite(cases: List[str], repeat: int = 5, scale: int = 1, workers: int = 4) -> Dict[str, Any]:
+    """运行选定的基准，返回带提交和机器标识的结果"""
+    benchmarks = {}
+    with BenchContext(scale=scale, workers=workers) as ctx:
+        for name in cases:
+            print(f"运行基准: {name}...")
+            benchmarks[name] = run_benchmark(BENCHMARKS[name](ctx), repeat)
+            result = benchmarks[name]
+            print(f"  耗时 {result['seconds']['median']:.4f}s，吞吐量 {result['throughput']['median']:.1f}/s，"
+                  f"内存峰值 {result['peak_memory']['median'] / 1024:.0f}K")
+    return {
+        "commit": git_commit(),
+        "machine": machine_id(),
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "config": {"scale": scale, "repeat": repeat, "workers": workers,
+                   "courses": SyntheticCatalog(stages=5, courses_per_stage=20 * scale).course_count},
+        "benchmarks": benchmarks,
+    }
+
+
+def main(argv: List[str]) -> int:
+    cases = [c.strip() for c in pop_option(argv, "--cases", ",".join(BENCHMARKS)).split(",") if c.strip()]
+    unknown = [c for c in cases if c not in BENCHMARKS]
+    if unknown:
+        print(f"错误: 未知的基准 {', '.join(unknown)}，可选: {', '.join(BENCHMARKS)}")
+        return 2
+    repeat = int(pop_option(argv, "--repeat", "5"))
+    scale = int(pop_option(argv, "--scale", "1"))
+    workers = int(pop_option(argv, "--workers", "4"))
+    baseline_commit = pop_option(argv, "--baseline")
+    threshold = float(pop_option(argv, "--threshold", str(DEFAULT_THRESHOLD)))
+    results_file = pop_option(argv, "--results", DEFAULT_RESULTS_FILE)
+    save = "--no-save" not in argv
+
+    current = run_suite(cases, repeat=repeat, scale=scale, workers=workers)
+    results = load_results(results_file)
+    baseline = find_baseline(results, current, baseline_commit)
+    if save:
+        results.setdefault("runs", {})[f"{current['commit']}@{current['machine']}"] = current
+        save_results(results, results_file)
+        print(f"基准结果已保存到: {results_file}（{current['commit']}@{current['machine']}）")
+
+    if baseline is None:
+        target = f"提交 {baseline_commit}" if baseline_commit else "本机其他提交"
+        print(f"没有找到{target}的基线结果，跳过比较")
+        return 0
+
+    rows = compare(baseline, current, threshold)
+    print("\n" + format_diff(rows, baseline, current))
+    regressions = [r for r in rows if r["status"] == "regression"]
+    if regressions:
+        names = sorted({r["benchmark"] for r in regressions})
+        print(f"\n性能退化: {', '.join(names)}（阈值 {threshold:.0%}，噪声倍数 {NOISE_FACTOR:g}）")
+        return 1
+    print("\n没有发现性能退化")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
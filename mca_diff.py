@@ -0,0 +1,401 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""快照比较：按 阶段 → 课程 → 章节 → 小节 的结构比较两个丰富结果，生成Markdown或JSON变更记录
+
+节点在同一父节点下按ID配对，子树哈希（来自大纲索引）相同的节点直接跳过，不再比较其下的任何内容。
+名称、时长和数量直接从索引的列中比较；索引缓存在丰富结果旁边的 <name>.index.json 中，
+只有节点的其他字段有变化时才读取原始数据，因此耗时主要取决于变化的多少，而不是快照的大小。
+
+用法：
+    python mca_diff.py [旧快照] [新快照] [--output changelog.md] [--json changelog.json] [--ignore studyCount]
+
+不指定快照时比较 data/snapshots 中最近的两个快照清单。
+"""
+
+import os
+import re
+import sys
+import time
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Callable
+
+from mca_index import (OutlineIndex, KINDS, CHILD_KEYS, SUMMARY_KEYS, STAT_KEYS, load_or_build_index,
+                       load_outline_data)
+from mca_render import format_duration
+from mca_storage import DESCRIPTION_FIELDS, atomic_write, write_json_file
+
+# 变更记录的格式标识
+CHANGELOG_FORMAT = "mca-changelog"
+CHANGELOG_VERSION = 1
+
+# 默认忽略的字段：学习人数等统计数据每天都会变化，不作为大纲的变更（也不计入索引中的哈希）
+IGNORED_FIELDS = tuple(sorted(STAT_KEYS))
+
+# 报告时长变化的节点类型，章节和阶段的时长变化由课程和小节体现
+DURATION_KINDS = ("course", "section")
+
+KIND_NAMES = {"root": "大纲", "stage": "阶段", "course": "课程", "chapter": "章节", "section": "小节"}
+
+# 快照清单的文件名：<名称>_<日期>_<时间>.json
+SNAPSHOT_PATTERN = re.compile(r"^(?P<name>.+)_\d{8}_\d{6}\.json$")
+
+
+class OutlineDiff:
+    """两个大纲索引之间的结构比较
+
+    Args:
+        old: 旧大纲的索引
+        new: 新大纲的索引
+        old_loader: 返回旧大纲原始数据的函数，索引没有关联原始数据时，在需要比较节点字段时才调用
+        new_loader: 同上，用于新大纲
+        ignore_fields: 比较节点字段时忽略的字段名
+
+    Attributes:
+        changes: 变更记录列表，按大纲顺序排列
+        compared: 配对比较的节点数
+        skipped: 子树哈希相同而跳过的节点数
+    """
+
+    def __init__(self, old: OutlineIndex, new: OutlineIndex, old_loader: Optional[Callable[[], Any]] = None,
+                 new_loader: Optional[Callable[[], Any]] = None, ignore_fields=IGNORED_FIELDS):
+        if old.root_kind != new.root_kind:
+            raise ValueError("两个大纲的格式不同（嵌套格式与简单列表格式），无法比较")
+        self.old = old
+        self.new = new
+        self._loaders = {id(old): old_loader, id(new): new_loader}
+        self.ignore_fields = frozenset(ignore_fields or ())
+        self.changes = []
+        self.compared = 0
+        self.skipped = 0
+        self._added = []
+        self._removed = []
+
+    def compute(self) -> List[Dict[str, Any]]:
+        """比较两个大纲，返回变更记录"""
+        self.changes = []
+        self.compared = 0
+        self.skipped = 0
+        self._added = []
+        self._removed = []
+        if self.old.hashes[0] != self.new.hashes[0]:
+            self._diff_children(0, 0)
+        self._detect_moves()
+        return self.changes
+
+    @staticmethod
+    def _key(index: OutlineIndex, pos: int) -> str:
+        node_id = index.ids[pos]
+        return node_id if node_id is not None else "#" + index.names[pos]
+
+    @staticmethod
+    def _path(index: OutlineIndex, pos: int) -> List[str]:
+        """从最外层到父节点的名称"""
+        path = []
+        pos = index.parents[pos]
+        while pos > 0:
+            path.append(index.names[pos])
+            pos = index.parents[pos]
+        path.reverse()
+        return path
+
+    def _record(self, change: str, index: OutlineIndex, pos: int, **extra) -> Dict[str, Any]:
+        record = {
+            "change": change,
+            "kind": KINDS[index.kinds[pos]],
+            "id": index.ids[pos],
+            "name": index.names[pos],
+            "path": self._path(index, pos),
+        }
+        record.update(extra)
+        self.changes.append(record)
+        return record
+
+    def _diff_children(self, old_pos: int, new_pos: int):
+        """在同一父节点下按ID配对子节点，只深入子树哈希不同的配对"""
+        old, new = self.old, self.new
+        old_children = {}
+        duplicates = []
+        for child in old.child_positions(old_pos):
+            key = self._key(old, child)
+            if key in old_children:
+                duplicates.append(child)
+            else:
+                old_children[key] = child
+        matched = []
+        for child in new.child_positions(new_pos):
+            match = old_children.pop(self._key(new, child), None)
+            if match is None:
+                self._added.append((child, self._record("added", new, child, **self._summary(new, child))))
+            else:
+                matched.append((match, child))
+        for child in list(old_children.values()) + duplicates:
+            self._removed.append((child, self._record("removed", old, child, **self._summary(old, child))))
+
+        old_order = [match for match, _ in matched]
+        if any(a > b for a, b in zip(old_order, old_order[1:])):
+            self._record("reordered", new, new_pos)
+        for match, child in matched:
+            self.compared += 1
+            if old.hashes[match] == new.hashes[child]:
+                self.skipped += 1
+                continue
+            self._diff_node(match, child)
+
+    def _diff_node(self, old_pos: int, new_pos: int):
+        """比较一对ID相同、子树哈希不同的节点"""
+        old, new = self.old, self.new
+        if old.names[old_pos] != new.names[new_pos]:
+            self._record("renamed", new, new_pos, oldName=old.names[old_pos])
+        if old.own_hashes[old_pos] != new.own_hashes[new_pos]:
+            fields = self._changed_fields(old_pos, new_pos)
+            if fields is None or fields:
+                self._record("modified", new, new_pos, fields=fields)
+        kind = KINDS[new.kinds[new_pos]]
+        if kind in DURATION_KINDS and old.durations[old_pos] != new.durations[new_pos]:
+            self._record("duration", new, new_pos, old=old.durations[old_pos], new=new.durations[new_pos])
+        if CHILD_KEYS[kind]:
+            self._diff_children(old_pos, new_pos)
+
+    def _summary(self, index: OutlineIndex, pos: int) -> Dict[str, int]:
+        """新增或移除节点的子树汇总（来自索引，常数时间）"""
+        return {"duration": index.durations[pos], "sectionCount": index.section_counts[pos]}
+
+    def _data(self, index: OutlineIndex, pos: int) -> Optional[Dict[str, Any]]:
+        if not index.attached:
+            loader = self._loaders.get(id(index))
+            if loader is None:
+                return None
+            index.attach(loader())
+        return index.resolve(pos)
+
+    def _changed_fields(self, old_pos: int, new_pos: int) -> Optional[List[Dict[str, Any]]]:
+        """节点自身字段的变化（不含名称、时长、数量、子节点列表和忽略的字段），没有原始数据时返回None"""
+        old_node = self._data(self.old, old_pos)
+        new_node = self._data(self.new, new_pos)
+        if old_node is None or new_node is None:
+            return None
+        kind = KINDS[self.new.kinds[new_pos]]
+        skip = self.ignore_fields | SUMMARY_KEYS | {CHILD_KEYS[kind]}
+        fields = []
+        for key in list(old_node) + [key for key in new_node if key not in old_node]:
+            if key in skip:
+                continue
+            old_value, new_value = old_node.get(key), new_node.get(key)
+            if old_value == new_value:
+                continue
+            if key in DESCRIPTION_FIELDS:
+                # 描述内容较长，只记录发生了变化
+                fields.append({"field": key})
+            else:
+                fields.append({"field": key, "old": old_value, "new": new_value})
+        return fields
+
+    def _detect_moves(self):
+        """同一ID的节点在一处移除、另一处新增时，合并为一条移动记录"""
+        if not self._added or not self._removed:
+            return
+        removed = {}
+        for pos, record in self._removed:
+            if record["id"] is not None:
+                removed.setdefault((record["kind"], record["id"]), (pos, record))
+        merged = set()
+        for pos, record in self._added:
+            match = removed.pop((record["kind"], record["id"]), None) if record["id"] is not None else None
+            if match is None:
+                continue
+            old_pos, old_record = match
+            modified = self.old.hashes[old_pos] != self.new.hashes[pos]
+            merged.add(id(old_record))
+            record.clear()
+            record.update({
+                "change": "moved",
+                "kind": old_record["kind"],
+                "id": old_record["id"],
+                "name": self.new.names[pos],
+                "path": self._path(self.new, pos),
+                "oldPath": old_record["path"],
+                "modified": modified,
+            })
+            if modified:
+                self._diff_node(old_pos, pos)
+        if merged:
+            self.changes = [record for record in self.changes if id(record) not in merged]
+
+    def summary(self) -> Dict[str, int]:
+        """按 变更类型.节点类型 统计的变更数"""
+        counts = {}
+        for record in self.changes:
+            key = f"{record['change']}.{record['kind']}"
+            counts[key] = counts.get(key, 0) + 1
+        return counts
+
+    def to_dict(self, old_label: Optional[str] = None, new_label: Optional[str] = None) -> Dict[str, Any]:
+        """JSON格式的变更记录"""
+        return {
+            "format": CHANGELOG_FORMAT,
+            "version": CHANGELOG_VERSION,
+            "old": old_label,
+            "new": new_label,
+            "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "summary": self.summary(),
+            "changes": self.changes,
+        }
+
+
+def _group(record: Dict[str, Any]) -> List[str]:
+    """Markdown中记录所属的分组：章节和小节的变化归到所在课程下，课程的增删移动归到所在阶段下"""
+    kind, change, path = record["kind"], record["change"], record["path"]
+    if kind == "section":
+        return path[:-1]
+    if kind == "chapter":
+        return path
+    if kind == "course":
+        return path if change in ("added", "removed", "moved") else path + [record["name"]]
+    if kind == "stage":
+        return [] if change in ("added", "removed") else [record["name"]]
+    return []
+
+
+def _format_value(value: Any) -> str:
+    text = "空" if value in (None, "") else str(value)
+    return text if len(text) <= 60 else text[:57] + "..."
+
+
+def _format_line(record: Dict[str, Any], group: List[str]) -> str:
+    kind_name = KIND_NAMES[record["kind"]]
+    change = record["change"]
+    relative = " / ".join(record["path"][len(group):] + [record["name"]])
+    if change == "added":
+        detail = format_duration(record["duration"])
+        if record["kind"] != "section":
+            detail = f"{record['sectionCount']}个小节，{detail}"
+        return f"新增{kind_name}「{relative}」（{detail}）"
+    if change == "removed":
+        return f"移除{kind_name}「{relative}」"
+    if change == "moved":
+        text = f"移动{kind_name}「{record['name']}」：从「{' / '.join(record['oldPath'])}」到「{' / '.join(record['path'])}」"
+        return text + "，内容有变化" if record["modified"] else text
+    if change == "renamed":
+        old_relative = " / ".join(record["path"][len(group):] + [record["oldName"]])
+        return f"{kind_name}重命名：「{old_relative}」→「{record['name']}」"
+    subject = f"{kind_name}「{relative}」" if relative and group[-1:] != [record["name"]] else kind_name
+    if change == "modified":
+        if record["fields"] is None:
+            return f"{subject}内容有变化"
+        parts = [f"{field['field']} 已更新" if "old" not in field
+                 else f"{field['field']}: {_format_value(field['old'])} → {_format_value(field['new'])}"
+                 for field in record["fields"]]
+        return f"{subject}字段变化：" + "；".join(parts)
+    if change == "duration":
+        return f"{subject}时长：{format_duration(record['old'])} → {format_duration(record['new'])}"
+    if change == "reordered":
+        child_kind = KINDS[KINDS.index(record["kind"]) + 1]
+        return f"{subject if record['kind'] != 'root' else '大纲'}中的{KIND_NAMES[child_kind]}顺序调整"
+    return f"{subject}: {change}"
+
+
+def format_markdown(changelog: Dict[str, Any]) -> str:
+    """把变更记录（to_dict的结果）格式化为Markdown，按课程分组"""
+    change_names = {"added": "新增", "removed": "移除", "moved": "移动", "renamed": "重命名",
+                    "modified": "字段变化", "duration": "时长变化", "reordered": "顺序调整"}
+    lines = ["# 课程大纲变更", ""]
+    if changelog.get("old") or changelog.get("new"):
+        lines.append(f"- 旧快照: {changelog.get('old') or '未知'}")
+        lines.append(f"- 新快照: {changelog.get('new') or '未知'}")
+    changes = changelog.get("changes") or []
+    if not changes:
+        lines.extend(["", "没有变化"])
+        return "\n".join(lines) + "\n"
+    summary = []
+    for key, count in changelog.get("summary", {}).items():
+        change, kind = key.split(".", 1)
+        summary.append(f"{KIND_NAMES.get(kind, kind)}{change_names.get(change, change)} {count}")
+    lines.append(f"- 变更: {'，'.join(summary)}")
+
+    groups = {}
+    for record in changes:
+        group = _group(record)
+        groups.setdefault(tuple(group), []).append(_format_line(record, group))
+    for group, group_lines in groups.items():
+        lines.extend(["", f"## {' / '.join(group) if group else '整体'}", ""])
+        lines.extend(f"- {line}" for line in group_lines)
+    return "\n".join(lines) + "\n"
+
+
+def diff_files(old_path: str, new_path: str, ignore_fields=IGNORED_FIELDS) -> OutlineDiff:
+    """比较两个丰富结果或快照清单文件
+
+    索引不存在或已过期时会建立并保存到文件旁边；原始数据只在需要比较节点字段时才读取。
+    """
+    old_index = load_or_build_index(old_path)
+    new_index = load_or_build_index(new_path)
+    diff = OutlineDiff(old_index, new_index, old_loader=lambda: load_outline_data(old_path),
+                       new_loader=lambda: load_outline_data(new_path), ignore_fields=ignore_fields)
+    diff.compute()
+    return diff
+
+
+def latest_snapshots(snapshot_dir: str = os.path.join("data", "snapshots"), count: int = 2) -> List[str]:
+    """快照目录中最近的count个同名快照清单（按文件名中的时间排序，从旧到新）"""
+    if not os.path.isdir(snapshot_dir):
+        return []
+    groups = {}
+    for file_name in os.listdir(snapshot_dir):
+        match = SNAPSHOT_PATTERN.match(file_name)
+        if match and not file_name.endswith(".index.json"):
+            groups.setdefault(match.group("name"), []).append(file_name)
+    if not groups:
+        return []
+    # 选择最近写入过的那一组快照
+    names = max(groups.values(), key=lambda files: max(os.path.getmtime(os.path.join(snapshot_dir, f)) for f in files))
+    return [os.path.join(snapshot_dir, f) for f in sorted(names)[-count:]]
+
+
+def main(argv: List[str]) -> int:
+    from mca_request import pop_option
+    output_file = pop_option(argv, "--output")
+    json_file = pop_option(argv, "--json")
+    ignore = pop_option(argv, "--ignore")
+    ignore_fields = [name.strip() for name in ignore.split(",") if name.strip()] if ignore is not None else IGNORED_FIELDS
+
+    if len(argv) >= 2:
+        old_path, new_path = argv[0], argv[1]
+    else:
+        snapshots = latest_snapshots()
+        if len(snapshots) < 2:
+            print("错误: 请指定要比较的两个文件，或者在 data/snapshots 中保存至少两个快照")
+            return 2
+        old_path, new_path = snapshots
+    for path in (old_path, new_path):
+        if not os.path.exists(path):
+            print(f"错误: 文件不存在 {path}")
+            return 2
+
+    started = time.perf_counter()
+    try:
+        diff = diff_files(old_path, new_path, ignore_fields)
+    except ValueError as e:
+        print(f"错误: {e}")
+        return 2
+    elapsed = time.perf_counter() - started
+    changelog = diff.to_dict(os.path.basename(old_path), os.path.basename(new_path))
+    markdown = format_markdown(changelog)
+
+    if json_file:
+        write_json_file(changelog, json_file)
+        print(f"JSON变更记录已保存到: {json_file}")
+    if output_file:
+        directory = os.path.dirname(output_file)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        atomic_write(output_file, markdown.encode("utf-8"))
+        print(f"Markdown变更记录已保存到: {output_file}")
+    if not output_file and not json_file:
+        print(markdown)
+    print(f"共 {len(diff.changes)} 项变更，比较了 {diff.compared} 个节点，"
+          f"跳过 {diff.skipped} 个相同的子树，用时 {elapsed:.3f} 秒")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
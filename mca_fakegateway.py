@@ -0,0 +1,361 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""本地模拟网关：实现MCARequest用到的接口，返回按规模生成的合成数据
+
+支持按接口配置延迟分布、注入错误（HTTP 500）和限流（HTTP 429），以及限制并发请求数，
+用于在不访问生产网关的情况下压测抓取设置。
+
+单独运行：
+    python mca_fakegateway.py [port] [--latency lognormal:0.05,0.5] [--error-rate 0.01] [--throttle-rate 0.01]
+"""
+
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, List, Optional
+from urllib.parse import urlsplit, parse_qs
+
+
+class LatencyModel:
+    """延迟分布（秒）
+
+    规格字符串：
+        fixed:S              固定S秒
+        uniform:A,B          A到B秒均匀分布
+        exp:MEAN             均值为MEAN的指数分布
+        lognormal:MEDIAN,SIGMA  中位数为MEDIAN的对数正态分布，SIGMA越大长尾越重
+    """
+
+    def __init__(self, spec: str = "fixed:0"):
+        self.spec = spec
+        kind, _, args = spec.partition(":")
+        values = [float(v) for v in args.split(",") if v.strip()] if args else []
+        if kind == "fixed":
+            self._sample = lambda rng: values[0] if values else 0.0
+        elif kind == "uniform":
+            self._sample = lambda rng: rng.uniform(values[0], values[1])
+        elif kind == "exp":
+            self._sample = lambda rng: rng.expovariate(1.0 / values[0]) if values[0] > 0 else 0.0
+        elif kind == "lognormal":
+            mu = math.log(values[0])
+            self._sample = lambda rng: rng.lognormvariate(mu, values[1])
+        else:
+            raise ValueError(f"未知的延迟分布: {spec}")
+
+    def sample(self, rng: random.Random) -> float:
+        return max(0.0, self._sample(rng))
+
+
+class SyntheticCatalog:
+    """按规模参数确定性地生成课程包、阶段、课程、版本和章节数据
+
+    Args:
+        packages: 课程包数量
+        stages: 每个课程包版本的阶段数
+        courses_per_stage: 每个阶段的课程数
+        chapters: 每个课程的章节数
+        sections: 每个章节的小节数
+        versions: 每个课程的版本数
+        desc_size: 版本描述（pcDetailDesc）的字符数
+    """
+
+    def __init__(self, packages: int = 50, stages: int = 5, courses_per_stage: int = 20, chapters: int = 10,
+                 sections: int = 8, versions: int = 2, desc_size: int = 2000):
+        self.packages = packages
+        self.stages = stages
+        self.courses_per_stage = courses_per_stage
+        self.chapters = chapters
+        self.sections = sections
+        self.versions = versions
+        self.desc_size = desc_size
+
+    @property
+    def course_count(self) -> int:
+        return self.stages * self.courses_per_stage
+
+    def package_page(self, page_index: int, page_size: int) -> Dict[str, Any]:
+        start = (page_index - 1) * page_size
+        content = [{
+            "id": i,
+            "title": f"课程包{i}",
+            "description": f"第{i}个合成课程包",
+            "price": 100 + i,
+            "courseCount": self.course_count,
+        } for i in range(start + 1, min(start + page_size, self.packages) + 1)]
+        return {"totalElements": self.packages, "content": content}
+
+    def package_versions(self, package_id: int) -> List[Dict[str, Any]]:
+        return [{"id": package_id * 100 + 1, "coursePackageId": package_id, "name": "默认版本", "enabled": 1}]
+
+    def stage_list(self) -> List[Dict[str, Any]]:
+        stages = []
+        for s in range(1, self.stages + 1):
+            courses = []
+            for c in range(1, self.courses_per_stage + 1):
+                course_id = s * 10000 + c
+                courses.append({
+                    "id": course_id,
+                    "courseName": f"阶段{s}课程{c}",
+                    "durationTotal": self.chapters * self.sections * 600,
+                    "sectionCount": self.chapters * self.sections,
+                })
+            stages.append({"id": s, "title": f"第{s}阶段", "description": "", "courseList": courses})
+        return stages
+
+    def outline_tree(self) -> List[Dict[str, Any]]:
+        """树形大纲（children嵌套，小节为带视频资源的Video项），与extract_course_structure的输入格式一致"""
+        tree = []
+        for s in range(1, self.stages + 1):
+            courses = []
+            for c in range(1, self.courses_per_stage + 1):
+                course_id = s * 10000 + c
+                chapters = []
+                for h in range(1, self.chapters + 1):
+                    chapter_id = course_id * 100 + h
+                    videos = [{
+                        "id": chapter_id * 100 + k,
+                        "title": f"第{h}章第{k}节",
+                        "itemType": "Video",
+                        "duration": 600,
+                        "resources": [{"resourceType": "video", "url": f"https://video.example.com/{chapter_id * 100 + k}.m3u8"}],
+                    } for k in range(1, self.sections + 1)]
+                    chapters.append({"id": chapter_id, "title": f"第{h}章", "itemType": "Chapter", "children": videos})
+                courses.append({"id": course_id, "title": f"阶段{s}课程{c}", "itemType": "Course", "children": chapters})
+            tree.append({"id": s, "title": f"第{s}阶段", "itemType": "Stage", "children": courses})
+        return tree
+
+    def course_versions(self, course_id: int) -> List[Dict[str, Any]]:
+        desc = ("<p>" + "课程介绍" * (self.desc_size // 4 + 1))[:self.desc_size] + "</p>"
+        return [{
+            "id": course_id * 10 + v,
+            "courseId": course_id,
+            "name": f"v{v}",
+            "pcDetailDesc": desc,
+            "appDetailDesc": desc[: self.desc_size // 2],
+        } for v in range(1, self.versions + 1)]
+
+    def course_detail(self, course_id: int, version_id: int) -> Dict[str, Any]:
+        chapters = []
+        for h in range(1, self.chapters + 1):
+            sections = [{
+                "id": (course_id * 100 + h) * 100 + k,
+                "sectionName": f"第{h}章第{k}节" + ("（更新）" if version_id % 10 > 1 and h == 1 else ""),
+                "durationTime": 600,
+            } for k in range(1, self.sections + 1)]
+            chapters.append({
+                "id": course_id * 100 + h,
+                "chapterName": f"第{h}章",
+                "chapterCount": self.sections,
+                "chapterDurationTimeCount": self.sections * 600,
+                "sectionList": sections,
+            })
+        return {
+            "durationSum": self.chapters * self.sections * 600,
+            "level": 1,
+            "price": 0,
+            "studyCount": course_id % 1000,
+            "chapterList": chapters,
+        }
+
+
+# 接口模板名称与路径的对应关系，与MCARequest中的接口名称一致
+ROUTES = [
+    ("coursePackage/homePage", re.compile(r"^/edu-course/coursePackage/homePage$")),
+    ("coursePackageVersion", re.compile(r"^/edu-course/pc/coursePackageVersion$")),
+    ("systemCourse/child", re.compile(r"^/edu-course/systemCourse/child/(\d+)$")),
+    ("courseversion/allVersionList", re.compile(r"^/edu-course/course/courseversion/allVersionList$")),
+    ("courseWeb/{id}/pc", re.compile(r"^/edu-course/courseWeb/(\d+)/pc$")),
+    ("course/outline/get", re.compile(r"^/api/course/outline/get$")),
+]
+
+
+class FakeGateway:
+    """在后台线程运行的模拟网关
+
+    Args:
+        catalog: 合成数据
+        latency: 默认延迟分布规格
+        endpoint_latency: 按接口模板覆盖延迟分布
+        error_rate: 返回HTTP 500的概率
+        throttle_rate: 返回HTTP 429的概率
+        max_inflight: 同时处理的请求上限，超过时返回429，None表示不限制
+        seed: 随机数种子
+    """
+
+    def __init__(self, catalog: Optional[SyntheticCatalog] = None, latency: str = "fixed:0",
+                 endpoint_latency: Optional[Dict[str, str]] = None, error_rate: float = 0.0,
+                 throttle_rate: float = 0.0, max_inflight: Optional[int] = None, seed: int = 42,
+                 host: str = "127.0.0.1", port: int = 0):
+        self.catalog = catalog or SyntheticCatalog()
+        self.latency = LatencyModel(latency)
+        self.endpoint_latency = {k: LatencyModel(v) for k, v in (endpoint_latency or {}).items()}
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.max_inflight = max_inflight
+        self.counters = Counter()
+        self.inflight = 0
+        self.peak_inflight = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeGateway":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reset_counters(self):
+        with self._lock:
+            self.counters.clear()
+            self.peak_inflight = 0
+
+    def _decide(self, endpoint: str):
+        """决定本次请求的延迟和注入的错误"""
+        with self._lock:
+            model = self.endpoint_latency.get(endpoint, self.latency)
+            delay = model.sample(self._rng)
+            roll = self._rng.random()
+        if roll < self.error_rate:
+            return delay, 500
+        if roll < self.error_rate + self.throttle_rate:
+            return delay, 429
+        return delay, 200
+
+    def _respond(self, endpoint: str, match, query: Dict[str, List[str]]) -> Any:
+        catalog = self.catalog
+        if endpoint == "coursePackage/homePage":
+            page_size = int(query.get("length", ["999"])[0])
+            page_index = int(query.get("pageIndex", ["1"])[0])
+            return {"code": 200, "msg": "请求成功", "data": catalog.package_page(page_index, page_size)}
+        if endpoint == "coursePackageVersion":
+            return {"code": 200, "data": catalog.package_versions(int(query.get("coursePackageId", ["1"])[0]))}
+        if endpoint == "systemCourse/child":
+            return {"code": 200, "data": {"stageList": catalog.stage_list()}}
+        if endpoint == "courseversion/allVersionList":
+            return {"code": 200, "data": catalog.course_versions(int(query.get("courseId", ["0"])[0]))}
+        if endpoint == "courseWeb/{id}/pc":
+            return {"code": 200, "data": catalog.course_detail(int(match.group(1)),
+                                                                int(query.get("courseVersionId", ["0"])[0]))}
+        if endpoint == "course/outline/get":
+            return {"code": 0, "data": {"stageList": catalog.stage_list()}}
+        return None
+
+    def _make_handler(self):
+        gateway = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # 响应头和响应体分两次写出，关闭Nagle算法以免引入额外的确认延迟
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status: int, obj: Any, headers: Optional[Dict[str, str]] = None):
+                body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json;charset=UTF-8")
+                self.send_header("Content-Length", str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _handle(self):
+                if self.command == "POST":
+                    length = int(self.headers.get("Content-Length") or 0)
+                    if length:
+                        self.rfile.read(length)
+                parts = urlsplit(self.path)
+                for endpoint, pattern in ROUTES:
+                    match = pattern.match(parts.path)
+                    if match:
+                        break
+                else:
+                    self._send(404, {"code": 404, "message": "接口不存在"})
+                    return
+
+                with gateway._lock:
+                    gateway.inflight += 1
+                    gateway.peak_inflight = max(gateway.peak_inflight, gateway.inflight)
+                    overloaded = gateway.max_inflight is not None and gateway.inflight > gateway.max_inflight
+                try:
+                    delay, status = gateway._decide(endpoint)
+                    if overloaded:
+                        status = 429
+                    time.sleep(delay)
+                    with gateway._lock:
+                        gateway.counters[(endpoint, status)] += 1
+                    if status == 429:
+                        self._send(429, {"code": 429, "message": "请求过于频繁"}, {"Retry-After": "1"})
+                    elif status == 500:
+                        self._send(500, {"code": 500, "message": "服务器内部错误"})
+                    else:
+                        self._send(200, gateway._respond(endpoint, match, parse_qs(parts.query)))
+                finally:
+                    with gateway._lock:
+                        gateway.inflight -= 1
+
+            do_GET = _handle
+            do_POST = _handle
+
+        return Handler
+
+    def status_summary(self) -> Dict[str, Dict[str, int]]:
+        """各接口按状态码统计的请求数"""
+        with self._lock:
+            summary = {}
+            for (endpoint, status), count in self.counters.items():
+                summary.setdefault(endpoint, {})[str(status)] = count
+            return summary
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+
+    def option(name, default):
+        if name in args:
+            index = args.index(name)
+            value = args[index + 1]
+            del args[index:index + 2]
+            return value
+        return default
+
+    latency = option("--latency", "lognormal:0.05,0.5")
+    error_rate = float(option("--error-rate", "0"))
+    throttle_rate = float(option("--throttle-rate", "0"))
+    courses = int(option("--courses", "100"))
+    port = int(args[0]) if args else 8800
+
+    gateway = FakeGateway(SyntheticCatalog(stages=5, courses_per_stage=max(1, courses // 5)),
+                          latency=latency, error_rate=error_rate, throttle_rate=throttle_rate, port=port)
+    gateway.start()
+    print(f"模拟网关已启动: {gateway.base_url}（延迟 {latency}，错误率 {error_rate}，限流率 {throttle_rate}）")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        gateway.stop()
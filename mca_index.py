@@ -0,0 +1,474 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""大纲索引：一次遍历建立阶段、课程、章节、小节的ID索引、父节点、子树汇总和子树哈希
+
+节点按先序遍历顺序编号，以列存方式保存（每个属性一个列表），子树为连续区间 [i, end[i])。
+按ID查找节点、查询父节点和子树的时长/章节数/小节数都是常数时间。
+每个节点记录自身字段的哈希和整个子树的哈希，两个快照中子树哈希相同的节点内容相同（不计学习人数等统计字段）。
+索引可以保存到丰富结果旁边的 <name>.index.json，加载时只需解析几个平铺的列表。
+"""
+
+import hashlib
+import json
+import os
+from typing import Dict, Any, List, Optional, Iterator
+
+from mca_storage import COMPRESSION_SUFFIXES, atomic_write, load_json_file, canonical_json, hydrate_if_manifest
+
+INDEX_FORMAT = "mca-index"
+INDEX_VERSION = 3
+
+# 节点哈希的字节数，只用于比较两个快照，64位足够并且让索引文件保持较小
+NODE_HASH_SIZE = 8
+
+# 节点类型及各层子节点所在的字段
+KINDS = ("root", "stage", "course", "chapter", "section")
+CHILD_KEYS = {"root": None, "stage": "courseList", "course": "chapterList", "chapter": "sectionList", "section": None}
+
+# 各类节点自身记录的时长字段，没有子节点时作为子树时长
+DURATION_KEYS = {
+    "stage": (),
+    "course": ("durationSum", "durationTotal"),
+    "chapter": ("chapterDurationTimeCount",),
+    "section": ("durationTime",),
+}
+NAME_KEYS = {
+    "stage": ("title",),
+    "course": ("courseName",),
+    "chapter": ("chapterName",),
+    "section": ("sectionName",),
+}
+
+
+# 名称、时长和数量字段：已经分别记录在索引的列中，不计入节点自身字段的哈希（仍计入子树哈希）
+SUMMARY_KEYS = frozenset(
+    key for keys in list(NAME_KEYS.values()) + list(DURATION_KEYS.values()) for key in keys
+) | {"chapterCount", "sectionCount", "totalChapterCount", "totalSectionCount"}
+
+# 每天都会变化的统计字段，不计入任何哈希
+STAT_KEYS = frozenset({"studyCount"})
+
+
+def _first(obj: Dict[str, Any], keys) -> Any:
+    for key in keys:
+        value = obj.get(key)
+        if value is not None:
+            return value
+    return None
+
+
+def course_key(course: Dict[str, Any], simple_format: bool) -> Any:
+    """课程的ID，与丰富时使用的ID一致：简单列表格式使用courseNo，stageList中的课程使用id
+
+    ID映射、死信文件、索引、渲染和追踪都按这个ID关联同一个课程。
+    """
+    if simple_format:
+        return course.get("courseNo", course.get("id"))
+    return course.get("id")
+
+
+def _as_number(value) -> int:
+    try:
+        return int(value or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _node_hash(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=NODE_HASH_SIZE).hexdigest()
+
+
+def index_path_for(enriched_path: str) -> str:
+    """丰富结果对应的索引文件路径，如 course_outline_enriched.json.gz -> course_outline_enriched.index.json"""
+    for suffix in COMPRESSION_SUFFIXES.values():
+        if enriched_path.endswith(suffix):
+            enriched_path = enriched_path[:-len(suffix)]
+            break
+    base, _ = os.path.splitext(enriched_path)
+    return base + ".index.json"
+
+
+def load_outline_data(path: str) -> Any:
+    """读取丰富结果或快照清单，还原外置的描述内容和清单中的章节对象"""
+    return hydrate_if_manifest(load_json_file(path, resolve_blobs=True), path)
+
+
+def _file_signature(path: str) -> Optional[List[int]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def _outline_root(data: Any):
+    """从丰富后的JSON或大纲列表中取出顶层列表及其类型（stage或course）"""
+    if isinstance(data, dict) and "data" in data and ("code" in data or "msg" in data):
+        data = data["data"]
+    if isinstance(data, dict):
+        if "stageList" in data:
+            return data["stageList"], "stage"
+        if "courseItemList" in data:
+            return data["courseItemList"], "course"
+        return [], "stage"
+    if isinstance(data, list) and data and isinstance(data[0], dict) and "courseList" in data[0]:
+        return data, "stage"
+    return data or [], "course"
+
+
+class OutlineNode:
+    """索引中某个节点的只读视图"""
+
+    __slots__ = ("index", "pos")
+
+    def __init__(self, index: "OutlineIndex", pos: int):
+        self.index = index
+        self.pos = pos
+
+    def __repr__(self):
+        return f"OutlineNode({self.kind}, id={self.id!r}, name={self.name!r})"
+
+    def __eq__(self, other):
+        return isinstance(other, OutlineNode) and other.index is self.index and other.pos == self.pos
+
+    def __hash__(self):
+        return hash((id(self.index), self.pos))
+
+    @property
+    def kind(self) -> str:
+        return KINDS[self.index.kinds[self.pos]]
+
+    @property
+    def id(self) -> Optional[str]:
+        return self.index.ids[self.pos]
+
+    @property
+    def name(self) -> str:
+        return self.index.names[self.pos]
+
+    @property
+    def duration(self) -> int:
+        """子树总时长（秒）"""
+        return self.index.durations[self.pos]
+
+    @property
+    def section_count(self) -> int:
+        """子树中的小节数"""
+        return self.index.section_counts[self.pos]
+
+    @property
+    def chapter_count(self) -> int:
+        """子树中的章节数"""
+        return self.index.chapter_counts[self.pos]
+
+    @property
+    def course_count(self) -> int:
+        """子树中的课程数"""
+        return self.index.course_counts[self.pos]
+
+    @property
+    def hash(self) -> str:
+        """子树哈希，包含节点自身字段和全部子节点"""
+        return self.index.hashes[self.pos]
+
+    @property
+    def own_hash(self) -> str:
+        """节点自身字段（不含子节点列表、SUMMARY_KEYS和STAT_KEYS）的哈希"""
+        return self.index.own_hashes[self.pos]
+
+    @property
+    def parent(self) -> Optional["OutlineNode"]:
+        parent = self.index.parents[self.pos]
+        return OutlineNode(self.index, parent) if parent >= 0 else None
+
+    @property
+    def children(self) -> List["OutlineNode"]:
+        return [OutlineNode(self.index, pos) for pos in self.index.child_positions(self.pos)]
+
+    def ancestors(self) -> List["OutlineNode"]:
+        """从父节点到最外层节点（不含根）"""
+        result = []
+        node = self.parent
+        while node is not None and node.kind != "root":
+            result.append(node)
+            node = node.parent
+        return result
+
+    @property
+    def data(self) -> Optional[Dict[str, Any]]:
+        """节点对应的原始字典，需要索引关联了原始数据"""
+        return self.index.resolve(self.pos)
+
+    def aggregates(self) -> Dict[str, int]:
+        return {
+            "duration": self.duration,
+            "courseCount": self.course_count,
+            "chapterCount": self.chapter_count,
+            "sectionCount": self.section_count,
+        }
+
+
+class OutlineIndex:
+    """丰富后大纲的索引
+
+    Attributes:
+        kinds, ids, names, parents, ends, slots: 按先序编号的节点列（类型、ID、名称、父节点、子树结束位置、在兄弟中的位置）
+        durations, course_counts, chapter_counts, section_counts: 子树汇总
+        own_hashes, hashes: 节点自身字段的哈希和子树哈希
+    """
+
+    def __init__(self):
+        self.kinds = []
+        self.ids = []
+        self.names = []
+        self.parents = []
+        self.ends = []
+        self.slots = []
+        self.durations = []
+        self.course_counts = []
+        self.chapter_counts = []
+        self.section_counts = []
+        self.own_hashes = []
+        self.hashes = []
+        self.root_kind = "stage"
+        self.source = None
+        self._maps = {}
+        self._roots = None
+
+    def __len__(self):
+        return len(self.kinds) - 1
+
+    @classmethod
+    def build(cls, data: Any) -> "OutlineIndex":
+        """遍历一次大纲建立索引
+
+        Args:
+            data: 丰富后的JSON（{"msg", "code", "data"}）、stageList或简单课程列表
+        """
+        index = cls()
+        roots, root_kind = _outline_root(data)
+        index.root_kind = root_kind
+        index._roots = roots
+        index._append("root", None, "", -1, 0)
+        index._walk(roots, root_kind, 0)
+        index._finish(0)
+        index._finish_hash(0, "")
+        index._build_maps()
+        return index
+
+    def _append(self, kind: str, node_id, name: str, parent: int, slot: int, own_hash: str = "") -> int:
+        self.kinds.append(KINDS.index(kind))
+        self.ids.append(None if node_id is None else str(node_id))
+        self.names.append(name)
+        self.parents.append(parent)
+        self.ends.append(0)
+        self.slots.append(slot)
+        self.durations.append(0)
+        self.course_counts.append(1 if kind == "course" else 0)
+        self.chapter_counts.append(1 if kind == "chapter" else 0)
+        self.section_counts.append(1 if kind == "section" else 0)
+        self.own_hashes.append(own_hash)
+        self.hashes.append("")
+        return len(self.kinds) - 1
+
+    def _walk(self, items: List[Dict[str, Any]], kind: str, parent: int):
+        """先序遍历建立节点，返回时子树汇总已计算完毕"""
+        child_kind = KINDS[KINDS.index(kind) + 1] if kind != "section" else None
+        for slot, item in enumerate(items or []):
+            if not isinstance(item, dict):
+                continue
+            node_id = course_key(item, parent == 0) if kind == "course" else item.get("id")
+            name = _first(item, NAME_KEYS[kind])
+            name = name.strip() if isinstance(name, str) else str(name or "")
+            child_key = CHILD_KEYS[kind]
+            own = {}
+            summary = {}
+            for key, value in item.items():
+                if key == child_key or key in STAT_KEYS:
+                    continue
+                (summary if key in SUMMARY_KEYS else own)[key] = value
+            own_hash = _node_hash(canonical_json(own))
+            pos = self._append(kind, node_id, name, parent, slot, own_hash)
+            children = item.get(child_key) if child_kind else None
+            if children:
+                self._walk(children, child_kind, pos)
+            self._finish(pos, _as_number(_first(item, DURATION_KEYS[kind])))
+            self._finish_hash(pos, own_hash + _node_hash(canonical_json(summary)))
+            self._add_to_parent(pos, parent)
+
+    def _finish(self, pos: int, own_duration: int = 0):
+        self.ends[pos] = len(self.kinds)
+        # 有子节点时时长为子节点之和，否则使用节点自身记录的时长
+        if self.ends[pos] == pos + 1:
+            self.durations[pos] = own_duration
+
+    def _finish_hash(self, pos: int, head: str):
+        """子树哈希：节点全部字段的哈希加上按顺序排列的子节点子树哈希"""
+        parts = [head]
+        parts.extend(self.hashes[child] for child in self.child_positions(pos))
+        self.hashes[pos] = _node_hash(",".join(parts).encode("ascii"))
+
+    def _add_to_parent(self, pos: int, parent: int):
+        if parent < 0:
+            return
+        self.durations[parent] += self.durations[pos]
+        self.course_counts[parent] += self.course_counts[pos]
+        self.chapter_counts[parent] += self.chapter_counts[pos]
+        self.section_counts[parent] += self.section_counts[pos]
+
+    def _build_maps(self):
+        maps = {kind: {} for kind in KINDS[1:]}
+        for pos in range(1, len(self.kinds)):
+            node_id = self.ids[pos]
+            if node_id is not None:
+                maps[KINDS[self.kinds[pos]]].setdefault(node_id, pos)
+        self._maps = maps
+
+    def child_positions(self, pos: int) -> Iterator[int]:
+        """子节点编号，利用子树区间跳过孙节点"""
+        child = pos + 1
+        end = self.ends[pos]
+        while child < end:
+            yield child
+            child = self.ends[child]
+
+    @property
+    def root(self) -> OutlineNode:
+        return OutlineNode(self, 0)
+
+    def find(self, kind: str, node_id) -> Optional[OutlineNode]:
+        """按类型和ID查找节点"""
+        pos = self._maps.get(kind, {}).get(str(node_id))
+        return OutlineNode(self, pos) if pos is not None else None
+
+    def stage(self, node_id) -> Optional[OutlineNode]:
+        return self.find("stage", node_id)
+
+    def course(self, node_id) -> Optional[OutlineNode]:
+        return self.find("course", node_id)
+
+    def chapter(self, node_id) -> Optional[OutlineNode]:
+        return self.find("chapter", node_id)
+
+    def section(self, node_id) -> Optional[OutlineNode]:
+        return self.find("section", node_id)
+
+    def nodes(self, kind: str) -> Iterator[OutlineNode]:
+        """按大纲顺序遍历某一类节点"""
+        code = KINDS.index(kind)
+        for pos, node_kind in enumerate(self.kinds):
+            if node_kind == code:
+                yield OutlineNode(self, pos)
+
+    def aggregate(self, kind: str, node_id) -> Optional[Dict[str, int]]:
+        """查询节点子树的时长、课程数、章节数和小节数"""
+        node = self.find(kind, node_id)
+        return node.aggregates() if node else None
+
+    @property
+    def attached(self) -> bool:
+        """是否关联了原始数据"""
+        return self._roots is not None
+
+    def attach(self, data: Any) -> "OutlineIndex":
+        """关联原始数据，之后可以通过node.data取得原始字典"""
+        self._roots, _ = _outline_root(data)
+        return self
+
+    def resolve(self, pos: int) -> Optional[Dict[str, Any]]:
+        """沿父节点链定位节点对应的原始字典"""
+        if self._roots is None or pos <= 0:
+            return None
+        chain = []
+        while pos > 0:
+            chain.append(pos)
+            pos = self.parents[pos]
+        items = self._roots
+        node = None
+        for pos in reversed(chain):
+            node = items[self.slots[pos]]
+            key = CHILD_KEYS[KINDS[self.kinds[pos]]]
+            items = (node.get(key) or []) if key else []
+        return node
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "format": INDEX_FORMAT,
+            "version": INDEX_VERSION,
+            "source": self.source,
+            "rootKind": self.root_kind,
+            "kinds": self.kinds,
+            "ids": self.ids,
+            "names": self.names,
+            "parents": self.parents,
+            "ends": self.ends,
+            "slots": self.slots,
+            "durations": self.durations,
+            "courseCounts": self.course_counts,
+            "chapterCounts": self.chapter_counts,
+            "sectionCounts": self.section_counts,
+            "ownHashes": self.own_hashes,
+            "hashes": self.hashes,
+        }
+
+    def save(self, path: str, source_path: Optional[str] = None) -> str:
+        """保存索引，source_path为对应的丰富结果文件，用于判断索引是否过期"""
+        if source_path:
+            self.source = {"file": os.path.basename(source_path), "signature": _file_signature(source_path)}
+        atomic_write(path, json.dumps(self.to_dict(), ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+        return path
+
+    @classmethod
+    def load(cls, path: str) -> "OutlineIndex":
+        """从索引文件加载"""
+        with open(path, "rb") as f:
+            saved = json.loads(f.read().decode("utf-8"))
+        if saved.get("format") != INDEX_FORMAT:
+            raise ValueError(f"不是大纲索引文件: {path}")
+        if saved.get("version") != INDEX_VERSION:
+            raise ValueError(f"索引版本不一致: {path}")
+        index = cls()
+        index.source = saved.get("source")
+        index.root_kind = saved.get("rootKind", "stage")
+        index.kinds = saved["kinds"]
+        index.ids = saved["ids"]
+        index.names = saved["names"]
+        index.parents = saved["parents"]
+        index.ends = saved["ends"]
+        index.slots = saved["slots"]
+        index.durations = saved["durations"]
+        index.course_counts = saved["courseCounts"]
+        index.chapter_counts = saved["chapterCounts"]
+        index.section_counts = saved["sectionCounts"]
+        index.own_hashes = saved["ownHashes"]
+        index.hashes = saved["hashes"]
+        index._build_maps()
+        return index
+
+    def is_current(self, source_path: str) -> bool:
+        """索引是否与丰富结果文件一致（文件未被修改）"""
+        return bool(self.source) and self.source.get("signature") == _file_signature(source_path)
+
+
+def load_or_build_index(enriched_path: str, data: Any = None) -> OutlineIndex:
+    """加载丰富结果旁边的索引，不存在或已过期时重新建立并保存
+
+    Args:
+        enriched_path: 丰富结果文件路径
+        data: 已加载的丰富结果，提供时会关联到索引上
+    """
+    path = index_path_for(enriched_path)
+    index = None
+    if os.path.exists(path):
+        try:
+            index = OutlineIndex.load(path)
+        except (OSError, ValueError, KeyError):
+            index = None
+    if index is None or not index.is_current(enriched_path):
+        if data is None:
+            data = load_outline_data(enriched_path)
+        index = OutlineIndex.build(data)
+        index.save(path, enriched_path)
+    if data is not None:
+        index.attach(data)
+    return index
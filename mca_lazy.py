@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""按需丰富：大纲中的课程替换为代理对象，第一次访问章节或详情字段时才获取版本和章节信息
+
+获取结果按课程ID缓存，同一课程只请求一次；可选地在访问某个课程时于后台预取其后的几个课程。
+只浏览少数课程或只渲染指定课程时，请求数与实际访问的课程数成正比。
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Dict, Any, List, Optional
+
+from mca_index import course_key
+from mca_schedule import mark_pending, ENRICH_STATUS_KEY
+
+# 由丰富过程写入的字段，访问这些字段时触发获取
+LAZY_FIELDS = frozenset({
+    "chapterList", "durationSum", "level", "price", "studyCount", "totalChapterCount", "totalSectionCount",
+    "pcDetailDesc", "appDetailDesc", "versionId", "versionName", "versionList",
+})
+
+
+class LazyCourse(dict):
+    """课程代理：按键访问丰富字段（[]、get、in、setdefault）时先获取课程信息
+
+    整体遍历（items、迭代、json序列化、dict(course)）不会触发获取，只包含已有的字段。
+    """
+
+    __slots__ = ("_outline", "_position", "_loaded")
+
+    def __init__(self, data: Dict[str, Any], outline: "LazyOutline", position: int):
+        super().__init__(data)
+        self._outline = outline
+        self._position = position
+        self._loaded = False
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    @property
+    def course_id(self):
+        """与丰富时相同的课程ID（简单列表格式为courseNo，stageList中的课程为id）"""
+        return course_key(self, self._outline.is_simple_format)
+
+    def load(self) -> "LazyCourse":
+        """立即获取课程信息（已获取时直接返回）"""
+        if not self._loaded:
+            self._outline.load(self)
+        return self
+
+    def _touch(self, key):
+        if not self._loaded and key in LAZY_FIELDS:
+            self._outline.load(self)
+
+    def __getitem__(self, key):
+        self._touch(key)
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        self._touch(key)
+        return super().get(key, default)
+
+    def __contains__(self, key):
+        self._touch(key)
+        return super().__contains__(key)
+
+    def setdefault(self, key, default=None):
+        self._touch(key)
+        return super().setdefault(key, default)
+
+
+class LazyOutline:
+    """把大纲中的课程原地替换为LazyCourse，并负责按需获取、缓存和预取
+
+    Args:
+        mca: MCARequest实例，获取使用其fetch_course_versions/fetch_course_detail
+        outline_list: 阶段列表（嵌套格式）或课程列表（简单列表格式），原地替换其中的课程
+        prefetch: 访问某个课程时在后台预取其后的课程数，0表示不预取
+    """
+
+    def __init__(self, mca, outline_list: List[Dict[str, Any]], prefetch: int = 0):
+        self.mca = mca
+        self.items = outline_list
+        self.prefetch = max(0, prefetch)
+        self.is_simple_format = bool(outline_list) and isinstance(outline_list[0], dict) and "courseNo" in outline_list[0]
+        # 课程ID与版本ID的映射关系，与丰富结果一起保存
+        self.id_mapping = {}
+        self.courses = []
+        self._mapping_info = []
+        # 课程ID -> 获取任务，同一课程只获取一次
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, self.prefetch, mca.enrich_workers))
+        self.fetched = 0
+        self.prefetched = 0
+
+        if self.is_simple_format:
+            groups = [(None, outline_list)]
+        else:
+            groups = [(stage, stage.get("courseList") or []) for stage in outline_list]
+        for stage, course_list in groups:
+            for i, course in enumerate(course_list):
+                proxy = LazyCourse(course, self, len(self.courses))
+                course_list[i] = proxy
+                self.courses.append(proxy)
+                info = {"courseName": course.get("courseName", "未知课程")}
+                if stage is not None:
+                    info["stageId"] = stage.get("id", "未知")
+                    info["stageName"] = stage.get("title", "未知阶段")
+                self._mapping_info.append(info)
+
+    def __len__(self):
+        return len(self.courses)
+
+    @property
+    def loaded_count(self) -> int:
+        return sum(1 for course in self.courses if course.loaded)
+
+    def course(self, course_id) -> Optional[LazyCourse]:
+        """按课程ID查找课程代理（不触发获取）"""
+        for course in self.courses:
+            if str(course.course_id) == str(course_id):
+                return course
+        return None
+
+    def _fetch(self, course_id, position: int) -> Dict[str, Any]:
+        """获取一个课程的丰富字段，返回写入结果的普通字典"""
+        fields = {}
+        if course_id:
+            self.mca._enrich_course(fields, course_id, self._mapping_info[position], self.id_mapping)
+        return fields
+
+    def _submit(self, course: LazyCourse, prefetch: bool = False) -> Future:
+        course_id = course.course_id
+        key = str(course_id)
+        with self._lock:
+            future = self._futures.get(key)
+            if future is None:
+                future = self._futures[key] = self._executor.submit(self._fetch, course_id, course._position)
+                self.fetched += 1
+                if prefetch:
+                    self.prefetched += 1
+        return future
+
+    def load(self, course: LazyCourse):
+        """获取课程信息并写入代理，同时提交其后prefetch个课程的预取"""
+        future = self._submit(course)
+        for neighbor in self.courses[course._position + 1:course._position + 1 + self.prefetch]:
+            if not neighbor.loaded:
+                self._submit(neighbor, prefetch=True)
+        self._apply(course, future.result())
+
+    def _apply(self, course: LazyCourse, fields: Dict[str, Any]):
+        with self._lock:
+            if not course._loaded:
+                dict.pop(course, ENRICH_STATUS_KEY, None)
+                dict.update(course, fields)
+                course._loaded = True
+
+    def apply_prefetched(self):
+        """把已经完成的预取结果写入对应的课程（请求已经发出，保存时不应丢弃）"""
+        for course in self.courses:
+            if course.loaded:
+                continue
+            future = self._futures.get(str(course.course_id))
+            if future is not None and future.done() and future.exception() is None:
+                self._apply(course, future.result())
+
+    def load_all(self, course_ids: Optional[List[Any]] = None):
+        """获取指定课程（默认全部课程），并发数为MCARequest的enrich_workers"""
+        if course_ids is None:
+            targets = self.courses
+        else:
+            wanted = {str(course_id) for course_id in course_ids}
+            targets = [course for course in self.courses if str(course.course_id) in wanted]
+        for course in targets:
+            self._submit(course)
+        for course in targets:
+            course.load()
+
+    def plain_outline(self) -> List[Dict[str, Any]]:
+        """不触发获取的普通字典副本（包含已完成的预取），未获取的课程标记为待获取，之后可以用resume补齐"""
+        self.apply_prefetched()
+
+        def plain(course):
+            data = dict(course)
+            if not course.loaded:
+                mark_pending(data)
+            return data
+
+        if self.is_simple_format:
+            return [plain(course) for course in self.items]
+        stages = []
+        for stage in self.items:
+            stage_copy = dict(stage)
+            stage_copy["courseList"] = [plain(course) for course in stage.get("courseList") or []]
+            stages.append(stage_copy)
+        return stages
+
+    def close(self):
+        """等待进行中的预取完成并写入结果"""
+        self._executor.shutdown(wait=True)
+        self.apply_prefetched()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
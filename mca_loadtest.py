@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""负载测试：对本地模拟网关运行完整的丰富流程，按并发线程数扫描吞吐量、延迟和错误率
+
+用法：
+    python mca_loadtest.py [--workers 1,2,4,8,16] [--courses 100] [--latency lognormal:0.05,0.5]
+                           [--error-rate 0.01] [--throttle-rate 0.01] [--max-inflight N]
+                           [--all-versions] [--hedge] [--output data/loadtest.json]
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Dict, Any, List, Optional
+
+from mca_fakegateway import FakeGateway, SyntheticCatalog
+from mca_request import MCARequest, pop_option
+from mca_transport import CircuitBreaker, percentile
+
+# 吞吐量达到最大值的这个比例即认为到达拐点
+KNEE_RATIO = 0.9
+
+
+def run_once(gateway: FakeGateway, workers: int, all_versions: bool = False,
+             hedging: bool = False) -> Dict[str, Any]:
+    """以指定并发线程数对模拟网关运行一次完整的丰富流程
+
+    Returns:
+        dict: 本次运行的吞吐量、延迟分位数和错误统计
+    """
+    gateway.reset_counters()
+    with tempfile.TemporaryDirectory(prefix="mca-load-") as data_dir:
+        mca = MCARequest(hedging=hedging)
+        mca.data_dir = data_dir
+        mca.base_url = gateway.base_url
+        # 每次运行使用独立的熔断器，不读写数据目录中的接口健康状态
+        mca.breaker = CircuitBreaker(state_file=None)
+        mca.all_versions = all_versions
+        mca.set_enrich_workers(workers)
+
+        outline = mca.fetch_course_child("1", "101")
+        stage_list = (outline or {}).get("stageList") or []
+        started = time.perf_counter()
+        mca.enrich_course_outline(stage_list)
+        elapsed = time.perf_counter() - started
+
+    report = mca.hedger.report()
+    samples = []
+    for endpoint, stats in mca.hedger.stats.items():
+        if endpoint != "systemCourse/child":
+            samples.extend(stats.latencies)
+    requests_sent = sum(s["requests"] for e, s in report.items() if e != "systemCourse/child")
+    statuses = {}
+    for codes in gateway.status_summary().values():
+        for status, count in codes.items():
+            statuses[status] = statuses.get(status, 0) + count
+    courses = sum(len(stage.get("courseList", [])) for stage in stage_list)
+    # 只按成功丰富的课程计算吞吐量，失败的课程不计入
+    enriched = courses - len({entry["courseId"] for entry in mca.dead_letters})
+    return {
+        "workers": workers,
+        "courses": courses,
+        "seconds": round(elapsed, 3),
+        "courses_per_second": round(enriched / elapsed, 2) if elapsed else 0.0,
+        "requests_per_second": round(requests_sent / elapsed, 2) if elapsed else 0.0,
+        "requests": requests_sent,
+        "p50": round(percentile(samples, 50), 4),
+        "p95": round(percentile(samples, 95), 4),
+        "p99": round(percentile(samples, 99), 4),
+        "errors": statuses.get("500", 0),
+        "throttled": statuses.get("429", 0),
+        "failed_courses": courses - enriched,
+        "peak_inflight": gateway.peak_inflight,
+    }
+
+
+def find_knee(results: List[Dict[str, Any]], ratio: float = KNEE_RATIO) -> Optional[int]:
+    """吞吐量达到最大吞吐量ratio倍的最小线程数"""
+    if not results:
+        return None
+    best = max(r["courses_per_second"] for r in results)
+    for r in sorted(results, key=lambda r: r["workers"]):
+        if r["courses_per_second"] >= best * ratio:
+            return r["workers"]
+    return None
+
+
+def format_results(results: List[Dict[str, Any]]) -> str:
+    """生成扫描结果的文本表格"""
+    lines = ["负载测试结果:",
+             f"{'线程':>4} {'耗时(s)':>8} {'课程/s':>8} {'请求/s':>8} {'p50(s)':>8} {'p95(s)':>8} {'p99(s)':>8} "
+             f"{'500':>5} {'429':>5} {'失败课程':>8} {'峰值并发':>8}"]
+    for r in results:
+        lines.append(f"{r['workers']:>4} {r['seconds']:>8.2f} {r['courses_per_second']:>8.2f} "
+                     f"{r['requests_per_second']:>8.2f} {r['p50']:>8.3f} {r['p95']:>8.3f} {r['p99']:>8.3f} "
+                     f"{r['errors']:>5} {r['throttled']:>5} {r['failed_courses']:>8} {r['peak_inflight']:>8}")
+    return "\n".join(lines)
+
+
+def sweep(gateway: FakeGateway, worker_counts: List[int], **kwargs) -> List[Dict[str, Any]]:
+    """依次以各个线程数运行丰富流程"""
+    results = []
+    for workers in worker_counts:
+        print(f"运行中: {workers} 个线程...")
+        results.append(run_once(gateway, workers, **kwargs))
+    return results
+
+
+def main(argv: List[str]):
+    worker_counts = [int(w) for w in pop_option(argv, "--workers", "1,2,4,8,16").split(",")]
+    courses = int(pop_option(argv, "--courses", "100"))
+    latency = pop_option(argv, "--latency", "lognormal:0.05,0.5")
+    error_rate = float(pop_option(argv, "--error-rate", "0"))
+    throttle_rate = float(pop_option(argv, "--throttle-rate", "0"))
+    max_inflight = pop_option(argv, "--max-inflight")
+    output_file = pop_option(argv, "--output")
+    all_versions = "--all-versions" in argv
+    hedging = "--hedge" in argv
+
+    stages = 5 if courses >= 5 else 1
+    catalog = SyntheticCatalog(stages=stages, courses_per_stage=max(1, courses // stages))
+    with FakeGateway(catalog, latency=latency, error_rate=error_rate, throttle_rate=throttle_rate,
+                     max_inflight=int(max_inflight) if max_inflight else None) as gateway:
+        print(f"模拟网关: {gateway.base_url}，{catalog.course_count} 个课程，延迟 {latency}，"
+              f"错误率 {error_rate}，限流率 {throttle_rate}")
+        results = sweep(gateway, worker_counts, all_versions=all_versions, hedging=hedging)
+
+    print("\n" + format_results(results))
+    knee = find_knee(results)
+    if knee is not None:
+        print(f"\n建议线程数: {knee}（吞吐量达到最大值的{KNEE_RATIO:.0%}）")
+
+    if output_file:
+        directory = os.path.dirname(output_file)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(output_file, "w", encoding="utf-8") as f:
+            json.dump({
+                "config": {
+                    "courses": catalog.course_count,
+                    "latency": latency,
+                    "error_rate": error_rate,
+                    "throttle_rate": throttle_rate,
+                    "max_inflight": max_inflight,
+                    "all_versions": all_versions,
+                    "hedging": hedging,
+                },
+                "results": results,
+                "knee": knee,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到: {output_file}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,302 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""视频资源清单：并发探测课程大纲中视频资源的可访问性、内容长度和内容类型
+
+先发HEAD请求，服务器不支持HEAD或没有返回长度时改用只取1个字节的Range请求（从Content-Range得到总长度）。
+请求通过按主机复用的连接池发出，每个主机同时进行的请求数受限，结果按URL缓存到文件，
+再次探测时只重新探测过期或上次不可访问的URL。
+输入需要是children树中itemType为Video并带有resources的大纲，stageList格式的大纲不包含视频地址。
+
+用法：
+    python mca_media.py <大纲JSON> [--output data/media_manifest.json] [--workers 32] [--per-host 8] [--no-cache]
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Callable, Iterable
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from mca_storage import atomic_write, hydrate_if_manifest, load_json_file
+from mca_workspace import lock_for, LockTimeout
+
+# 同时进行的探测总数
+DEFAULT_WORKERS = 32
+
+# 每个主机同时进行的探测数
+DEFAULT_PER_HOST = 8
+
+# 探测的连接和读取超时（秒）
+PROBE_TIMEOUT = (5, 10)
+
+# 缓存中可访问的结果的有效期（秒），不可访问的结果每次都重新探测
+CACHE_TTL = 7 * 24 * 3600
+
+# 缓存文件的格式标识
+CACHE_FORMAT = "mca-media-cache"
+
+# 保存缓存时等待文件锁的秒数
+CACHE_LOCK_TIMEOUT = 10.0
+
+# 服务器不支持HEAD时返回的状态码，遇到时改用Range请求
+HEAD_UNSUPPORTED = {403, 404, 405, 501}
+
+
+def _content_range_total(value: Optional[str]) -> Optional[int]:
+    """从 "bytes 0-0/12345" 中取出总长度，长度未知（*）时返回None"""
+    if not value or "/" not in value:
+        return None
+    total = value.rsplit("/", 1)[1].strip()
+    return int(total) if total.isdigit() else None
+
+
+def _content_length(value: Optional[str]) -> Optional[int]:
+    return int(value) if value and value.strip().isdigit() else None
+
+
+class MediaProber:
+    """并发探测视频资源URL
+
+    Args:
+        workers: 同时进行的探测总数
+        per_host: 每个主机同时进行的探测数
+        timeout: 连接和读取超时（秒）
+        cache_file: 结果缓存文件，None表示不缓存
+        ttl: 可访问的结果的缓存有效期（秒）
+        headers: 额外的请求头（如Referer），不会带上课程接口的登录凭据
+    """
+
+    def __init__(self, workers: int = DEFAULT_WORKERS, per_host: int = DEFAULT_PER_HOST, timeout=PROBE_TIMEOUT,
+                 cache_file: Optional[str] = None, ttl: float = CACHE_TTL, headers: Optional[Dict[str, str]] = None):
+        self.workers = max(1, workers)
+        self.per_host = max(1, per_host)
+        self.timeout = timeout
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self.session = requests.Session()
+        if headers:
+            self.session.headers.update(headers)
+        # 每个主机的连接池大小与该主机的并发上限一致，连接在探测之间复用
+        adapter = HTTPAdapter(pool_connections=max(10, self.workers // self.per_host), pool_maxsize=self.per_host)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._host_limits = {}
+        self._lock = threading.Lock()
+        self.cache = self._load_cache()
+        self.stats = {"probed": 0, "cached": 0, "ranged": 0, "unreachable": 0}
+
+    def _load_cache(self) -> Dict[str, Dict[str, Any]]:
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return {}
+        try:
+            with open(self.cache_file, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if saved.get("format") != CACHE_FORMAT:
+            return {}
+        return saved.get("entries", {})
+
+    def save_cache(self):
+        """保存探测结果缓存
+
+        缓存文件可能被并行的多个运行共用：在文件锁内读取磁盘上的缓存，每个URL保留探测时间较新的结果后整体替换文件。
+        """
+        if not self.cache_file:
+            return
+        try:
+            with lock_for(self.cache_file, timeout=CACHE_LOCK_TIMEOUT):
+                entries = self._load_cache()
+                with self._lock:
+                    for url, entry in self.cache.items():
+                        saved = entries.get(url)
+                        if saved is None or entry.get("checkedAt", 0) >= saved.get("checkedAt", 0):
+                            entries[url] = entry
+                atomic_write(self.cache_file, json.dumps({"format": CACHE_FORMAT, "entries": entries},
+                                                         ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+        except (OSError, LockTimeout) as e:
+            print(f"警告: 保存视频资源探测缓存失败: {e}")
+
+    def _host_limit(self, url: str) -> threading.BoundedSemaphore:
+        host = urlsplit(url).netloc
+        with self._lock:
+            limit = self._host_limits.get(host)
+            if limit is None:
+                limit = self._host_limits[host] = threading.BoundedSemaphore(self.per_host)
+        return limit
+
+    def _cached(self, url: str) -> Optional[Dict[str, Any]]:
+        entry = self.cache.get(url)
+        if entry and entry.get("reachable") and time.time() - entry.get("checkedAt", 0) < self.ttl:
+            return entry
+        return None
+
+    def _send(self, method: str, url: str, headers: Optional[Dict[str, str]] = None) -> requests.Response:
+        # stream=True：先只读取响应头。HEAD和206的内容为空或只有1个字节，读完后连接回到连接池；
+        # 服务器忽略Range返回完整内容时直接关闭连接，不下载视频
+        response = self.session.request(method, url, headers=headers, timeout=self.timeout,
+                                        allow_redirects=True, stream=True)
+        if method == "HEAD" or response.status_code == 206:
+            response.content
+        response.close()
+        return response
+
+    def probe(self, url: str) -> Dict[str, Any]:
+        """探测一个URL（不使用缓存）
+
+        Returns:
+            dict: url、reachable、status、contentLength、contentType、acceptRanges、finalUrl、method、error、checkedAt
+        """
+        result = {"url": url, "reachable": False, "status": None, "contentLength": None, "contentType": None,
+                  "acceptRanges": False, "finalUrl": None, "method": "HEAD", "error": None}
+        try:
+            with self._host_limit(url):
+                response = self._send("HEAD", url)
+                length = _content_length(response.headers.get("Content-Length"))
+                if response.status_code in HEAD_UNSUPPORTED or (response.status_code < 400 and length is None):
+                    response = self._send("GET", url, {"Range": "bytes=0-0"})
+                    result["method"] = "RANGE"
+                    if response.status_code == 206:
+                        length = _content_range_total(response.headers.get("Content-Range"))
+                    else:
+                        length = _content_length(response.headers.get("Content-Length"))
+            reachable = response.status_code < 400
+            result.update({
+                "reachable": reachable,
+                "status": response.status_code,
+                # 错误响应的Content-Length是错误页面的长度，不是视频的长度
+                "contentLength": length if reachable else None,
+                "contentType": response.headers.get("Content-Type"),
+                "acceptRanges": response.status_code == 206 or response.headers.get("Accept-Ranges") == "bytes",
+                "finalUrl": response.url if response.url != url else None,
+            })
+        except requests.RequestException as e:
+            result["error"] = f"{type(e).__name__}: {e}"
+        result["checkedAt"] = time.time()
+        return result
+
+    def probe_all(self, urls: Iterable[str],
+                  progress: Optional[Callable[[int, int, str], None]] = None) -> Dict[str, Dict[str, Any]]:
+        """并发探测一组URL，重复的URL只探测一次，缓存中有效的结果直接使用
+
+        Args:
+            urls: 视频资源URL
+            progress: 进度回调 (已完成数, 需要探测的总数, 刚完成的URL)
+
+        Returns:
+            dict: URL到探测结果的映射
+        """
+        results = {}
+        pending = []
+        for url in dict.fromkeys(url for url in urls if url):
+            cached = self._cached(url)
+            if cached is not None:
+                results[url] = cached
+                self.stats["cached"] += 1
+            else:
+                pending.append(url)
+
+        done = 0
+        with ThreadPoolExecutor(max_workers=min(self.workers, max(1, len(pending)))) as executor:
+            for result in executor.map(self.probe, pending):
+                results[result["url"]] = result
+                with self._lock:
+                    self.cache[result["url"]] = result
+                self.stats["probed"] += 1
+                if result["method"] == "RANGE":
+                    self.stats["ranged"] += 1
+                if not result["reachable"]:
+                    self.stats["unreachable"] += 1
+                done += 1
+                if progress:
+                    progress(done, len(pending), result["url"])
+        self.save_cache()
+        return results
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def merge_media_info(flat_structure: List[Dict[str, Any]], results: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """把探测结果合并到extract_course_structure的扁平化结构中（原地修改，返回同一个列表）
+
+    视频项增加 reachable、http_status、content_length、content_type、media_error 字段。
+    """
+    for item in flat_structure:
+        if not item.get("is_video") or not item.get("video_url"):
+            continue
+        result = results.get(item["video_url"])
+        if result is None:
+            continue
+        item["reachable"] = result["reachable"]
+        item["http_status"] = result["status"]
+        item["content_length"] = result["contentLength"]
+        item["content_type"] = result["contentType"]
+        item["media_error"] = result["error"]
+    return flat_structure
+
+
+def media_manifest(flat_structure: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """从合并了探测结果的扁平化结构生成视频资源清单（每个视频一条，不含parent_info）"""
+    videos = [{
+        "id": item["id"],
+        "title": item["title"],
+        "path": item["path"],
+        "url": item["video_url"],
+        "duration": item["duration"],
+        "reachable": item.get("reachable"),
+        "status": item.get("http_status"),
+        "contentLength": item.get("content_length"),
+        "contentType": item.get("content_type"),
+        "error": item.get("media_error"),
+    } for item in flat_structure if item.get("is_video")]
+    return {
+        "videoCount": len(videos),
+        "unreachableCount": sum(1 for video in videos if video["reachable"] is False),
+        "missingUrlCount": sum(1 for video in videos if not video["url"]),
+        "totalBytes": sum(video["contentLength"] or 0 for video in videos),
+        "videos": videos,
+    }
+
+
+def main(argv: List[str]) -> int:
+    from mca_request import MCARequest, pop_option
+
+    output_file = pop_option(argv, "--output", os.path.join("data", "media_manifest.json"))
+    workers = int(pop_option(argv, "--workers", str(DEFAULT_WORKERS)))
+    per_host = int(pop_option(argv, "--per-host", str(DEFAULT_PER_HOST)))
+    use_cache = "--no-cache" not in argv
+    if not use_cache:
+        argv.remove("--no-cache")
+    if len(argv) != 1:
+        print(__doc__.split("用法：", 1)[1].rstrip())
+        return 2
+
+    # 支持压缩（.gz/.xz）、紧凑格式和快照清单形式的大纲
+    outline = hydrate_if_manifest(load_json_file(argv[0], resolve_blobs=True), argv[0])
+    mca = MCARequest(verbose=True)
+    mca.media_workers = workers
+    mca.media_per_host = per_host
+    mca.media_cache = use_cache
+    try:
+        manifest = mca.build_media_manifest(outline, output_file)
+    except ValueError as e:
+        print(f"错误: {e}")
+        return 1
+    return 1 if manifest["unreachableCount"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,317 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""缓存包：把录制的接口响应打包成单个文件，其他节点内存映射后直接作为预热好的缓存使用
+
+文件结构（小端）：
+    文件头    魔数(8) 版本(u32) 条目数(u32) 索引偏移(u64) 保留(u64)
+    数据区    各条目的值（响应头JSON + 换行 + 响应内容，较大的值用zlib压缩）
+    键区      各条目的键（UTF-8）
+    索引      每个条目一个定长记录：键偏移(u64) 键长度(u32) 值偏移(u64) 值长度(u32) 标志(u32)，按键的字节序排列
+
+读取时只映射文件，在索引上二分查找，一次查找只访问O(log n)个索引记录和命中的值所在的页，
+不需要解包或解析整个文件。
+
+用法：
+    python mca_pack.py build <缓存包> <录制文件>... [--all]
+    python mca_pack.py info <缓存包>
+"""
+
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+import zlib
+from typing import Dict, Any, List, Optional, Iterator, Tuple
+from urllib.parse import urlsplit
+
+from requests.adapters import BaseAdapter
+
+from mca_transport import Cassette, request_key, build_response
+
+PACK_MAGIC = b"MCAPACK\x00"
+PACK_VERSION = 1
+HEADER = struct.Struct("<8sIIQQ")
+ENTRY = struct.Struct("<QIQII")
+
+# 条目标志：值经过zlib压缩
+FLAG_ZLIB = 1
+
+# 超过这个大小（字节）的值尝试压缩，压缩后更小时才保存压缩结果
+COMPRESS_MIN_SIZE = 256
+
+# 默认只打包这些接口的响应（版本列表和课程详情），与账号相关的接口不放入共享的缓存包
+DEFAULT_ENDPOINTS = ("/courseversion/allVersionList", "/courseWeb/")
+
+
+def _strip_origin(key: str, url: str) -> str:
+    parts = urlsplit(url)
+    return key.replace(f"{parts.scheme}://{parts.netloc}", "", 1)
+
+
+def pack_key(method: str, url: str, body: Optional[bytes] = None) -> str:
+    """缓存包中的键：与录制文件的请求键相同，但去掉协议和主机，不同节点可以使用不同的接口地址"""
+    return _strip_origin(request_key(method, url, body), url)
+
+
+def encode_response(status: int, reason: Optional[str], headers: Dict[str, str], content: bytes) -> bytes:
+    meta = json.dumps({"status": status, "reason": reason, "headers": headers},
+                      ensure_ascii=False, separators=(",", ":"))
+    return meta.encode("utf-8") + b"\n" + content
+
+
+def decode_response(value: bytes) -> Tuple[int, Optional[str], Dict[str, str], bytes]:
+    """encode_response的逆操作，返回 (状态码, 原因, 响应头, 内容)"""
+    meta, _, content = value.partition(b"\n")
+    meta = json.loads(meta.decode("utf-8"))
+    return meta["status"], meta.get("reason"), meta.get("headers", {}), content
+
+
+class PackWriter:
+    """收集条目并写出缓存包，同一个键多次添加时保留最后一次
+
+    Args:
+        path: 缓存包路径
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._entries = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, key: str, value: bytes):
+        flags = 0
+        if len(value) > COMPRESS_MIN_SIZE:
+            compressed = zlib.compress(value, 6)
+            if len(compressed) < len(value):
+                value, flags = compressed, FLAG_ZLIB
+        self._entries[key.encode("utf-8")] = (value, flags)
+
+    def add_response(self, key: str, status: int, reason: Optional[str], headers: Dict[str, str], content: bytes):
+        self.add(key, encode_response(status, reason, headers, content))
+
+    def write(self) -> str:
+        """按键排序写出缓存包（先写同目录的临时文件再替换）
+
+        Returns:
+            str: 缓存包路径
+        """
+        keys = sorted(self._entries)
+        directory, name = os.path.split(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        tmp_path = os.path.join(directory, f".tmp-{os.getpid()}-{name}")
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(HEADER.pack(PACK_MAGIC, PACK_VERSION, len(keys), 0, 0))
+                offset = HEADER.size
+                value_positions = []
+                for key in keys:
+                    value, _ = self._entries[key]
+                    f.write(value)
+                    value_positions.append(offset)
+                    offset += len(value)
+                key_positions = []
+                for key in keys:
+                    f.write(key)
+                    key_positions.append(offset)
+                    offset += len(key)
+                index_offset = offset
+                for key, key_offset, value_offset in zip(keys, key_positions, value_positions):
+                    value, flags = self._entries[key]
+                    f.write(ENTRY.pack(key_offset, len(key), value_offset, len(value), flags))
+                f.seek(0)
+                f.write(HEADER.pack(PACK_MAGIC, PACK_VERSION, len(keys), index_offset, 0))
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return self.path
+
+
+class PackReader:
+    """内存映射的只读缓存包，可以在多个线程中同时查找
+
+    Args:
+        path: 缓存包路径
+
+    Raises:
+        ValueError: 不是缓存包文件或版本不支持
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f"不是缓存包文件: {path}")
+        if len(self._map) < HEADER.size:
+            self.close()
+            raise ValueError(f"不是缓存包文件: {path}")
+        magic, version, count, index_offset, _ = HEADER.unpack_from(self._map, 0)
+        if magic != PACK_MAGIC:
+            self.close()
+            raise ValueError(f"不是缓存包文件: {path}")
+        if version != PACK_VERSION:
+            self.close()
+            raise ValueError(f"不支持的缓存包版本: {version}")
+        self.count = count
+        self._index_offset = index_offset
+
+    def __len__(self):
+        return self.count
+
+    def _entry(self, i: int) -> Tuple[int, int, int, int, int]:
+        return ENTRY.unpack_from(self._map, self._index_offset + i * ENTRY.size)
+
+    def _key_at(self, i: int) -> bytes:
+        key_offset, key_length = ENTRY.unpack_from(self._map, self._index_offset + i * ENTRY.size)[:2]
+        return self._map[key_offset:key_offset + key_length]
+
+    def _find(self, key: bytes) -> int:
+        """在排序的索引上二分查找，返回条目序号，不存在时返回-1"""
+        low, high = 0, self.count
+        while low < high:
+            mid = (low + high) // 2
+            if self._key_at(mid) < key:
+                low = mid + 1
+            else:
+                high = mid
+        if low < self.count and self._key_at(low) == key:
+            return low
+        return -1
+
+    def _value(self, i: int) -> bytes:
+        _, _, value_offset, value_length, flags = self._entry(i)
+        value = self._map[value_offset:value_offset + value_length]
+        return zlib.decompress(value) if flags & FLAG_ZLIB else value
+
+    def get(self, key: str) -> Optional[bytes]:
+        """按键查找值，不存在时返回None"""
+        i = self._find(key.encode("utf-8"))
+        return self._value(i) if i >= 0 else None
+
+    def get_response(self, key: str) -> Optional[Tuple[int, Optional[str], Dict[str, str], bytes]]:
+        """按键查找响应，返回 (状态码, 原因, 响应头, 内容)，不存在时返回None"""
+        value = self.get(key)
+        return decode_response(value) if value is not None else None
+
+    def __contains__(self, key: str) -> bool:
+        return self._find(key.encode("utf-8")) >= 0
+
+    def keys(self) -> Iterator[str]:
+        """按排序顺序遍历所有键"""
+        for i in range(self.count):
+            yield self._key_at(i).decode("utf-8")
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PackCacheAdapter(BaseAdapter):
+    """先在缓存包中查找响应，命中时直接返回，未命中时交给fallback适配器发出真实请求
+
+    Args:
+        pack: 已打开的缓存包
+        fallback: 未命中时使用的适配器（连接池、录制或回放）
+    """
+
+    def __init__(self, pack: PackReader, fallback: BaseAdapter):
+        super().__init__()
+        self.pack = pack
+        self.fallback = fallback
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def send(self, request, **kwargs):
+        cached = self.pack.get_response(pack_key(request.method, request.url, request.body))
+        with self._lock:
+            if cached is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if cached is None:
+            return self.fallback.send(request, **kwargs)
+        status, reason, headers, content = cached
+        return build_response(request, status, reason, headers, content, connection=self)
+
+    def close(self):
+        self.fallback.close()
+
+
+def _cacheable(key: str, entry: Dict[str, Any], content: bytes, endpoints) -> bool:
+    """只打包成功的响应：HTTP 200，JSON响应的code也为200"""
+    if entry.get("status") != 200:
+        return False
+    if endpoints and not any(endpoint in key.split("?", 1)[0] for endpoint in endpoints):
+        return False
+    try:
+        payload = json.loads(content.decode("utf-8"))
+    except (UnicodeDecodeError, ValueError):
+        return True
+    return not isinstance(payload, dict) or payload.get("code", 200) == 200
+
+
+def build_pack(pack_path: str, cassette_paths: List[str], endpoints=DEFAULT_ENDPOINTS) -> int:
+    """把一个或多个录制文件中的成功响应打包，同一请求保留最后录制的响应
+
+    Args:
+        pack_path: 缓存包路径
+        cassette_paths: 录制文件路径
+        endpoints: 只打包URL路径中包含这些片段的响应，None或空表示全部
+
+    Returns:
+        int: 缓存包中的条目数
+    """
+    writer = PackWriter(pack_path)
+    for cassette_path in cassette_paths:
+        for recorded_key, entry, content in Cassette.load(cassette_path).iter_responses():
+            key = _strip_origin(recorded_key, entry["url"])
+            if _cacheable(key, entry, content, endpoints):
+                writer.add_response(key, entry["status"], entry.get("reason"), entry.get("headers", {}), content)
+    writer.write()
+    return len(writer)
+
+
+def main(argv: List[str]) -> int:
+    include_all = "--all" in argv
+    if include_all:
+        argv.remove("--all")
+    if len(argv) >= 3 and argv[0] == "build":
+        count = build_pack(argv[1], argv[2:], endpoints=None if include_all else DEFAULT_ENDPOINTS)
+        print(f"缓存包已保存到: {argv[1]}（{count} 个响应，{os.path.getsize(argv[1]) / 1024:.0f}KB）")
+        return 0
+    if len(argv) == 2 and argv[0] == "info":
+        with PackReader(argv[1]) as pack:
+            print(f"缓存包: {argv[1]}")
+            print(f"条目数: {len(pack)}，文件大小: {os.path.getsize(argv[1]) / 1024:.0f}KB")
+            endpoints = {}
+            for key in pack.keys():
+                path = key.split(" ", 1)[-1].split("?", 1)[0]
+                endpoint = next((e for e in DEFAULT_ENDPOINTS if e in path), path)
+                endpoints[endpoint] = endpoints.get(endpoint, 0) + 1
+            for endpoint, count in sorted(endpoints.items()):
+                print(f"  {endpoint}: {count}")
+        return 0
+    print(__doc__.split("用法：", 1)[1].rstrip())
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""分阶段性能分析：墙钟/CPU计时，可选cProfile和tracemalloc"""
+
+import cProfile
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional
+
+from mca_storage import atomic_write
+from mca_workspace import lock_for
+
+
+class PhaseStats:
+    """某个阶段路径的累计数据"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.calls = 0
+        self.wall = 0.0
+        self.wall_self = 0.0
+        self.cpu = 0.0
+        self.peak_memory = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "phase": self.path,
+            "calls": self.calls,
+            "wall": round(self.wall, 6),
+            "wall_self": round(self.wall_self, 6),
+            "cpu": round(self.cpu, 6),
+            "peak_memory": self.peak_memory,
+        }
+
+
+class _Frame:
+    """正在执行的阶段"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.start_wall = time.perf_counter()
+        self.start_cpu = time.process_time()
+        self.child_wall = 0.0
+        self.child_peak = 0
+        self.profile = None
+
+
+class PhaseProfiler:
+    """按阶段统计耗时
+
+    阶段可以嵌套，嵌套阶段以"父阶段/子阶段"的路径汇总，父阶段的自身耗时（wall_self）
+    不含子阶段耗时。cProfile只在主线程的最外层阶段上开启，每个最外层阶段输出一个.pstats文件；
+    tracemalloc记录每个阶段（含子阶段）的内存峰值。未启用时phase()几乎没有开销。
+
+    Args:
+        enabled: 是否启用分析
+        use_cprofile: 是否为最外层阶段记录cProfile统计
+        use_tracemalloc: 是否记录内存峰值
+        output_dir: 报告和.pstats文件的输出目录
+    """
+
+    def __init__(self, enabled: bool = False, use_cprofile: bool = False,
+                 use_tracemalloc: bool = False, output_dir: str = os.path.join("data", "profile")):
+        self.enabled = enabled or use_cprofile or use_tracemalloc
+        self.use_cprofile = use_cprofile
+        self.use_tracemalloc = use_tracemalloc
+        self.output_dir = output_dir
+        self.phases = {}
+        self.profiles = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        if self.use_tracemalloc and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def _stack(self) -> List[_Frame]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    @contextmanager
+    def phase(self, name: str):
+        """统计一个阶段的耗时
+
+        Args:
+            name: 阶段名称，如fetch、json_decode、render_markdown
+        """
+        if not self.enabled:
+            yield
+            return
+
+        stack = self._stack()
+        parent = stack[-1] if stack else None
+        frame = _Frame(f"{parent.path}/{name}" if parent else name)
+        is_main = threading.current_thread() is threading.main_thread()
+
+        if self.use_tracemalloc and is_main:
+            if parent is not None:
+                parent.child_peak = max(parent.child_peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        if self.use_cprofile and parent is None and is_main:
+            frame.profile = self.profiles.get(name)
+            if frame.profile is None:
+                frame.profile = self.profiles[name] = cProfile.Profile()
+            frame.profile.enable()
+
+        stack.append(frame)
+        try:
+            yield
+        finally:
+            stack.pop()
+            if frame.profile is not None:
+                frame.profile.disable()
+            wall = time.perf_counter() - frame.start_wall
+            cpu = time.process_time() - frame.start_cpu
+            peak = 0
+            if self.use_tracemalloc and is_main:
+                peak = max(frame.child_peak, tracemalloc.get_traced_memory()[1])
+                if parent is not None:
+                    parent.child_peak = max(parent.child_peak, peak)
+            if parent is not None:
+                parent.child_wall += wall
+
+            with self._lock:
+                stats = self.phases.get(frame.path)
+                if stats is None:
+                    stats = self.phases[frame.path] = PhaseStats(frame.path)
+                stats.calls += 1
+                stats.wall += wall
+                stats.wall_self += wall - frame.child_wall
+                stats.cpu += cpu
+                stats.peak_memory = max(stats.peak_memory, peak)
+
+    def format_report(self) -> str:
+        """生成各阶段耗时的文本表格"""
+        lines = ["阶段耗时统计:",
+                 f"{'阶段':<40} {'次数':>6} {'墙钟(s)':>10} {'自身(s)':>10} {'CPU(s)':>10} {'内存峰值(KB)':>12}"]
+        with self._lock:
+            phases = sorted(self.phases.values(), key=lambda s: s.path)
+        for s in phases:
+            depth = s.path.count("/")
+            label = "  " * depth + s.path.rsplit("/", 1)[-1]
+            peak = f"{s.peak_memory / 1024:.1f}" if self.use_tracemalloc else "-"
+            lines.append(f"{label:<40} {s.calls:>6} {s.wall:>10.3f} {s.wall_self:>10.3f} {s.cpu:>10.3f} {peak:>12}")
+        return "\n".join(lines)
+
+    def save(self) -> Optional[List[str]]:
+        """写入阶段报告（文本和JSON）以及每个最外层阶段的.pstats文件
+
+        Returns:
+            list: 生成的文件路径列表，未启用时返回None
+        """
+        if not self.enabled or not self.phases:
+            return None
+        if not os.path.exists(self.output_dir):
+            os.makedirs(self.output_dir)
+
+        files = []
+        report_text = self.format_report()
+        text_path = os.path.join(self.output_dir, "profile_report.txt")
+        json_path = os.path.join(self.output_dir, "profile_report.json")
+        with self._lock:
+            report = [s.to_dict() for s in sorted(self.phases.values(), key=lambda s: s.path)]
+        # 报告目录在并行的运行之间共用，同一次运行的文本、JSON和.pstats文件在同一个锁内写完
+        with lock_for(os.path.join(self.output_dir, "profile_report")):
+            atomic_write(text_path, (report_text + "\n").encode("utf-8"))
+            files.append(text_path)
+            atomic_write(json_path, json.dumps({"phases": report}, ensure_ascii=False, indent=2).encode("utf-8"))
+            files.append(json_path)
+
+            for name, profile in self.profiles.items():
+                pstats_path = os.path.join(self.output_dir, f"{name}.pstats")
+                profile.dump_stats(pstats_path)
+                files.append(pstats_path)
+
+        print("\n" + report_text)
+        print(f"\n性能分析报告已保存到: {self.output_dir}")
+        return files
+
+
+def profiled(name: str):
+    """方法装饰器：用实例的profiler统计整个方法的耗时"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            with self.profiler.phase(name):
+                return func(self, *args, **kwargs)
+        return wrapper
+    return decorator
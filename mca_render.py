@@ -0,0 +1,344 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""单次遍历的多目标渲染：遍历一次丰富后的大纲，同时生成Markdown、目录摘要、JSONL导出和统计
+
+每个输出目标（sink）接收阶段、课程、章节、小节事件，并使用自己的带缓冲写入器。
+只关心课程级事件的目标不会收到章节和小节事件，遍历开销只与实际需要的粒度有关。
+"""
+
+import io
+import json
+import os
+from typing import Dict, Any, List, Optional
+
+from mca_index import course_key
+from mca_profiler import PhaseProfiler
+from mca_trace import Tracer
+from mca_schedule import is_pending
+
+# 各目标写入器的缓冲区大小（字节）
+WRITE_BUFFER_SIZE = 1 << 20
+
+
+def open_buffered(path: str):
+    """以较大的缓冲区打开文本文件用于写入"""
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    return open(path, "w", encoding="utf-8", buffering=WRITE_BUFFER_SIZE)
+
+
+def format_duration(seconds: int) -> str:
+    """把秒数格式化为 X小时Y分钟Z秒"""
+    seconds = int(seconds or 0)
+    return f"{seconds // 3600}小时{(seconds % 3600) // 60}分钟{seconds % 60}秒"
+
+
+# 课程目录的标题行
+CATALOG_HEADER = "# 课程目录\n"
+
+
+def catalog_entry(title: str, level: int, duration: Optional[int] = None) -> str:
+    """课程目录中的一行：视频带 (分:秒) 时长，其它项加粗"""
+    indent = "  " * level
+    if duration is None:
+        return f"{indent}- **{title}**"
+    return f"{indent}- [{title}] ({duration // 60:02d}:{duration % 60:02d})"
+
+
+def catalog_summary(video_count: int, total_duration: int) -> str:
+    """课程目录末尾的统计信息"""
+    return f"\n## 统计信息\n- 视频数量: {video_count}个\n- 总时长: {format_duration(total_duration)}"
+
+
+class RenderSink:
+    """输出目标基类，子类按需覆盖事件方法
+
+    Attributes:
+        name: 目标名称，用于命令行选择和结果索引
+        title: 日志中显示的产物名称
+    """
+
+    name = ""
+    title = ""
+
+    def begin(self):
+        """遍历开始前调用"""
+
+    def stage(self, stage: Dict[str, Any]):
+        """进入一个阶段（简单列表格式没有阶段）"""
+
+    def course(self, index: int, course: Dict[str, Any], stage: Optional[Dict[str, Any]]):
+        """进入一个课程，index从1开始"""
+
+    def chapter(self, chapter: Dict[str, Any], course: Dict[str, Any]):
+        """进入一个章节"""
+
+    def section(self, section: Dict[str, Any], chapter: Dict[str, Any], course: Dict[str, Any],
+                stage: Optional[Dict[str, Any]]):
+        """一个小节"""
+
+    def end(self) -> List[str]:
+        """遍历结束后调用，返回生成的文件路径"""
+        return []
+
+
+def _overrides(sink: RenderSink, method: str) -> bool:
+    return getattr(type(sink), method) is not getattr(RenderSink, method)
+
+
+def _render_course(index, course, stage, sinks, chapter_sinks, section_sinks, walk_chapters):
+    """把一个课程及其章节、小节事件分发给各输出目标"""
+    for sink in sinks:
+        sink.course(index, course, stage)
+    if not walk_chapters:
+        return
+    for chapter in course.get("chapterList") or []:
+        for sink in chapter_sinks:
+            sink.chapter(chapter, course)
+        if section_sinks:
+            for section in chapter.get("sectionList") or []:
+                for sink in section_sinks:
+                    sink.section(section, chapter, course, stage)
+
+
+def render_outline(data: Dict[str, Any], sinks: List[RenderSink],
+                   profiler: Optional[PhaseProfiler] = None, tracer: Optional[Tracer] = None) -> Dict[str, List[str]]:
+    """遍历一次丰富后的大纲，把事件分发给各输出目标
+
+    Args:
+        data: 丰富后的JSON（{"msg", "code", "data"}）
+        sinks: 输出目标列表
+        profiler: 分阶段性能分析器
+        tracer: 启用时为每个课程记录一个render span，挂到该课程丰富时的trace下
+
+    Returns:
+        dict: 目标名称到生成文件列表的映射
+    """
+    profiler = profiler or PhaseProfiler()
+    stage_sinks = [s for s in sinks if _overrides(s, "stage")]
+    chapter_sinks = [s for s in sinks if _overrides(s, "chapter")]
+    section_sinks = [s for s in sinks if _overrides(s, "section")]
+    walk_chapters = bool(chapter_sinks or section_sinks)
+
+    outline = data.get("data")
+    if isinstance(outline, list):
+        groups = [(None, outline)]
+    else:
+        groups = [(stage, stage.get("courseList") or []) for stage in (outline or {}).get("stageList", [])]
+
+    tracing = tracer is not None and tracer.enabled
+    for sink in sinks:
+        sink.begin()
+    with profiler.phase("traverse"):
+        index = 0
+        for stage, courses in groups:
+            if stage is not None:
+                for sink in stage_sinks:
+                    sink.stage(stage)
+            for course in courses:
+                index += 1
+                if tracing:
+                    course_id = course_key(course, stage is None)
+                    with tracer.span("render", course_id=course_id, **{"mca.course.id": course_id,
+                                                                       "mca.sinks": len(sinks)}):
+                        _render_course(index, course, stage, sinks, chapter_sinks, section_sinks, walk_chapters)
+                else:
+                    _render_course(index, course, stage, sinks, chapter_sinks, section_sinks, walk_chapters)
+    return {sink.name: sink.end() for sink in sinks}
+
+
+class MarkdownSink(RenderSink):
+    """Markdown大纲（单个文件或按字符数分割），输出与generate_markdown_from_enriched_json一致"""
+
+    name = "markdown"
+    title = "Markdown大纲"
+
+    def __init__(self, mca, output_file: str, max_chars_per_file: Optional[int] = None):
+        self.mca = mca
+        self.output_file = output_file
+        self.max_chars_per_file = max_chars_per_file
+        self.toc_content = []
+        self.course_contents = []
+
+    def begin(self):
+        self.toc_content = ["# 课程大纲总目录\n\n"]
+        self.course_contents = []
+
+    def course(self, index, course, stage):
+        self.toc_content.append(self.mca.render_toc_line(index, course))
+        self.course_contents.append(self.mca.render_course_markdown(course))
+
+    def end(self):
+        # 分割文件需要先知道总字符数，因此课程内容在遍历结束后统一写出
+        return self.mca.write_markdown_files(self.toc_content, self.course_contents, self.output_file,
+                                             self.max_chars_per_file)
+
+
+class CatalogSink(RenderSink):
+    """目录摘要：与generate_course_catalog相同的缩进目录，小节带时长，末尾附视频数量和总时长
+
+    Args:
+        output_file: 输出文件路径，None时只在内存中生成，通过text获取
+    """
+
+    name = "catalog"
+    title = "课程目录"
+
+    def __init__(self, output_file: Optional[str] = None):
+        self.output_file = output_file
+        self._file = None
+        self._level = 0
+        self.video_count = 0
+        self.total_duration = 0
+        self.text = None
+
+    def begin(self):
+        self._file = open_buffered(self.output_file) if self.output_file else io.StringIO()
+        self._file.write(CATALOG_HEADER)
+
+    def stage(self, stage):
+        self._file.write("\n" + catalog_entry((stage.get("title") or "未知阶段").strip(), 0))
+
+    def course(self, index, course, stage):
+        self._level = 1 if stage is not None else 0
+        self._file.write("\n" + catalog_entry((course.get("courseName") or "未知课程").strip(), self._level))
+
+    def chapter(self, chapter, course):
+        self._file.write("\n" + catalog_entry((chapter.get("chapterName") or "未知章节").strip(), self._level + 1))
+
+    def section(self, section, chapter, course, stage):
+        duration = int(section.get("durationTime") or 0)
+        self.video_count += 1
+        self.total_duration += duration
+        self._file.write("\n" + catalog_entry((section.get("sectionName") or "未知小节").strip(),
+                                               self._level + 2, duration))
+
+    def end(self):
+        self._file.write("\n" + catalog_summary(self.video_count, self.total_duration))
+        if not self.output_file:
+            self.text = self._file.getvalue()
+            return []
+        self._file.close()
+        return [self.output_file]
+
+
+class JsonlSink(RenderSink):
+    """扁平导出：每个小节一行JSON，没有章节信息的课程输出一行课程记录"""
+
+    name = "jsonl"
+    title = "JSONL导出"
+
+    def __init__(self, output_file: str):
+        self.output_file = output_file
+        self._file = None
+        self._encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+        self._course_row = None
+        self._course_has_sections = False
+
+    def begin(self):
+        self._file = open_buffered(self.output_file)
+
+    def _flush_course(self):
+        if self._course_row is not None and not self._course_has_sections:
+            self._file.write(self._encoder.encode(self._course_row) + "\n")
+
+    def course(self, index, course, stage):
+        self._flush_course()
+        self._course_has_sections = False
+        self._course_row = {
+            "index": index,
+            "stageId": stage.get("id") if stage else None,
+            "stageName": (stage.get("title") or "").strip() if stage else None,
+            "courseId": course_key(course, stage is None),
+            "courseName": (course.get("courseName") or "").strip(),
+            "chapterId": None,
+            "chapterName": None,
+            "sectionId": None,
+            "sectionName": None,
+            "duration": course.get("durationSum", course.get("durationTotal")),
+        }
+
+    def section(self, section, chapter, course, stage):
+        self._course_has_sections = True
+        row = dict(self._course_row)
+        row["chapterId"] = chapter.get("id")
+        row["chapterName"] = (chapter.get("chapterName") or "").strip()
+        row["sectionId"] = section.get("id")
+        row["sectionName"] = (section.get("sectionName") or "").strip()
+        row["duration"] = section.get("durationTime")
+        self._file.write(self._encoder.encode(row) + "\n")
+
+    def end(self):
+        self._flush_course()
+        self._file.close()
+        return [self.output_file]
+
+
+class StatsSink(RenderSink):
+    """统计摘要（JSON）：各层节点数量、总时长、丰富状态和时长最长的课程"""
+
+    name = "stats"
+    title = "统计摘要"
+
+    # 统计中列出的最长课程数量
+    TOP_COURSES = 10
+
+    def __init__(self, output_file: str):
+        self.output_file = output_file
+        self.stats = {}
+        self._courses = []
+
+    def begin(self):
+        self.stats = {"stages": 0, "courses": 0, "enrichedCourses": 0, "pendingCourses": 0,
+                      "chapters": 0, "sections": 0, "duration": 0}
+        self._courses = []
+
+    def stage(self, stage):
+        self.stats["stages"] += 1
+
+    def course(self, index, course, stage):
+        stats = self.stats
+        stats["courses"] += 1
+        if is_pending(course):
+            stats["pendingCourses"] += 1
+        elif "chapterList" in course:
+            stats["enrichedCourses"] += 1
+        duration = int(course.get("durationSum") or course.get("durationTotal") or 0)
+        stats["duration"] += duration
+        self._courses.append((duration, index, course_key(course, stage is None),
+                              (course.get("courseName") or "").strip()))
+
+    def chapter(self, chapter, course):
+        self.stats["chapters"] += 1
+
+    def section(self, section, chapter, course, stage):
+        self.stats["sections"] += 1
+
+    def end(self):
+        stats = dict(self.stats)
+        stats["durationText"] = format_duration(stats["duration"])
+        longest = sorted(self._courses, key=lambda c: (-c[0], c[1]))[:self.TOP_COURSES]
+        stats["longestCourses"] = [{"id": c[2], "courseName": c[3], "duration": c[0]} for c in longest]
+        with open_buffered(self.output_file) as f:
+            json.dump(stats, f, ensure_ascii=False, indent=2)
+        return [self.output_file]
+
+
+# 可以通过名称选择的附加目标及其默认文件名
+SINK_TYPES = {
+    CatalogSink.name: (CatalogSink, "course_catalog.md"),
+    JsonlSink.name: (JsonlSink, "course_outline.jsonl"),
+    StatsSink.name: (StatsSink, "course_stats.json"),
+}
+
+
+def create_sinks(names: List[str], output_dir: str) -> List[RenderSink]:
+    """按名称创建附加输出目标，文件写入output_dir"""
+    sinks = []
+    for name in names:
+        if name not in SINK_TYPES:
+            raise ValueError(f"未知的输出目标: {name}，可选: {', '.join(SINK_TYPES)}")
+        sink_type, file_name = SINK_TYPES[name]
+        sinks.append(sink_type(os.path.join(output_dir, file_name)))
+    return sinks
@@ -2,36 +2,311 @@
 # -*- coding: utf-8 -*-
 
 import requests
+from requests.adapters import HTTPAdapter
 import json
+import logging
+import lzma
 import os
-from typing import Dict, Any, List, Optional
+import threading
+from typing import Dict, Any, List, Optional, Callable
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import islice
+from datetime import datetime
+
+from mca_transport import (RequestHedger, Cassette, RecordingAdapter, ReplayAdapter, CircuitBreaker,
+                           CircuitOpenError, SessionPool)
+from mca_profiler import PhaseProfiler, profiled
+from mca_index import OutlineIndex, index_path_for, course_key
+from mca_lazy import LazyOutline
+from mca_media import MediaProber, merge_media_info, media_manifest
+from mca_pack import PackReader, PackCacheAdapter
+from mca_trace import Tracer, traced, SPAN_KIND_CLIENT
+from mca_render import (MarkdownSink, CatalogSink, CATALOG_HEADER, SINK_TYPES, catalog_entry, catalog_summary,
+                        create_sinks, render_outline)
+from mca_search import select_package
+from mca_schedule import EnrichBudget, prioritize, parse_priority, mark_pending, is_pending, ENRICH_STATUS_KEY
+from mca_storage import (ObjectStore, hydrate_if_manifest, load_json_file, write_json_file, atomic_write,
+                         externalize_descriptions, resolve_description_blobs, find_existing, COMPRESSION_SUFFIXES,
+                         is_compact_json_file, write_pretty_copy)
+from mca_workspace import Workspace, WorkspaceBusyError, make_key
+
+logger = logging.getLogger("mca")
 
 class MCARequest:
-    def __init__(self):
-        self.session = requests.Session()
+    def __init__(self, hedging: bool = False, timeouts: Optional[Dict[str, float]] = None,
+                 profiler: Optional[PhaseProfiler] = None, verbose: bool = False,
+                 progress: Optional[Callable[[str, int, int, str], None]] = None,
+                 tracer: Optional[Tracer] = None):
+        """
+        Args:
+            hedging: 是否对慢请求发出对冲请求
+            timeouts: 按接口模板覆盖默认截止时间（秒），如 {"courseWeb/{id}/pc": 10}
+            profiler: 分阶段性能分析器，默认不启用
+            verbose: 是否在控制台打印过程信息（命令行模式），否则只写入logging
+            progress: 进度回调，参数为 (阶段, 已完成数, 总数, 当前项名称)
+            tracer: 按课程的结构化追踪，默认不启用
+        """
+        self.verbose = verbose
+        self.progress = progress
+        # 会话池，默认只有一个会话；self.session指向池中第一个会话
+        self.sessions = SessionPool.single()
+        self.session = self.sessions.primary
         self.data_dir = "data"
         self.ensure_data_dir()
         self.base_url = "https://gateway.mashibing.com"
         self.current_outline = None
-        
+        self.hedger = RequestHedger(hedging=hedging, timeouts=timeouts)
+        # 按接口统计错误率并熔断，状态保存在数据目录中，跨运行保留
+        self.breaker = CircuitBreaker(state_file=os.path.join(self.data_dir, "endpoint_health.json"))
+        self.profiler = profiler or PhaseProfiler()
+        self.tracer = tracer or Tracer()
+        # 丰富时是否获取所有版本的章节信息（默认只取第一个版本）
+        self.all_versions = False
+        # 设置为ObjectStore后，丰富结果还会保存为按内容寻址的快照清单
+        self.object_store = None
+        # 课程包列表分页大小和并发获取页面的线程数
+        self.package_page_size = 100
+        self.package_workers = 4
+        # 丰富课程时并发获取的线程数，1表示逐个获取
+        self.enrich_workers = 1
+        # 丰富时的课程优先级规则和时间/请求数预算，预算用尽时其余课程标记为待获取
+        self.enrich_priority = None
+        self.enrich_budget = EnrichBudget()
+        # 已发出的请求数（不含对冲请求）
+        self.requests_sent = 0
+        self._request_count_lock = threading.Lock()
+        # 获取失败的课程（死信队列）
+        self.dead_letters = []
+        self._dead_letter_lock = threading.Lock()
+        # 丰富结果的压缩格式（None、"gz"或"xz"），以及是否把描述字段外置到单独文件
+        self.output_compression = None
+        self.externalize_descriptions = False
+        # 不压缩时也以紧凑格式保存丰富结果（使用C编码器，需要阅读时用--pretty-json生成格式化副本）
+        self.json_compact = False
+        self.cassette = None
+        self.recording = False
+        # 缓存包及当前挂载的（缓存查找之下的）适配器
+        self.cache_pack = None
+        self._base_adapter = None
+        # 最近一次丰富结果的保存路径
+        self.last_enriched_file = None
+        # 当前使用的工作区，None表示直接写入数据目录
+        self.workspace = None
+        # 选择课程包时使用即时过滤界面，False时按原有方式列出全部课程包
+        self.selection_filter = True
+        # 按需丰富：只在访问课程时获取其信息，lazy_prefetch为访问某个课程时预取其后的课程数
+        self.lazy = False
+        self.lazy_prefetch = 2
+        # 探测视频资源时的总并发数、每个主机的并发数，以及是否把探测结果缓存到数据目录
+        self.media_workers = 32
+        self.media_per_host = 8
+        self.media_cache = True
+        
+    def _log(self, message: str = "", end: str = "\n"):
+        """输出过程信息：命令行模式下打印到控制台，库模式下交给logging（默认不输出）"""
+        if self.verbose:
+            print(message, end=end)
+        elif logger.isEnabledFor(logging.INFO):
+            logger.info(message.strip())
+    
+    def _report_progress(self, stage: str, done: int, total: int, name: str):
+        """调用进度回调，命令行模式下同时在同一行刷新进度"""
+        if self.progress:
+            self.progress(stage, done, total, name)
+        if not self.verbose:
+            return
+        if stage == "retry":
+            print(f"\r重试进度: {done}/{total} - 当前: {name}", end="")
+        else:
+            print(f"\r处理进度: {done}/{total} ({done / total * 100:.1f}%) - 当前: {name}", end="")
+    
     def ensure_data_dir(self):
         """确保数据目录存在"""
         if not os.path.exists(self.data_dir):
             os.makedirs(self.data_dir)
     
-    def fetch_course_packages(self) -> Dict[str, Any]:
-        """获取课程包信息"""
+    def _request(self, method: str, endpoint: str, url: str, **kwargs) -> requests.Response:
+        """发送请求，应用接口截止时间，GET请求按需对冲
+        
+        接口处于熔断状态时直接抛出CircuitOpenError，不发出请求。
+        
+        Args:
+            method: HTTP方法，如GET、POST
+            endpoint: 接口模板名称，用于选择截止时间和统计延迟
+            url: 请求地址
+            **kwargs: 传给requests的其它参数
+        """
+        if not self.breaker.allow(endpoint):
+            raise CircuitOpenError(f"接口 {endpoint} 处于熔断状态，暂不发送请求")
+        with self._request_count_lock:
+            self.requests_sent += 1
+        attempts = []
+        reserved = []
+        
+        def send(url, **kw):
+            # 第一次发送使用已占用的身份，对冲请求从会话池中重新选择身份
+            attempts.append(url)
+            with self._request_count_lock:
+                member = reserved.pop() if reserved else None
+            return self.sessions.request(method, url, member=member, **kw)
+        
+        with self.tracer.span(f"{method.upper()} {endpoint}", SPAN_KIND_CLIENT, **{
+                "http.request.method": method.upper(), "http.route": endpoint, "url.full": url}) as span:
+            try:
+                with self.profiler.phase("fetch"):
+                    # 先占用身份并等待其速率限制或冷却结束，再开始截止时间和对冲的计时
+                    reserved.append(self.sessions.acquire())
+                    response = self.hedger.request(endpoint, send, url, hedge=method.upper() == "GET", **kwargs)
+            except Exception:
+                with self._request_count_lock:
+                    unused = reserved.pop() if reserved else None
+                if unused is not None:
+                    self.sessions.release(unused)
+                self.breaker.record(endpoint, False)
+                span.set_attribute("mca.attempts", len(attempts))
+                raise
+            
+            # 5xx和429视为接口异常，计入错误率
+            self.breaker.record(endpoint, response.status_code < 500 and response.status_code != 429)
+            # 对冲请求算作重试；命中缓存包的请求没有访问网络
+            span.set_attributes({
+                "url.full": response.url,
+                "http.response.status_code": response.status_code,
+                "http.response.body.size": len(response.content),
+                "mca.attempts": len(attempts),
+                "mca.retries": max(0, len(attempts) - 1),
+                "mca.cache_hit": isinstance(response.connection, PackCacheAdapter),
+            })
+            if response.status_code >= 400:
+                span.set_error(f"HTTP {response.status_code}")
+        return response
+    
+    def _decode_json(self, response: requests.Response) -> Any:
+        """解析响应中的JSON"""
+        with self.profiler.phase("json_decode"), self.tracer.span("json_decode", **{"mca.bytes": len(response.content)}):
+            return response.json()
+    
+    def use_workspace(self, workspace: Workspace, wait: Optional[float] = 0):
+        """改为在独立的工作区中读写运行结果，并在运行期间持有工作区的锁
+        
+        熔断状态和快照对象存储仍在数据根目录中共享。
+        
+        Args:
+            workspace: 工作区
+            wait: 工作区被占用时等待的秒数，0表示立即失败
+        
+        Raises:
+            WorkspaceBusyError: 工作区正在被另一个运行使用
+        """
+        if self.workspace is not None:
+            self.workspace.close()
+        self.workspace = workspace.open(wait)
+        self.data_dir = workspace.path
+        self._log(f"工作区: {workspace.path}")
+    
+    def _publish(self):
+        """使用工作区时，把工作区记为最新结果（在产物写完之后调用）"""
+        if self.workspace is not None:
+            self.workspace.publish()
+    
+    def use_session_pool(self, pool: SessionPool):
+        """改用多身份会话池发送请求，需在设置并发数和录制/回放之前调用"""
+        self.sessions = pool
+        self.session = pool.primary
+    
+    def _mount(self, adapter):
+        """挂载适配器；使用缓存包时在外面包一层缓存查找，未命中的请求交给该适配器"""
+        self._base_adapter = adapter
+        if self.cache_pack is not None:
+            adapter = PackCacheAdapter(self.cache_pack, adapter)
+        self.sessions.mount(adapter)
+    
+    def _http_adapter(self):
+        """发出真实请求的适配器（录制时为RecordingAdapter），连接池大小跟随丰富并发数"""
+        pool_options = {"pool_connections": 4, "pool_maxsize": max(10, self.enrich_workers * 2)}
+        if self.cassette is not None and self.recording:
+            return RecordingAdapter(self.cassette, **pool_options)
+        return HTTPAdapter(**pool_options)
+    
+    def set_enrich_workers(self, workers: int):
+        """设置丰富课程时的并发线程数，并相应扩大连接池（录制时同样扩大录制适配器的连接池）"""
+        self.enrich_workers = max(1, workers)
+        # 对冲请求在线程池中发出，线程数要跟上并发数
+        self.hedger.max_workers = max(self.hedger.max_workers, self.enrich_workers * 2)
+        # 回放不使用连接池
+        if not self.cassette or self.recording:
+            self._mount(self._http_adapter())
+    
+    def enable_cache_pack(self, pack_path: str):
+        """使用其他节点导出的缓存包：版本列表和课程详情请求先在缓存包中查找，命中时不访问网络
+        
+        Args:
+            pack_path: 缓存包路径（python mca_pack.py build 生成）
+        """
+        self.cache_pack = PackReader(pack_path)
+        self._mount(self._base_adapter or self._http_adapter())
+        self._log(f"缓存包: 从 {pack_path} 读取 {len(self.cache_pack)} 个响应")
+    
+    def enable_recording(self, cassette_path: str):
+        """录制之后的所有请求和响应，调用save_cassette写入文件
+        
+        Args:
+            cassette_path: 录制文件路径（gzip压缩的JSON Lines）
+        """
+        self.cassette = Cassette(cassette_path)
+        self.recording = True
+        self._mount(self._http_adapter())
+        self._log(f"录制模式: 请求和响应将保存到 {cassette_path}")
+    
+    def enable_replay(self, cassette_path: str, latency=None, bandwidth: Optional[float] = None):
+        """从录制文件离线回放所有请求
+        
+        Args:
+            cassette_path: 录制文件路径
+            latency: 模拟延迟；None不延迟，"recorded"按录制耗时，数字为固定秒数
+            bandwidth: 模拟带宽（字节/秒），None表示不限制
+        """
+        self.cassette = Cassette.load(cassette_path)
+        self.recording = False
+        self._mount(ReplayAdapter(self.cassette, latency=latency, bandwidth=bandwidth))
+        self._log(f"回放模式: 从 {cassette_path} 读取 {self.cassette.count} 条录制的响应")
+    
+    def save_cassette(self):
+        """录制模式下将录制内容写入文件"""
+        if self.cassette and self.recording:
+            self.cassette.save()
+            self._log(f"已录制 {self.cassette.count} 个请求到: {self.cassette.path}")
+    
+    def print_request_stats(self):
+        """打印各接口的延迟、对冲和浪费请求统计，以及熔断状态"""
+        if self.hedger.stats:
+            self._log("\n" + self.hedger.format_report())
+        if any(c['trips'] or c['state'] != 'closed' for c in self.breaker.report().values()):
+            self._log("\n" + self.breaker.format_report())
+        if len(self.sessions.members) > 1:
+            self._log("\n" + self.sessions.format_report())
+        adapter = self.session.get_adapter(self.base_url)
+        if isinstance(adapter, PackCacheAdapter):
+            self._log(f"\n缓存包: 命中 {adapter.hits} 次，未命中 {adapter.misses} 次")
+    
+    def fetch_course_packages(self, page_index: int = 1, page_size: int = 999) -> Dict[str, Any]:
+        """获取课程包信息
+        
+        Args:
+            page_index: 页码，从1开始
+            page_size: 每页数量
+        """
         url = f"{self.base_url}/edu-course/coursePackage/homePage"
         params = {
-            "length": 999,
-            "pageIndex": 1
+            "length": page_size,
+            "pageIndex": page_index
         }
         
-        response = self.session.get(url, params=params)
+        response = self._request("GET", "coursePackage/homePage", url, params=params)
         response.raise_for_status()
         
-        result = response.json()
+        result = self._decode_json(response)
         
         # 不再保存到文件
         return result
@@ -43,16 +318,20 @@ class MCARequest:
             "coursePackageId": course_package_id
         }
         
-        response = self.session.get(url, params=params)
+        response = self._request("GET", "coursePackageVersion", url, params=params)
         response.raise_for_status()
         
-        result = response.json()
+        result = self._decode_json(response)
         
         # 不再保存到文件
         return result
     
     def fetch_course_outline(self, outline_id=None):
-        """获取课程大纲"""
+        """获取课程大纲
+        
+        Returns:
+            list: 阶段列表、课程列表或嵌套大纲的子节点，未找到时返回None
+        """
         url = f"{self.base_url}/api/course/outline/get"
         
         if not outline_id:
@@ -67,14 +346,14 @@ class MCARequest:
                 "clientTime": int(time.time() * 1000)
             }
         
-        response = self.session.post(url, json=request_data)
+        response = self._request("POST", "course/outline/get", url, json=request_data)
         if response.status_code != 200:
-            print(f"获取课程大纲失败: HTTP {response.status_code}")
+            self._log(f"获取课程大纲失败: HTTP {response.status_code}")
             return None
         
-        data = response.json()
+        data = self._decode_json(response)
         if data.get('code') != 0:
-            print(f"获取课程大纲失败: {data.get('message', '未知错误')}")
+            self._log(f"获取课程大纲失败: {data.get('message', '未知错误')}")
             return None
         
         # 提取大纲数据
@@ -83,8 +362,7 @@ class MCARequest:
         # 首先尝试获取stageList（阶段列表）
         stage_list = data.get('stageList', [])
         if stage_list:
-            print(f"找到课程阶段列表，共{len(stage_list)}个阶段")
-            self.display_course_outline(stage_list)
+            self._log(f"找到课程阶段列表，共{len(stage_list)}个阶段")
             # 保存完整大纲数据供后续使用
             self.current_outline = stage_list
             return stage_list
@@ -92,8 +370,7 @@ class MCARequest:
         # 如果没有stageList，尝试获取courseItemList（课程列表）
         course_list = data.get('courseItemList', [])
         if course_list:
-            print(f"找到课程列表，共{len(course_list)}个课程")
-            self.display_course_outline(course_list)
+            self._log(f"找到课程列表，共{len(course_list)}个课程")
             # 保存完整大纲数据供后续使用
             self.current_outline = course_list
             return course_list
@@ -102,71 +379,121 @@ class MCARequest:
         outline = data.get('outline', {})
         children = outline.get('children', [])
         if children:
-            print("找到嵌套结构大纲")
-            self.display_course_outline(children)
+            self._log("找到嵌套结构大纲")
             # 保存完整大纲数据供后续使用
             self.current_outline = children
             return children
         
-        print("未找到课程大纲数据")
+        self._log("未找到课程大纲数据")
         return None
     
+    def iter_course_packages(self, first_page: Optional[Dict[str, Any]] = None):
+        """分页获取课程包，逐个返回课程包
+        
+        先获取第一页，根据totalElements并发获取其余页面。页面按到达顺序缓存，
+        但总是按页码顺序返回，因此编号稳定，且第一页到达后即可开始显示。
+        
+        Args:
+            first_page: 已获取的第一页响应，为None时自动获取
+        """
+        page_size = self.package_page_size
+        if first_page is None:
+            first_page = self.fetch_course_packages(1, page_size)
+        
+        data_obj = first_page.get('data')
+        if not isinstance(data_obj, dict) or not isinstance(data_obj.get('content'), list):
+            return
+        
+        first_content = data_obj['content']
+        yield from first_content
+        
+        total = data_obj.get('totalElements') or 0
+        if not first_content or total <= len(first_content):
+            return
+        page_count = (total + page_size - 1) // page_size
+        
+        executor = ThreadPoolExecutor(max_workers=self.package_workers)
+        futures = {executor.submit(self.fetch_course_packages, page, page_size): page
+                   for page in range(2, page_count + 1)}
+        try:
+            pages = {}
+            next_page = 2
+            for future in as_completed(futures):
+                result = future.result()
+                content = (result.get('data') or {}).get('content') or []
+                pages[futures[future]] = content
+                while next_page in pages:
+                    yield from pages.pop(next_page)
+                    next_page += 1
+        finally:
+            # 调用方提前停止迭代时，取消尚未开始的请求
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+    
     def load_course_packages(self) -> Dict[str, Any]:
-        """获取课程包信息，不再从文件加载"""
-        print("获取课程包数据...")
-        return self.fetch_course_packages()
+        """获取课程包信息，不再从文件加载
+        
+        响应为分页结构时，会取回所有页面并合并到data.content中。
+        """
+        self._log("获取课程包数据...")
+        first_page = self.fetch_course_packages(1, self.package_page_size)
+        data_obj = first_page.get('data')
+        if isinstance(data_obj, dict) and isinstance(data_obj.get('content'), list):
+            data_obj['content'] = list(self.iter_course_packages(first_page))
+        return first_page
     
     def load_course_package_versions(self, course_package_id: str) -> Dict[str, Any]:
         """获取课程包版本列表，不再从文件加载"""
-        print(f"获取课程包ID {course_package_id} 的版本列表...")
+        self._log(f"获取课程包ID {course_package_id} 的版本列表...")
         return self.fetch_course_package_versions(course_package_id)
     
     def load_course_outline(self, course_id: str, package_version_id: str) -> Dict[str, Any]:
         """加载已保存的课程大纲"""
-        file_path = os.path.join(self.data_dir, f"course_outline_{course_id}_{package_version_id}.json")
+        file_path = find_existing(os.path.join(self.data_dir, f"course_outline_{course_id}_{package_version_id}.json"))
         if not os.path.exists(file_path):
             raise FileNotFoundError(f"文件不存在: {file_path}，请先获取课程大纲数据")
         
-        with open(file_path, "r", encoding="utf-8") as f:
-            return json.load(f)
+        return hydrate_if_manifest(load_json_file(file_path, resolve_blobs=True), file_path)
     
+    @profiled("load_packages")
     def get_course_list(self) -> List[Dict[str, Any]]:
         """获取课程列表"""
         data = self.load_course_packages()
         
         # 打印JSON的顶层结构，以便了解数据格式
-        print("\n数据结构分析:")
-        print("顶层键:", list(data.keys()))
+        self._log("\n数据结构分析:")
+        self._log(f"顶层键: {list(data.keys())}")
         
         if 'data' in data:
-            print("data字段类型:", type(data['data']).__name__)
+            self._log(f"data字段类型: {type(data['data']).__name__}")
             data_obj = data['data']
             
             if isinstance(data_obj, dict):
-                print("data字段的键:", list(data_obj.keys()))
+                self._log(f"data字段的键: {list(data_obj.keys())}")
                 
                 # 检查data.content字段
                 if 'content' in data_obj:
-                    print("content字段类型:", type(data_obj['content']).__name__)
+                    self._log(f"content字段类型: {type(data_obj['content']).__name__}")
                     if isinstance(data_obj['content'], list):
-                        print("content长度:", len(data_obj['content']))
+                        self._log(f"content长度: {len(data_obj['content'])}")
                         if data_obj['content'] and isinstance(data_obj['content'][0], dict):
-                            print("第一个content项的键:", list(data_obj['content'][0].keys()))
+                            self._log(f"第一个content项的键: {list(data_obj['content'][0].keys())}")
                             # 如果content存在且是列表，返回它
                             return data_obj['content']
                 
                 if 'list' in data_obj:
-                    print("list字段类型:", type(data_obj['list']).__name__)
-                    print("list长度:", len(data_obj['list']) if isinstance(data_obj['list'], list) else "不是列表")
+                    self._log(f"list字段类型: {type(data_obj['list']).__name__}")
+                    self._log(f"list长度: {len(data_obj['list']) if isinstance(data_obj['list'], list) else '不是列表'}")
                     
                     if isinstance(data_obj['list'], list) and len(data_obj['list']) > 0:
-                        print("第一个列表项的键:", list(data_obj['list'][0].keys()) if isinstance(data_obj['list'][0], dict) else "不是字典")
+                        self._log(f"第一个列表项的键: {list(data_obj['list'][0].keys()) if isinstance(data_obj['list'][0], dict) else '不是字典'}")
                         return data_obj['list']
             
             elif isinstance(data_obj, list):
-                print("data是列表，长度:", len(data_obj))
+                self._log(f"data是列表，长度: {len(data_obj)}")
                 if data_obj and isinstance(data_obj[0], dict):
-                    print("第一个列表项的键:", list(data_obj[0].keys()))
+                    self._log(f"第一个列表项的键: {list(data_obj[0].keys())}")
                     return data_obj
             
             # 优先检查content字段
@@ -179,22 +506,23 @@ class MCARequest:
                 return data_obj
         
         # 如果找不到标准路径，尝试在JSON中搜索可能的课程列表
-        print("\n尝试查找可能包含课程的列表...")
+        self._log("\n尝试查找可能包含课程的列表...")
         for key, value in data.items():
             if isinstance(value, list) and value and isinstance(value[0], dict) and 'title' in value[0]:
-                print(f"找到可能的列表在键 '{key}'，长度: {len(value)}")
+                self._log(f"找到可能的列表在键 '{key}'，长度: {len(value)}")
                 return value
             elif isinstance(value, dict):
                 for subkey, subvalue in value.items():
                     if isinstance(subvalue, list) and subvalue and isinstance(subvalue[0], dict) and 'title' in subvalue[0]:
-                        print(f"找到可能的列表在键 '{key}.{subkey}'，长度: {len(subvalue)}")
+                        self._log(f"找到可能的列表在键 '{key}.{subkey}'，长度: {len(subvalue)}")
                         return subvalue
         
         return []
     
+    @profiled("load_versions")
     def get_course_package_versions(self, course_package_id: str) -> List[Dict[str, Any]]:
         """获取课程包版本列表"""
-        print(f"获取课程包ID {course_package_id} 的版本列表...")
+        self._log(f"获取课程包ID {course_package_id} 的版本列表...")
         data = self.fetch_course_package_versions(course_package_id)
 
         if 'data' in data and isinstance(data['data'], list):
@@ -203,65 +531,10 @@ class MCARequest:
         
         return []
     
+    @profiled("fetch_outline")
     def get_course_outline(self, outline_id=None):
-        """获取课程大纲"""
-        url = f"{self.base_url}/api/course/outline/get"
-        
-        if not outline_id:
-            # 获取默认大纲
-            request_data = {
-                "clientTime": int(time.time() * 1000)
-            }
-        else:
-            # 获取特定大纲
-            request_data = {
-                "outlineId": outline_id,
-                "clientTime": int(time.time() * 1000)
-            }
-        
-        response = self.session.post(url, json=request_data)
-        if response.status_code != 200:
-            print(f"获取课程大纲失败: HTTP {response.status_code}")
-            return None
-        
-        data = response.json()
-        if data.get('code') != 0:
-            print(f"获取课程大纲失败: {data.get('message', '未知错误')}")
-            return None
-        
-        # 提取大纲数据
-        data = data.get('data', {})
-        
-        # 首先尝试获取stageList（阶段列表）
-        stage_list = data.get('stageList', [])
-        if stage_list:
-            print(f"找到课程阶段列表，共{len(stage_list)}个阶段")
-            self.display_course_outline(stage_list)
-            # 保存完整大纲数据供后续使用
-            self.current_outline = stage_list
-            return stage_list
-        
-        # 如果没有stageList，尝试获取courseItemList（课程列表）
-        course_list = data.get('courseItemList', [])
-        if course_list:
-            print(f"找到课程列表，共{len(course_list)}个课程")
-            self.display_course_outline(course_list)
-            # 保存完整大纲数据供后续使用
-            self.current_outline = course_list
-            return course_list
-        
-        # 如果上述都没有，尝试获取嵌套结构的大纲
-        outline = data.get('outline', {})
-        children = outline.get('children', [])
-        if children:
-            print("找到嵌套结构大纲")
-            self.display_course_outline(children)
-            # 保存完整大纲数据供后续使用
-            self.current_outline = children
-            return children
-        
-        print("未找到课程大纲数据")
-        return None
+        """获取课程大纲（旧API），只返回数据，显示由调用方负责"""
+        return self.fetch_course_outline(outline_id)
     
     def check_other_course_fields(self, data_obj: Dict[str, Any]):
         """检查数据中其他可能包含课程信息的字段"""
@@ -305,41 +578,72 @@ class MCARequest:
                 if 'content' in data_obj and isinstance(data_obj.get('content'), list):
                     print(f"返回列表项数: {len(data_obj.get('content'))}")
     
-    def show_course_selection(self) -> Optional[Dict[str, Any]]:
-        """显示课程选择界面"""
-        courses = self.get_course_list()
+    def _print_course_package(self, index: int, course: Dict[str, Any]):
+        """打印课程列表中的一项"""
+        # 优先使用title字段获取课程名称
+        title = course.get('title', '未知名称')
+        if not title:  # 如果title为空，尝试其他可能的字段名
+            title = course.get('name', course.get('packageName', course.get('courseName', '未知名称')))
+        price = course.get('price', course.get('actualPrice', 0))
+        description = course.get('description', '无描述')
         
-        if not courses:
-            print("没有找到课程数据")
-            # 另一种可能：data字段中可能没有列表，而是单个对象
-            data = self.load_course_packages()
-            if 'data' in data and isinstance(data['data'], dict):
-                print("\n检查data字段是否为单个课程...")
-                if 'title' in data['data']:
-                    print(f"找到单个课程: {data['data'].get('title')}")
-                    return [data['data']]
-            return None
+        # 格式化输出，限制描述长度以避免太长
+        max_desc_length = 50
+        if len(description) > max_desc_length:
+            description = description[:max_desc_length] + "..."
         
-        print("\n" + "="*80)
-        print("课程列表".center(78))
-        print("="*80)
+        print(f"{index:3}. {title} (价格: ¥{price})")
+        print(f"    描述: {description}")
+        print(f"    {'--'*39}")
+    
+    def show_course_selection(self) -> Optional[Dict[str, Any]]:
+        """显示课程选择界面
+        
+        selection_filter为True时，第一页到达后即进入即时过滤界面（按标题、描述和ID过滤，分页显示），
+        其余页面在后台加载并加入索引；否则列出全部课程包后按编号选择。
+        """
+        if self.selection_filter:
+            print("获取课程包数据...")
+            packages = self.iter_course_packages()
+            first_page = list(islice(packages, self.package_page_size))
+            if first_page:
+                return select_package(first_page, more=packages)
+            courses = self.get_course_list()
+            if courses:
+                return select_package(courses)
+        
+        # 分页获取课程包，第一页到达后立即开始显示
+        print("获取课程包数据...")
+        courses = []
+        for course in self.iter_course_packages():
+            if not courses:
+                print("\n" + "="*80)
+                print("课程列表".center(78))
+                print("="*80)
+            courses.append(course)
+            self._print_course_package(len(courses), course)
         
-        for i, course in enumerate(courses, 1):
-            # 优先使用title字段获取课程名称
-            title = course.get('title', '未知名称')
-            if not title:  # 如果title为空，尝试其他可能的字段名
-                title = course.get('name', course.get('packageName', course.get('courseName', '未知名称')))
-            price = course.get('price', course.get('actualPrice', 0))
-            description = course.get('description', '无描述')
+        if not courses:
+            # 响应不是分页结构时，按原有方式分析数据结构
+            courses = self.get_course_list()
+            
+            if not courses:
+                print("没有找到课程数据")
+                # 另一种可能：data字段中可能没有列表，而是单个对象
+                data = self.load_course_packages()
+                if 'data' in data and isinstance(data['data'], dict):
+                    print("\n检查data字段是否为单个课程...")
+                    if 'title' in data['data']:
+                        print(f"找到单个课程: {data['data'].get('title')}")
+                        return [data['data']]
+                return None
             
-            # 格式化输出，限制描述长度以避免太长
-            max_desc_length = 50
-            if len(description) > max_desc_length:
-                description = description[:max_desc_length] + "..."
+            print("\n" + "="*80)
+            print("课程列表".center(78))
+            print("="*80)
             
-            print(f"{i:3}. {title} (价格: ¥{price})")
-            print(f"    描述: {description}")
-            print(f"    {'--'*39}")
+            for i, course in enumerate(courses, 1):
+                self._print_course_package(i, course)
         
         print("="*80)
         print("0. 退出")
@@ -637,11 +941,12 @@ class MCARequest:
         
         print("="*80)
 
-    def extract_course_structure(self, outline_data) -> List[Dict[str, Any]]:
+    def extract_course_structure(self, outline_data, probe_media: bool = False) -> List[Dict[str, Any]]:
         """提取课程结构，生成扁平化目录
         
         Args:
             outline_data: 课程大纲数据
+            probe_media: 是否并发探测视频资源，并把可访问性、内容长度和内容类型合并到视频项中
             
         Returns:
             List[Dict[str, Any]]: 扁平化的课程结构
@@ -709,87 +1014,328 @@ class MCARequest:
             for item in outline_data:
                 process_item(item)
         
+        if probe_media:
+            self.probe_media(result)
         return result
+    
+    def probe_media(self, flat_structure: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """并发探测扁平化结构中的视频资源，结果合并到对应的视频项中
         
-    def generate_course_catalog(self, course_outline, output_file=None):
-        """生成课程目录并输出到文件
+        Args:
+            flat_structure: extract_course_structure的结果
+        
+        Returns:
+            list: 合并了探测结果的同一个列表
+        """
+        urls = [item['video_url'] for item in flat_structure if item['is_video'] and item['video_url']]
+        cache_file = os.path.join(self.data_dir, "media_probe_cache.json") if self.media_cache else None
+        started = time.time()
+        with MediaProber(workers=self.media_workers, per_host=self.media_per_host, cache_file=cache_file) as prober:
+            results = prober.probe_all(urls, lambda done, total, url: self._report_progress("media", done, total, url))
+            stats = prober.stats
+        self._log(f"\n视频资源探测: {len(results)} 个URL，探测 {stats['probed']} 个，缓存命中 {stats['cached']} 个，"
+                  f"不可访问 {stats['unreachable']} 个，用时 {time.time() - started:.1f}秒")
+        return merge_media_info(flat_structure, results)
+    
+    def build_media_manifest(self, course_outline, output_file: Optional[str] = None) -> Dict[str, Any]:
+        """探测课程大纲中的全部视频资源，生成包含内容长度、内容类型和可访问性的视频资源清单
         
         Args:
-            course_outline: 课程大纲数据
-            output_file: 输出文件路径，默认为None（不输出到文件）
+            course_outline: 课程大纲数据（与extract_course_structure的输入相同）
+            output_file: 清单文件路径，默认为data/media_manifest.json
+        
+        Returns:
+            dict: 视频资源清单
+        
+        Raises:
+            ValueError: 大纲中没有视频项（stageList格式的大纲和丰富后的JSON不包含视频地址）
         """
         flat_structure = self.extract_course_structure(course_outline)
+        if not any(item['is_video'] for item in flat_structure):
+            raise ValueError("大纲中没有视频项：需要children树中itemType为Video并带有resources的大纲，"
+                             "stageList格式的大纲和丰富后的JSON不包含视频地址")
+        self.probe_media(flat_structure)
+        manifest = media_manifest(flat_structure)
+        if output_file is None:
+            output_file = os.path.join(self.data_dir, "media_manifest.json")
+        atomic_write(output_file, json.dumps(manifest, ensure_ascii=False, indent=2).encode("utf-8"))
+        self._log(f"视频资源清单已保存到: {output_file}（{manifest['videoCount']} 个视频，"
+                  f"不可访问 {manifest['unreachableCount']} 个，共 {manifest['totalBytes'] / 1024 / 1024:.1f}MB）")
+        return manifest
         
-        # 准备目录文本
-        catalog_lines = []
-        catalog_lines.append("# 课程目录\n")
+    def generate_course_catalog(self, course_outline, output_file=None):
+        """生成课程目录并输出到文件
         
-        total_duration = 0
-        video_count = 0
+        丰富后的JSON（{"msg", "code", "data"}）通过render_outline的目录目标（CatalogSink）生成，
+        与--render catalog的输出相同。
         
-        for item in flat_structure:
-            indent = "  " * item['level']
-            title = item['title']
-            item_type = item['type']
+        Args:
+            course_outline: 课程大纲数据
+            output_file: 输出文件路径，默认为None（不输出到文件）
+        """
+        if isinstance(course_outline, dict) and "data" in course_outline:
+            sink = CatalogSink()
+            render_outline(course_outline, [sink], self.profiler, self.tracer)
+            catalog_text = sink.text
+        else:
+            flat_structure = self.extract_course_structure(course_outline)
             
-            # 为视频添加时长信息
-            if item['is_video']:
-                duration = item['duration']
-                total_duration += duration
-                video_count += 1
-                
-                # 将秒转换为分钟:秒
-                minutes = duration // 60
-                seconds = duration % 60
-                duration_str = f"({minutes:02d}:{seconds:02d})"
-                
-                line = f"{indent}- [{title}] {duration_str}"
-            else:
-                line = f"{indent}- **{title}**"
+            # 准备目录文本
+            catalog_lines = [CATALOG_HEADER]
             
-            catalog_lines.append(line)
-        
-        # 添加统计信息
-        hours = total_duration // 3600
-        minutes = (total_duration % 3600) // 60
-        seconds = total_duration % 60
-        
-        catalog_lines.append(f"\n## 统计信息")
-        catalog_lines.append(f"- 视频数量: {video_count}个")
-        catalog_lines.append(f"- 总时长: {hours}小时{minutes}分钟{seconds}秒")
+            total_duration = 0
+            video_count = 0
+            
+            for item in flat_structure:
+                # 为视频添加时长信息
+                if item['is_video']:
+                    total_duration += item['duration']
+                    video_count += 1
+                    catalog_lines.append(catalog_entry(item['title'], item['level'], item['duration']))
+                else:
+                    catalog_lines.append(catalog_entry(item['title'], item['level']))
+            
+            # 添加统计信息
+            catalog_lines.append(catalog_summary(video_count, total_duration))
+            catalog_text = "\n".join(catalog_lines)
         
         # 打印目录
-        catalog_text = "\n".join(catalog_lines)
-        print(catalog_text)
+        self._log(catalog_text)
         
         # 如果指定了输出文件，将目录写入文件
         if output_file:
             with open(output_file, 'w', encoding='utf-8') as f:
                 f.write(catalog_text)
-            print(f"\n目录已保存到: {output_file}")
+            self._log(f"\n目录已保存到: {output_file}")
         
         return catalog_text
 
+    @profiled("fetch_outline")
     def fetch_course_child(self, course_id: str, package_version_id: str) -> Dict[str, Any]:
         """通过systemCourse/child API获取课程大纲"""
         # 直接将参数拼接到URL中，而不是使用params参数
         url = f"{self.base_url}/edu-course/systemCourse/child/{course_id}?coursePackageVersionId={package_version_id}"
         
-        response = self.session.get(url)
+        try:
+            response = self._request("GET", "systemCourse/child", url)
+        except CircuitOpenError as e:
+            # 新接口近期持续出错，直接交给调用方使用旧接口
+            self._log(f"跳过新API: {e}")
+            return None
+        except requests.RequestException as e:
+            self._log(f"获取课程大纲失败: {e}")
+            return None
         
         if response.status_code != 200:
-            print(f"获取课程大纲失败: HTTP {response.status_code}")
+            self._log(f"获取课程大纲失败: HTTP {response.status_code}")
             return None
         
-        result = response.json()
+        result = self._decode_json(response)
         
         if result.get('code') != 200:
-            print(f"获取课程大纲失败: {result.get('message', '未知错误')}")
+            self._log(f"获取课程大纲失败: {result.get('message', '未知错误')}")
             return None
         
         # 不再保存中间文件，直接返回数据
         return result.get('data', {})
 
+    def _record_failure(self, course_id: str, endpoint: str, status, error: str, **extra):
+        """把获取失败的课程记录到死信队列，丰富结束后写入死信文件"""
+        entry = {
+            'courseId': str(course_id),
+            'endpoint': endpoint,
+            'status': status,
+            'error': error,
+            'time': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+        entry.update(extra)
+        with self._dead_letter_lock:
+            self.dead_letters.append(entry)
+        self.tracer.current().set_error(f"{endpoint}: {error}")
+    
+    def save_dead_letters(self, enriched_file: str, is_simple_format: bool) -> str:
+        """写入死信文件，记录本次丰富中获取失败的课程及其对应的丰富结果文件"""
+        dead_letter_file = os.path.join(self.data_dir, "failed_courses.json")
+        with self._dead_letter_lock:
+            failures = list(self.dead_letters)
+        atomic_write(dead_letter_file, json.dumps({
+            "enrichedFile": enriched_file,
+            "format": "simple" if is_simple_format else "nested",
+            "failures": failures
+        }, ensure_ascii=False, indent=2).encode("utf-8"))
+        if failures:
+            course_count = len({item['courseId'] for item in failures})
+            self._log(f"\n有 {course_count} 个课程获取失败，已记录到: {dead_letter_file}")
+            self._log("可以运行 python mca_request.py retry-failed 只重新获取这些课程")
+        return dead_letter_file
+    
+    def _save_outline_index(self, outline, enriched_file: str):
+        """在丰富结果旁边保存大纲索引（ID索引、父节点和子树汇总）
+        
+        Args:
+            outline: 丰富后的大纲，或已建立的OutlineIndex
+            enriched_file: 丰富结果文件路径
+        """
+        index = outline if isinstance(outline, OutlineIndex) else OutlineIndex.build(outline)
+        index_file = index.save(index_path_for(enriched_file), enriched_file)
+        self._log(f"大纲索引已保存到: {index_file}")
+        return index_file
+    
+    def _save_id_mapping(self, id_mapping: Dict[str, Any]) -> str:
+        """保存课程ID与版本ID的映射关系"""
+        mapping_file = os.path.join(self.data_dir, "course_version_mapping.json")
+        with self.profiler.phase("dump_json"):
+            atomic_write(mapping_file, json.dumps(id_mapping, ensure_ascii=False, indent=2).encode("utf-8"))
+        self._log(f"课程ID与版本ID的映射关系已保存到: {mapping_file}")
+        return mapping_file
+    
+    def _load_enriched_for_update(self, enriched_file: str):
+        """读取已有的丰富结果以便修补，记录其压缩方式、紧凑格式和描述外置方式
+        
+        Returns:
+            tuple: (实际文件路径, 还原了描述内容的数据, 保存选项)
+        """
+        enriched_file = find_existing(enriched_file)
+        data = load_json_file(enriched_file)
+        externalized = isinstance(data, dict) and "blobFile" in data
+        data = resolve_description_blobs(data, enriched_file)
+        compression = next((name for name, suffix in COMPRESSION_SUFFIXES.items() if enriched_file.endswith(suffix)), None)
+        return enriched_file, data, {"compression": compression, "externalize": externalized,
+                                     "compact": is_compact_json_file(enriched_file)}
+    
+    def _save_enriched_update(self, data: Dict[str, Any], enriched_file: str, save_options: Dict[str, Any]) -> str:
+        """按原有的压缩方式、紧凑格式和描述外置方式保存修补后的丰富结果，并更新大纲索引"""
+        base_name = os.path.basename(enriched_file)
+        if save_options["compression"]:
+            base_name = base_name[:-len(COMPRESSION_SUFFIXES[save_options["compression"]])]
+        output_file = self._save_enriched(data, base_name, **save_options)
+        self._save_outline_index(data, output_file)
+        return output_file
+    
+    def _load_id_mapping(self) -> Dict[str, Any]:
+        """读取已保存的课程ID与版本ID映射关系"""
+        mapping_file = os.path.join(self.data_dir, "course_version_mapping.json")
+        if not os.path.exists(mapping_file):
+            return {}
+        with open(mapping_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+    
+    def _mapping_info_for(self, node, is_simple_format: bool) -> Dict[str, Any]:
+        """根据索引节点生成ID映射的附加信息（课程名、阶段）"""
+        course = node.data
+        mapping_info = {'courseName': course.get('courseName', '未知课程')}
+        if not is_simple_format:
+            stage = node.parent.data
+            mapping_info['stageId'] = stage.get('id', '未知')
+            mapping_info['stageName'] = stage.get('title', '未知阶段')
+        return mapping_info
+    
+    def _latest_enriched_file(self) -> Optional[str]:
+        """数据目录中最近修改的丰富结果（简单列表或嵌套格式），都不存在时返回None"""
+        candidates = [find_existing(os.path.join(self.data_dir, name))
+                      for name in ("course_outline_enriched_simple.json", "course_outline_enriched.json")]
+        candidates = [path for path in candidates if os.path.exists(path)]
+        return max(candidates, key=os.path.getmtime) if candidates else None
+    
+    def resume_enrichment(self, enriched_file: Optional[str] = None) -> int:
+        """继续获取上次因预算用尽而标记为待获取的课程，结果修补到原有的丰富结果中
+        
+        Args:
+            enriched_file: 丰富结果文件，默认选择数据目录中最近修改的丰富结果
+        
+        Returns:
+            int: 仍然待获取的课程数
+        """
+        if enriched_file is None:
+            enriched_file = self._latest_enriched_file()
+            if enriched_file is None:
+                self._log("没有找到丰富结果文件")
+                return 0
+        
+        enriched_file, data, save_options = self._load_enriched_for_update(enriched_file)
+        is_simple_format = isinstance(data.get("data"), list)
+        outline_index = OutlineIndex.build(data)
+        tasks = []
+        for node in outline_index.nodes("course"):
+            course = node.data
+            if is_pending(course):
+                mapping_info = self._mapping_info_for(node, is_simple_format)
+                tasks.append((course, node.id, mapping_info['courseName'], mapping_info))
+        if not tasks:
+            self._log(f"{enriched_file} 中没有待获取的课程")
+            return 0
+        
+        self._log(f"\n继续获取 {len(tasks)} 个待获取的课程...")
+        id_mapping = self._load_id_mapping()
+        self.dead_letters = []
+        pending = self._run_enrich_tasks(tasks, id_mapping, stage="resume")
+        
+        output_file = self._save_enriched_update(data, enriched_file, save_options)
+        self.last_enriched_file = output_file
+        self._log(f"\n\n已更新丰富结果: {output_file}")
+        self._save_id_mapping(id_mapping)
+        self.save_dead_letters(output_file, is_simple_format)
+        self._publish()
+        self._log_budget_result(pending)
+        self.print_request_stats()
+        return pending
+    
+    def retry_failed(self, dead_letter_file: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
+        """只重新获取死信文件中记录的失败课程，并修补到已有的丰富结果和映射文件中
+        
+        Args:
+            dead_letter_file: 死信文件路径，默认为data/failed_courses.json
+        
+        Returns:
+            list: 重试后仍然失败的记录，没有可重试的记录时返回None
+        """
+        if dead_letter_file is None:
+            dead_letter_file = os.path.join(self.data_dir, "failed_courses.json")
+        if not os.path.exists(dead_letter_file):
+            self._log(f"没有找到死信文件: {dead_letter_file}")
+            return None
+        
+        with open(dead_letter_file, "r", encoding="utf-8") as f:
+            dead_letters = json.load(f)
+        failures = dead_letters.get("failures", [])
+        if not failures:
+            self._log("没有需要重试的课程")
+            return None
+        
+        enriched_file, data, save_options = self._load_enriched_for_update(dead_letters["enrichedFile"])
+        is_simple_format = dead_letters.get("format") == "simple"
+        
+        # 按课程ID定位课程对象及其所在阶段
+        outline_index = OutlineIndex.build(data)
+        id_mapping = self._load_id_mapping()
+        
+        course_ids = list(dict.fromkeys(item['courseId'] for item in failures))
+        self._log(f"\n开始重新获取 {len(course_ids)} 个失败的课程...")
+        self.dead_letters = []
+        for index, course_id in enumerate(course_ids, 1):
+            node = outline_index.course(course_id)
+            if node is None:
+                # 没有重试的失败记录原样保留，不能在重写死信文件时丢失
+                self._log(f"警告: 丰富结果中没有课程ID {course_id}，跳过并保留在死信文件中")
+                with self._dead_letter_lock:
+                    self.dead_letters.extend(item for item in failures if item['courseId'] == course_id)
+                continue
+            mapping_info = self._mapping_info_for(node, is_simple_format)
+            self._report_progress("retry", index, len(course_ids), mapping_info['courseName'])
+            self._enrich_course(node.data, course_id, mapping_info, id_mapping)
+        
+        output_file = self._save_enriched_update(data, enriched_file, save_options)
+        self._log(f"\n\n已修补丰富结果: {output_file}")
+        self._save_id_mapping(id_mapping)
+        self.save_dead_letters(output_file, is_simple_format)
+        self._publish()
+        
+        still_failed = len({item['courseId'] for item in self.dead_letters})
+        self._log(f"重试完成: 成功 {len(course_ids) - still_failed} 个，仍然失败 {still_failed} 个")
+        self.print_request_stats()
+        return self.dead_letters
+    
+    @traced("fetch_course_versions")
     def fetch_course_versions(self, course_id: str) -> Dict[str, Any]:
         """获取课程版本列表及详细信息"""
         url = f"{self.base_url}/edu-course/course/courseversion/allVersionList"
@@ -799,25 +1345,29 @@ class MCARequest:
         }
         
         try:
-            response = self.session.get(url, params=params)
+            response = self._request("GET", "courseversion/allVersionList", url, params=params)
             
             if response.status_code != 200:
-                print(f"警告: 获取课程ID {course_id} 的版本信息失败: HTTP {response.status_code}")
+                self._log(f"警告: 获取课程ID {course_id} 的版本信息失败: HTTP {response.status_code}")
+                self._record_failure(course_id, "courseversion/allVersionList", response.status_code, f"HTTP {response.status_code}")
                 return None
             
-            result = response.json()
+            result = self._decode_json(response)
             
             if result.get('code') != 200:
-                print(f"警告: 获取课程ID {course_id} 的版本信息失败: {result.get('message', '未知错误')}")
+                self._log(f"警告: 获取课程ID {course_id} 的版本信息失败: {result.get('message', '未知错误')}")
+                self._record_failure(course_id, "courseversion/allVersionList", result.get('code'), result.get('message', '未知错误'))
                 return None
             
             # 返回数据部分，不再保存中间文件
             return result.get('data', [])
         
         except Exception as e:
-            print(f"警告: 获取课程ID {course_id} 的版本信息时出错: {e}")
+            self._log(f"警告: 获取课程ID {course_id} 的版本信息时出错: {e}")
+            self._record_failure(course_id, "courseversion/allVersionList", None, str(e))
             return None
 
+    @traced("fetch_course_detail")
     def fetch_course_detail(self, course_id: str, course_version_id: str) -> Dict[str, Any]:
         """获取课程详细章节信息"""
         url = f"{self.base_url}/edu-course/courseWeb/{course_id}/pc"
@@ -826,29 +1376,229 @@ class MCARequest:
         }
         
         try:
-            response = self.session.get(url, params=params)
+            response = self._request("GET", "courseWeb/{id}/pc", url, params=params)
             
             if response.status_code != 200:
-                print(f"警告: 获取课程ID {course_id} 的详细章节信息失败: HTTP {response.status_code}")
+                self._log(f"警告: 获取课程ID {course_id} 的详细章节信息失败: HTTP {response.status_code}")
+                self._record_failure(course_id, "courseWeb/{id}/pc", response.status_code, f"HTTP {response.status_code}",
+                                     versionId=course_version_id)
                 return None
             
-            result = response.json()
+            result = self._decode_json(response)
             
             if result.get('code') != 200:
-                print(f"警告: 获取课程ID {course_id} 的详细章节信息失败: {result.get('message', '未知错误')}")
+                self._log(f"警告: 获取课程ID {course_id} 的详细章节信息失败: {result.get('message', '未知错误')}")
+                self._record_failure(course_id, "courseWeb/{id}/pc", result.get('code'), result.get('message', '未知错误'),
+                                     versionId=course_version_id)
                 return None
             
             # 返回数据部分
             return result.get('data', {})
         
         except Exception as e:
-            print(f"警告: 获取课程ID {course_id} 的详细章节信息时出错: {e}")
+            self._log(f"警告: 获取课程ID {course_id} 的详细章节信息时出错: {e}")
+            self._record_failure(course_id, "courseWeb/{id}/pc", None, str(e), versionId=course_version_id)
             return None
 
+    def _apply_course_detail(self, target: Dict[str, Any], course_detail: Dict[str, Any], full: bool = True):
+        """把课程详细章节信息写入课程对象或版本条目
+        
+        Args:
+            target: 课程对象或版本条目，原地修改
+            course_detail: fetch_course_detail返回的数据
+            full: 是否同时写入level、price、studyCount等课程级字段
+        """
+        target['chapterList'] = course_detail.get('chapterList', [])
+        target['durationSum'] = course_detail.get('durationSum', 0)
+        if full:
+            target['level'] = course_detail.get('level', 0)
+            target['price'] = course_detail.get('price', 0)
+            target['studyCount'] = course_detail.get('studyCount', 0)
+        
+        # 计算总章节数和总小节数
+        chapter_count = len(target['chapterList'])
+        section_count = sum(len(chapter.get('sectionList', [])) for chapter in target['chapterList'])
+        target['totalChapterCount'] = chapter_count
+        target['totalSectionCount'] = section_count
+    
+    def _enrich_course(self, course: Dict[str, Any], course_id, mapping_info: Dict[str, Any], id_mapping: Dict[str, Any]):
+        """获取单个课程的版本和章节信息并写入课程对象
+        
+        Args:
+            course: 课程对象，原地修改
+            course_id: 课程ID
+            mapping_info: 写入ID映射的附加信息（课程名、阶段等）
+            id_mapping: 课程ID与版本ID的映射关系，原地修改
+        """
+        # 每个课程一条trace，获取、解析和记账的span都挂在课程span下
+        with self.tracer.course(course_id, mapping_info.get('courseName'),
+                                **{"mca.stage": mapping_info.get('stageName')}) as span:
+            self._fetch_and_apply_course(course, course_id, mapping_info, id_mapping)
+            span.set_attributes({
+                "mca.version.id": course.get('versionId'),
+                "mca.chapters": course.get('totalChapterCount'),
+                "mca.sections": course.get('totalSectionCount'),
+            })
+            if 'versionId' not in course or 'chapterList' not in course:
+                span.set_error("课程信息获取失败")
+    
+    def _fetch_and_apply_course(self, course: Dict[str, Any], course_id, mapping_info: Dict[str, Any],
+                                id_mapping: Dict[str, Any]):
+        """_enrich_course的实际获取过程，参数相同"""
+        # 1. 获取课程版本信息
+        versions = self.fetch_course_versions(str(course_id))
+        if not versions:
+            return
+        
+        # 获取第一个版本的详细信息
+        version = versions[0]
+        version_id = version.get('id')
+        
+        with self.tracer.span("enrich_bookkeeping", **{"mca.versions": len(versions)}):
+            # 添加详细描述到课程对象
+            course['pcDetailDesc'] = version.get('pcDetailDesc', '')
+            course['appDetailDesc'] = version.get('appDetailDesc', '')
+            course['versionId'] = version_id
+            course['versionName'] = version.get('name', '')
+            
+            # 记录章节ID与版本ID的映射关系
+            id_mapping[str(course_id)] = dict({'versionId': version_id}, **mapping_info)
+        
+        # 2. 获取课程详细章节信息
+        course_detail = self.fetch_course_detail(str(course_id), str(version_id))
+        if course_detail:
+            # 添加详细章节信息到课程对象
+            with self.tracer.span("enrich_bookkeeping"):
+                self._apply_course_detail(course, course_detail)
+        
+        # 3. 按需获取其余版本的章节信息，第一个版本复用上面的结果
+        if self.all_versions:
+            version_list = []
+            for index, other in enumerate(versions):
+                entry = {
+                    'versionId': other.get('id'),
+                    'versionName': other.get('name', '')
+                }
+                detail = course_detail if index == 0 else self.fetch_course_detail(str(course_id), str(other.get('id')))
+                if detail:
+                    self._apply_course_detail(entry, detail, full=False)
+                version_list.append(entry)
+            course['versionList'] = version_list
+    
+    def _save_enriched(self, payload: Dict[str, Any], file_name: str, compression: Optional[str] = None,
+                       externalize: Optional[bool] = None, compact: Optional[bool] = None) -> str:
+        """按输出模式保存丰富后的大纲
+        
+        Args:
+            payload: 要保存的完整JSON
+            file_name: 文件名（不含压缩后缀）
+            compression: 压缩格式，默认使用output_compression
+            externalize: 是否外置描述字段，默认使用externalize_descriptions
+            compact: 不压缩时是否使用紧凑格式，默认使用json_compact
+        
+        Returns:
+            str: 实际保存的文件路径
+        """
+        if compression is None:
+            compression = self.output_compression
+        if externalize is None:
+            externalize = self.externalize_descriptions
+        if compact is None:
+            compact = self.json_compact
+        output_file = os.path.join(self.data_dir, file_name)
+        with self.profiler.phase("dump_json"):
+            if externalize:
+                # 描述内容移到单独的去重文件中，主文件只保留哈希引用
+                blob_file = os.path.splitext(output_file)[0] + ".blobs.json"
+                payload = externalize_descriptions(payload, blob_file, compression)
+            return write_json_file(payload, output_file, compression, compact=compact)
+    
+    def _run_enrich_tasks(self, tasks: List[tuple], id_mapping: Dict[str, Any], stage: str = "enrich") -> int:
+        """按优先级依次或并发丰富课程，并显示处理进度
+        
+        设置了预算时，每个课程开始前检查预算，用尽后不再开始新的课程（进行中的课程会完成），
+        剩余课程标记为待获取。
+        
+        Args:
+            tasks: (课程对象, 课程ID, 课程名称, 映射信息) 列表，课程ID为空的课程只计入进度
+            id_mapping: 课程ID与版本ID的映射关系，原地修改
+            stage: 进度回调中的阶段名称
+        
+        Returns:
+            int: 因预算用尽而标记为待获取的课程数
+        """
+        total_courses = len(tasks)
+        tasks = prioritize(tasks, self.enrich_priority)
+        budget = self.enrich_budget
+        budget.start(self.requests_sent)
+        skipped = []
+        
+        def show_progress(processed_courses, course_name):
+            self._report_progress(stage, processed_courses, total_courses, course_name)
+        
+        def run(course, course_id, mapping_info):
+            if budget.limited and budget.exhausted(self.requests_sent):
+                mark_pending(course)
+                skipped.append(course_id)
+                return
+            course.pop(ENRICH_STATUS_KEY, None)
+            self._enrich_course(course, course_id, mapping_info, id_mapping)
+        
+        if self.enrich_workers <= 1:
+            for processed_courses, (course, course_id, course_name, mapping_info) in enumerate(tasks, 1):
+                show_progress(processed_courses, course_name)
+                if course_id:
+                    run(course, course_id, mapping_info)
+            return len(skipped)
+        
+        # 并发获取：每个课程只修改自己的课程对象，映射关系按课程ID写入，互不影响；
+        # 线程池按提交顺序开始任务，因此优先级顺序仍然有效
+        with ThreadPoolExecutor(max_workers=self.enrich_workers) as executor:
+            futures = {}
+            for course, course_id, course_name, mapping_info in tasks:
+                if course_id:
+                    future = executor.submit(run, course, course_id, mapping_info)
+                    futures[future] = course_name
+            processed_courses = total_courses - len(futures)
+            for future in as_completed(futures):
+                future.result()
+                processed_courses += 1
+                show_progress(processed_courses, futures[future])
+        return len(skipped)
+    
+    def _log_budget_result(self, pending: int):
+        """预算用尽时说明剩余课程的处理方式"""
+        if pending:
+            reason = "时间" if self.enrich_budget.stopped_by == "time" else "请求数"
+            self._log(f"\n{reason}预算（{self.enrich_budget.describe()}）已用尽，{pending} 个课程标记为待获取")
+            self._log("可以运行 python mca_request.py resume 继续获取这些课程")
+    
+    def save_snapshot(self, outline_list: List[Dict[str, Any]], is_simple_format: bool) -> str:
+        """把丰富后的大纲保存为快照清单，章节和小节写入按内容寻址的对象存储
+        
+        Returns:
+            str: 快照清单文件路径
+        """
+        snapshot_dir = os.path.join(self.data_dir, "snapshots")
+        if not os.path.exists(snapshot_dir):
+            os.makedirs(snapshot_dir)
+        
+        written, reused = self.object_store.written, self.object_store.reused
+        manifest = self.object_store.build_manifest(outline_list, is_simple_format)
+        name = "course_outline_enriched_simple" if is_simple_format else "course_outline_enriched"
+        snapshot_file = os.path.join(snapshot_dir, f"{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+        with self.profiler.phase("dump_json"):
+            write_json_file(manifest, snapshot_file, compact=True)
+        
+        self._log(f"快照清单已保存到: {snapshot_file}")
+        self._log(f"对象存储: 新写入 {self.object_store.written - written} 个对象，复用 {self.object_store.reused - reused} 个对象")
+        return snapshot_file
+    
+    @profiled("enrich")
     def enrich_course_outline(self, outline_list: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """丰富课程大纲，直接添加每个课程的详细描述到已有层级中"""
         if not outline_list or not isinstance(outline_list, list):
-            print("警告: 大纲列表为空或格式不正确")
+            self._log("警告: 大纲列表为空或格式不正确")
             return outline_list
         
         # 检查输入格式，判断是否为简单列表格式（scratch.json）
@@ -857,84 +1607,50 @@ class MCARequest:
             # 检查是否有courseNo字段，这是简单列表格式的特征
             if 'courseNo' in outline_list[0]:
                 is_simple_format = True
-                print("检测到简单列表格式的课程数据，将使用适配的处理方式...")
+                self._log("检测到简单列表格式的课程数据，将使用适配的处理方式...")
         
         # 用于记录章节ID与版本ID的映射关系
         id_mapping = {}
+        # 本次丰富中获取失败的课程
+        self.dead_letters = []
         
         if is_simple_format:
             # 简单列表格式处理方式（scratch.json格式）
             total_courses = len(outline_list)
-            processed_courses = 0
             
-            print(f"\n开始丰富课程大纲，共 {total_courses} 个课程...")
+            self._log(f"\n开始丰富课程大纲，共 {total_courses} 个课程...")
             
             # 处理每个课程
+            tasks = []
             for course in outline_list:
-                course_id = course.get('courseNo')
+                course_id = course_key(course, True)
                 course_name = course.get('courseName', '未知课程')
-                
-                processed_courses += 1
-                progress = processed_courses / total_courses * 100
-                print(f"\r处理进度: {processed_courses}/{total_courses} ({progress:.1f}%) - 当前: {course_name}", end="")
-                
-                if course_id:
-                    # 1. 获取课程版本信息
-                    versions = self.fetch_course_versions(str(course_id))
-                    
-                    if versions and len(versions) > 0:
-                        # 获取第一个版本的详细信息
-                        version = versions[0]
-                        version_id = version.get('id')
-                        
-                        # 添加详细描述到课程对象
-                        course['pcDetailDesc'] = version.get('pcDetailDesc', '')
-                        course['appDetailDesc'] = version.get('appDetailDesc', '')
-                        course['versionId'] = version_id
-                        course['versionName'] = version.get('name', '')
-                        
-                        # 记录章节ID与版本ID的映射关系
-                        id_mapping[str(course_id)] = {
-                            'versionId': version_id,
-                            'courseName': course_name
-                        }
-                        
-                        # 2. 获取课程详细章节信息
-                        course_detail = self.fetch_course_detail(str(course_id), str(version_id))
-                        if course_detail:
-                            # 添加详细章节信息到课程对象
-                            course['chapterList'] = course_detail.get('chapterList', [])
-                            course['durationSum'] = course_detail.get('durationSum', 0)
-                            course['level'] = course_detail.get('level', 0)
-                            course['price'] = course_detail.get('price', 0)
-                            course['studyCount'] = course_detail.get('studyCount', 0)
-                            
-                            # 计算总章节数和总小节数
-                            chapter_count = len(course['chapterList'])
-                            section_count = sum(len(chapter.get('sectionList', [])) for chapter in course['chapterList'])
-                            course['totalChapterCount'] = chapter_count
-                            course['totalSectionCount'] = section_count
+                tasks.append((course, course_id, course_name, {
+                    'courseName': course_name
+                }))
+            pending = self._run_enrich_tasks(tasks, id_mapping)
             
             # 保存简单格式的丰富后完整大纲
-            output_file = os.path.join(self.data_dir, "course_outline_enriched_simple.json")
-            with open(output_file, "w", encoding="utf-8") as f:
-                json.dump({
-                    "msg": "请求成功",
-                    "code": 200,
-                    "data": outline_list
-                }, f, ensure_ascii=False, indent=2)
+            output_file = self._save_enriched({
+                "msg": "请求成功",
+                "code": 200,
+                "data": outline_list
+            }, "course_outline_enriched_simple.json")
+            
+            self._log(f"\n\n丰富课程大纲完成!")
+            self._log(f"丰富后的简单格式大纲已保存到: {output_file}")
             
-            print(f"\n\n丰富课程大纲完成!")
-            print(f"丰富后的简单格式大纲已保存到: {output_file}")
+            if self.object_store:
+                self.save_snapshot(outline_list, is_simple_format)
             
         else:
             # 原始嵌套格式处理方式
             total_courses = sum(len(stage.get('courseList', [])) for stage in outline_list)
-            processed_courses = 0
             
-            print(f"\n开始丰富课程大纲，共 {len(outline_list)} 个阶段, {total_courses} 个课程...")
+            self._log(f"\n开始丰富课程大纲，共 {len(outline_list)} 个阶段, {total_courses} 个课程...")
             
             # 对每个阶段进行处理
+            tasks = []
             for stage in outline_list:
                 course_list = stage.get('courseList', [])
                 
@@ -944,125 +1660,319 @@ class MCARequest:
                     
                     # 处理每个课程
                     for course in course_list:
-                        course_id = course.get('id')
+                        course_id = course_key(course, False)
                         course_name = course.get('courseName', '未知课程')
-                        
-                        processed_courses += 1
-                        progress = processed_courses / total_courses * 100
-                        print(f"\r处理进度: {processed_courses}/{total_courses} ({progress:.1f}%) - 当前: {course_name}", end="")
-                        
-                        if course_id:
-                            # 1. 获取课程版本信息
-                            versions = self.fetch_course_versions(str(course_id))
-                            
-                            if versions and len(versions) > 0:
-                                # 获取第一个版本的详细信息
-                                version = versions[0]
-                                version_id = version.get('id')
-                                
-                                # 添加详细描述到课程对象
-                                course['pcDetailDesc'] = version.get('pcDetailDesc', '')
-                                course['appDetailDesc'] = version.get('appDetailDesc', '')
-                                course['versionId'] = version_id
-                                course['versionName'] = version.get('name', '')
-                                
-                                # 记录章节ID与版本ID的映射关系
-                                id_mapping[str(course_id)] = {
-                                    'versionId': version_id,
-                                    'courseName': course_name,
-                                    'stageId': stage_id,
-                                    'stageName': stage_title
-                                }
-                                
-                                # 2. 获取课程详细章节信息
-                                course_detail = self.fetch_course_detail(str(course_id), str(version_id))
-                                if course_detail:
-                                    # 添加详细章节信息到课程对象
-                                    course['chapterList'] = course_detail.get('chapterList', [])
-                                    course['durationSum'] = course_detail.get('durationSum', 0)
-                                    course['level'] = course_detail.get('level', 0)
-                                    course['price'] = course_detail.get('price', 0)
-                                    course['studyCount'] = course_detail.get('studyCount', 0)
-                                    
-                                    # 计算总章节数和总小节数
-                                    chapter_count = len(course['chapterList'])
-                                    section_count = sum(len(chapter.get('sectionList', [])) for chapter in course['chapterList'])
-                                    course['totalChapterCount'] = chapter_count
-                                    course['totalSectionCount'] = section_count
+                        tasks.append((course, course_id, course_name, {
+                            'courseName': course_name,
+                            'stageId': stage_id,
+                            'stageName': stage_title
+                        }))
+            pending = self._run_enrich_tasks(tasks, id_mapping)
             
             # 保存嵌套格式的丰富后完整大纲
-            output_file = os.path.join(self.data_dir, "course_outline_enriched.json")
-            with open(output_file, "w", encoding="utf-8") as f:
-                json.dump({
-                    "msg": "请求成功",
-                    "code": 200,
-                    "data": {
-                        "stageList": outline_list
-                    }
-                }, f, ensure_ascii=False, indent=2)
+            output_file = self._save_enriched({
+                "msg": "请求成功",
+                "code": 200,
+                "data": {
+                    "stageList": outline_list
+                }
+            }, "course_outline_enriched.json")
+            
+            self._log(f"\n\n丰富课程大纲完成!")
+            self._log(f"丰富后的完整大纲已保存到: {output_file}")
             
-            print(f"\n\n丰富课程大纲完成!")
-            print(f"丰富后的完整大纲已保存到: {output_file}")
+            if self.object_store:
+                self.save_snapshot(outline_list, is_simple_format)
+        
+        self.last_enriched_file = output_file
+        self._save_outline_index(outline_list, output_file)
         
         # 保存ID映射关系到文件（这个文件是必要的，保留）
-        mapping_file = os.path.join(self.data_dir, "course_version_mapping.json")
-        with open(mapping_file, "w", encoding="utf-8") as f:
-            json.dump(id_mapping, f, ensure_ascii=False, indent=2)
-        print(f"课程ID与版本ID的映射关系已保存到: {mapping_file}")
+        self._save_id_mapping(id_mapping)
+        
+        # 记录获取失败的课程，供retry-failed重试
+        self.save_dead_letters(output_file, is_simple_format)
+        
+        # 所有产物写完之后才更新最新结果指针
+        self._publish()
+        self._log_budget_result(pending)
+        
+        # 输出各接口延迟与对冲统计，便于确认长尾是否收敛
+        self.print_request_stats()
         
         return outline_list
 
-    def generate_markdown_from_enriched_json(self, json_file_path=None, output_file=None, max_chars_per_file=None):
+    def lazy_course_outline(self, outline_list: List[Dict[str, Any]], prefetch: Optional[int] = None) -> LazyOutline:
+        """把大纲中的课程替换为按需获取的代理，不立即发出请求
+        
+        Args:
+            outline_list: 阶段列表或简单格式的课程列表，原地替换其中的课程
+            prefetch: 访问某个课程时预取其后的课程数，默认使用lazy_prefetch
+        """
+        self.dead_letters = []
+        return LazyOutline(self, outline_list, self.lazy_prefetch if prefetch is None else prefetch)
+    
+    def save_lazy_outline(self, lazy: LazyOutline) -> str:
+        """保存按需丰富的结果，未访问的课程标记为待获取，之后可以用resume补齐
+        
+        Returns:
+            str: 丰富结果的保存路径
+        """
+        outline = lazy.plain_outline()
+        if lazy.is_simple_format:
+            payload, file_name = outline, "course_outline_enriched_simple.json"
+        else:
+            payload, file_name = {"stageList": outline}, "course_outline_enriched.json"
+        output_file = self._save_enriched({"msg": "请求成功", "code": 200, "data": payload}, file_name)
+        self._log(f"\n已获取 {lazy.loaded_count}/{len(lazy)} 个课程，结果已保存到: {output_file}")
+        
+        self.last_enriched_file = output_file
+        self._save_outline_index(outline, output_file)
+        self._save_id_mapping(lazy.id_mapping)
+        self.save_dead_letters(output_file, lazy.is_simple_format)
+        self._publish()
+        pending = len(lazy) - lazy.loaded_count
+        if pending:
+            self._log(f"{pending} 个未访问的课程标记为待获取，可以运行 python mca_request.py resume 继续获取")
+        return output_file
+    
+    def explore_outline(self, outline_list: List[Dict[str, Any]]) -> str:
+        """交互式浏览大纲：选择课程时才获取该课程的章节，结束时保存已获取的结果
+        
+        Returns:
+            str: 丰富结果的保存路径
+        """
+        with self.lazy_course_outline(outline_list) as lazy:
+            while True:
+                print("\n" + "="*80)
+                print("课程列表（按需获取）".center(78))
+                print("="*80)
+                for i, course in enumerate(lazy.courses, 1):
+                    mark = " [已获取]" if course.loaded else ""
+                    print(f"{i:3}. {dict.get(course, 'courseName', '未知课程').strip()}{mark}")
+                print(f"\n已获取 {lazy.loaded_count}/{len(lazy)} 个课程，共发出 {self.requests_sent} 个请求"
+                      f"（预取 {lazy.prefetched} 个）")
+                choice = input("输入课程编号查看章节，q 保存并结束: ").strip()
+                if choice.lower() == "q":
+                    break
+                if not choice.isdigit() or not 1 <= int(choice) <= len(lazy):
+                    print(f"错误: 请输入1-{len(lazy)}之间的编号或q")
+                    continue
+                course = lazy.courses[int(choice) - 1]
+                print("\n" + self.render_course_markdown(course))
+        return self.save_lazy_outline(lazy)
+    
+    def extract_enriched_courses(self, data: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+        """从丰富后的JSON中提取课程列表
+        
+        Returns:
+            list: 课程列表，JSON中没有课程列表时返回None
+        """
+        course_list = []
+        if "data" in data and isinstance(data["data"], list):
+            course_list = data["data"]
+        elif "data" in data and "stageList" in data["data"]:
+            # 尝试从stageList中提取课程
+            stages = data["data"]["stageList"]
+            for stage in stages:
+                if "courseList" in stage:
+                    course_list.extend(stage["courseList"])
+        else:
+            return None
+        return course_list
+    
+    def render_toc_line(self, index: int, course: Dict[str, Any]) -> str:
+        """生成总目录中的一个课程项"""
+        course_name = course.get("courseName", "未知课程")
+        course_id = course.get("courseNo", "未知ID")
+        
+        # 清理course_name中的前导空格和换行符
+        course_name = course_name.strip()
+        return f"{index}. **{course_name}** (ID: {course_id})\n"
+    
+    def render_course_markdown(self, course: Dict[str, Any]) -> str:
+        """生成单个课程的Markdown内容"""
+        course_name = course.get("courseName", "未知课程")
+        course_id = course.get("courseNo", "未知ID")
+        
+        # 清理course_name中的前导空格和换行符
+        course_name = course_name.strip()
+        
+        # 生成单个课程的内容
+        course_content = []
+        
+        # 确保duration_total不为None
+        duration_total = course.get("durationTotal")
+        if duration_total is None:
+            duration_total = 0
+        
+        # 格式化总时长
+        hours = duration_total // 3600
+        minutes = (duration_total % 3600) // 60
+        seconds = duration_total % 60
+        duration_str = f"{hours}小时{minutes}分钟{seconds}秒"
+        
+        # 添加课程标题和基本信息
+        course_content.append(f"# {course_name}\n")
+        course_content.append(f"- **课程ID**: {course_id}\n")
+        course_content.append(f"- **总时长**: {duration_str}\n")
+        
+        # 如果有章节列表
+        chapter_list = course.get("chapterList", [])
+        if chapter_list:
+            course_content.append("## 章节详情\n")
+            for chapter_idx, chapter in enumerate(chapter_list, 1):
+                chapter_name = chapter.get("chapterName", "未知章节")
+                
+                # 清理chapter_name中的前导空格和换行符，确保标题效果正常
+                chapter_name = chapter_name.strip()
+                
+                chapter_count = chapter.get("chapterCount")
+                if chapter_count is None:
+                    chapter_count = 0
+                
+                chapter_duration = chapter.get("chapterDurationTimeCount")
+                if chapter_duration is None:
+                    chapter_duration = 0
+                
+                # 格式化章节时长
+                ch_hours = chapter_duration // 3600
+                ch_minutes = (chapter_duration % 3600) // 60
+                ch_seconds = chapter_duration % 60
+                ch_duration_str = f"{ch_hours}小时{ch_minutes}分钟{ch_seconds}秒"
+                
+                # 添加章节标题和基本信息
+                course_content.append(f"### {chapter_idx}. {chapter_name}\n")
+                course_content.append(f"- 时长: {ch_duration_str}\n")
+                course_content.append(f"- 小节数: {chapter_count}\n\n")
+                
+                # 处理每个小节
+                section_list = chapter.get("sectionList", [])
+                if section_list:
+                    course_content.append("小节列表:\n")
+                    for section_idx, section in enumerate(section_list, 1):
+                        section_name = section.get("sectionName", "未知小节")
+                        
+                        # 清理section_name中的前导空格和换行符，确保加粗效果正常
+                        section_name = section_name.strip()
+                        
+                        # 确保section_duration不为None
+                        section_duration = section.get("durationTime")
+                        if section_duration is None:
+                            section_duration = 0
+                        
+                        # 格式化小节时长
+                        sec_minutes = section_duration // 60
+                        sec_seconds = section_duration % 60
+                        sec_duration_str = f"{sec_minutes}分钟{sec_seconds}秒"
+                        
+                        course_content.append(f"  {section_idx}. **{section_name}** - {sec_duration_str}\n")
+                
+                course_content.append("\n")
+        else:
+            course_content.append("- **章节数**: 0\n")
+            course_content.append("\n*该课程没有可用的章节信息*\n")
+        
+        course_content.append("\n---\n")
+        
+        return "".join(course_content)
+    
+    def split_course_contents(self, all_course_contents: List[str], max_chars_per_file: int) -> List[List[str]]:
+        """按最大字符数把课程内容分组，每组对应一个分割文件
+        
+        单个课程超过限制时单独成组，不会被截断。
+        """
+        groups = []
+        current_content = []
+        current_chars = 0
+        
+        for course_content in all_course_contents:
+            # 如果当前课程内容加上已有内容超过限制，或者这是一个非常大的课程（单个课程超过限制）
+            if current_chars + len(course_content) > max_chars_per_file and current_chars > 0:
+                # 结束当前分组并开始新分组
+                groups.append(current_content)
+                current_content = [course_content]
+                current_chars = len(course_content)
+            else:
+                # 添加到当前分组
+                current_content.append(course_content)
+                current_chars += len(course_content)
+        
+        if current_content:
+            groups.append(current_content)
+        return groups
+    
+    @profiled("render_markdown")
+    def generate_markdown_from_enriched_json(self, json_file_path=None, output_file=None, max_chars_per_file=None,
+                                             extra_sinks: Optional[List[str]] = None):
         """从丰富的JSON数据生成Markdown格式的课程大纲
         
         Args:
             json_file_path: 输入的JSON文件路径，默认为course_outline_enriched_simple.json
             output_file: 输出的Markdown文件路径，默认为course_outline.md
             max_chars_per_file: 每个文件的最大字符数，如果为None则不分割文件
+            extra_sinks: 在同一次遍历中额外生成的产物，可选catalog、jsonl、stats，输出到Markdown文件所在目录
         
         Returns:
             list: 生成的Markdown文件路径列表
         """
-        # 默认文件路径
+        # 默认文件路径；使用工作区时选择工作区中的丰富结果（可能是嵌套格式）
+        if json_file_path is None and self.workspace is not None:
+            json_file_path = self._latest_enriched_file()
         if json_file_path is None:
             json_file_path = os.path.join(self.data_dir, "course_outline_enriched_simple.json")
         
         if output_file is None:
             output_file = os.path.join(self.data_dir, "course_outline.md")
         
-        # 读取JSON数据
+        # 读取JSON数据（支持压缩文件，描述内容渲染用不到，不需要还原）
+        json_file_path = find_existing(json_file_path)
         try:
-            with open(json_file_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
+            with self.profiler.phase("load_json"):
+                data = load_json_file(json_file_path)
+            # 快照清单需要先从对象存储还原章节内容
+            data = hydrate_if_manifest(data, json_file_path)
         except FileNotFoundError:
-            print(f"错误: 文件 {json_file_path} 不存在")
+            self._log(f"错误: 文件 {json_file_path} 不存在")
             return None
-        except json.JSONDecodeError:
-            print(f"错误: 文件 {json_file_path} 不是有效的JSON格式")
+        except (json.JSONDecodeError, OSError, EOFError, lzma.LZMAError):
+            self._log(f"错误: 文件 {json_file_path} 不是有效的JSON格式")
             return None
         
         # 提取课程列表
-        course_list = []
-        if "data" in data and isinstance(data["data"], list):
-            course_list = data["data"]
-        elif "data" in data and "stageList" in data["data"]:
-            # 尝试从stageList中提取课程
-            stages = data["data"]["stageList"]
-            for stage in stages:
-                if "courseList" in stage:
-                    course_list.extend(stage["courseList"])
-        else:
-            print("错误: JSON数据中没有找到课程列表")
+        course_list = self.extract_enriched_courses(data)
+        if course_list is None:
+            self._log("错误: JSON数据中没有找到课程列表")
             return None
         
         # 检查课程列表是否为空
         if not course_list:
-            print("警告: 课程列表为空")
+            self._log("警告: 课程列表为空")
             return None
         
-        # 生成目录内容
-        toc_content = ["# 课程大纲总目录\n\n"]
-        file_index = 1
+        # 一次遍历同时生成Markdown和其他产物
+        sinks = [MarkdownSink(self, output_file, max_chars_per_file)]
+        sinks.extend(create_sinks(extra_sinks or [], os.path.dirname(output_file) or "."))
+        results = render_outline(data, sinks, self.profiler, self.tracer)
+        for sink in sinks[1:]:
+            for file_path in results[sink.name]:
+                self._log(f"{sink.title}已保存到: {file_path}")
+        self._publish()
+        return results[MarkdownSink.name]
+    
+    def write_markdown_files(self, toc_content: List[str], all_course_contents: List[str], output_file: str,
+                             max_chars_per_file: Optional[int] = None) -> List[str]:
+        """把总目录和各课程的Markdown内容写入单个文件或按字符数分割的多个文件
+        
+        Args:
+            toc_content: 总目录内容（标题和各课程项）
+            all_course_contents: 各课程的Markdown内容
+            output_file: 输出的Markdown文件路径
+            max_chars_per_file: 每个文件的最大字符数，如果为None或0则不分割文件
+        
+        Returns:
+            list: 生成的Markdown文件路径列表
+        """
         all_files = []
         
         # 通用文件名生成函数
@@ -1090,125 +2000,32 @@ class MCARequest:
             
             return nav + content
         
-        # 处理每个课程，准备切片
-        all_course_contents = []
-        for i, course in enumerate(course_list, 1):
-            course_name = course.get("courseName", "未知课程")
-            course_id = course.get("courseNo", "未知ID")
-            
-            # 清理course_name中的前导空格和换行符
-            course_name = course_name.strip()
-            
-            # 为总目录添加课程项
-            toc_content.append(f"{i}. **{course_name}** (ID: {course_id})\n")
-            
-            # 生成单个课程的内容
-            course_content = []
-            
-            # 确保duration_total不为None
-            duration_total = course.get("durationTotal")
-            if duration_total is None:
-                duration_total = 0
-            
-            # 格式化总时长
-            hours = duration_total // 3600
-            minutes = (duration_total % 3600) // 60
-            seconds = duration_total % 60
-            duration_str = f"{hours}小时{minutes}分钟{seconds}秒"
-            
-            # 添加课程标题和基本信息
-            course_content.append(f"# {course_name}\n")
-            course_content.append(f"- **课程ID**: {course_id}\n")
-            course_content.append(f"- **总时长**: {duration_str}\n")
-            
-            # 如果有章节列表
-            chapter_list = course.get("chapterList", [])
-            if chapter_list:
-                course_content.append("## 章节详情\n")
-                for chapter_idx, chapter in enumerate(chapter_list, 1):
-                    chapter_name = chapter.get("chapterName", "未知章节")
-                    
-                    # 清理chapter_name中的前导空格和换行符，确保标题效果正常
-                    chapter_name = chapter_name.strip()
-                    
-                    chapter_count = chapter.get("chapterCount")
-                    if chapter_count is None:
-                        chapter_count = 0
-                    
-                    chapter_duration = chapter.get("chapterDurationTimeCount")
-                    if chapter_duration is None:
-                        chapter_duration = 0
-                    
-                    # 格式化章节时长
-                    ch_hours = chapter_duration // 3600
-                    ch_minutes = (chapter_duration % 3600) // 60
-                    ch_seconds = chapter_duration % 60
-                    ch_duration_str = f"{ch_hours}小时{ch_minutes}分钟{ch_seconds}秒"
-                    
-                    # 添加章节标题和基本信息
-                    course_content.append(f"### {chapter_idx}. {chapter_name}\n")
-                    course_content.append(f"- 时长: {ch_duration_str}\n")
-                    course_content.append(f"- 小节数: {chapter_count}\n\n")
-                    
-                    # 处理每个小节
-                    section_list = chapter.get("sectionList", [])
-                    if section_list:
-                        course_content.append("小节列表:\n")
-                        for section_idx, section in enumerate(section_list, 1):
-                            section_name = section.get("sectionName", "未知小节")
-                            
-                            # 清理section_name中的前导空格和换行符，确保加粗效果正常
-                            section_name = section_name.strip()
-                            
-                            # 确保section_duration不为None
-                            section_duration = section.get("durationTime")
-                            if section_duration is None:
-                                section_duration = 0
-                            
-                            # 格式化小节时长
-                            sec_minutes = section_duration // 60
-                            sec_seconds = section_duration % 60
-                            sec_duration_str = f"{sec_minutes}分钟{sec_seconds}秒"
-                            
-                            course_content.append(f"  {section_idx}. **{section_name}** - {sec_duration_str}\n")
-                    
-                    course_content.append("\n")
-            else:
-                course_content.append("- **章节数**: 0\n")
-                course_content.append("\n*该课程没有可用的章节信息*\n")
-            
-            course_content.append("\n---\n")
-            
-            # 将课程内容添加到列表
-            all_course_contents.append("".join(course_content))
-        
         # 生成时间
-        from datetime import datetime
         now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         timestamp = f"\n*文档生成时间: {now}*\n"
         
         # 计算总字符数
         total_chars = sum(len(content) for content in all_course_contents) + len("".join(toc_content)) + len(timestamp)
-        print(f"\n课程大纲总字符数: {total_chars} 个字符")
+        self._log(f"\n课程大纲总字符数: {total_chars} 个字符")
         
         # 如果未提供max_chars_per_file或为0，则不分割文件
         if max_chars_per_file is None or max_chars_per_file == 0:
-            print("不进行文件分割，生成单个完整文件")
+            self._log("不进行文件分割，生成单个完整文件")
             # 把总目录内容完成
             toc_content.append("\n## 课程内容\n\n")
             toc_content.append(timestamp)
             
             # 写入完整文件（目录 + 所有课程内容）
-            with open(output_file, "w", encoding="utf-8") as f:
+            with self.profiler.phase("write"), open(output_file, "w", encoding="utf-8") as f:
                 f.write("".join(toc_content))
                 f.write("\n---\n\n")
                 f.write("".join(all_course_contents))
             
-            print(f"\n课程大纲已成功生成为单个Markdown文件: {output_file}")
+            self._log(f"\n课程大纲已成功生成为单个Markdown文件: {output_file}")
             return [output_file]
         
         # 进行文件分割
-        print(f"进行文件分割，每个文件最大字符数: {max_chars_per_file}")
+        self._log(f"进行文件分割，每个文件最大字符数: {max_chars_per_file}")
         # 把总目录内容完成
         toc_content.append("\n## 文件索引\n\n")
         
@@ -1232,7 +2049,7 @@ class MCARequest:
         toc_content.append(timestamp)
         
         # 写入总目录文件
-        with open(toc_file, "w", encoding="utf-8") as f:
+        with self.profiler.phase("write"), open(toc_file, "w", encoding="utf-8") as f:
             f.write("".join(toc_content))
         all_files.append(toc_file)
         
@@ -1240,57 +2057,180 @@ class MCARequest:
         if total_files == 1:
             content = "".join(all_course_contents)
             file_path = get_filename(output_file, 1)
-            with open(file_path, "w", encoding="utf-8") as f:
+            with self.profiler.phase("write"), open(file_path, "w", encoding="utf-8") as f:
                 f.write(content + timestamp)
             all_files = [file_path]
-            print(f"\n课程大纲已成功生成为单个Markdown文件: {file_path}")
+            self._log(f"\n课程大纲已成功生成为单个Markdown文件: {file_path}")
             return all_files
         
         # 处理需要多个文件的情况
-        file_idx = 1
-        current_file = get_filename(output_file, file_idx)
-        current_content = []
-        current_chars = 0
-        
-        for course_content in all_course_contents:
-            # 如果当前课程内容加上已有内容超过限制，或者这是一个非常大的课程（单个课程超过限制）
-            if current_chars + len(course_content) > max_chars_per_file and current_chars > 0:
-                # 写入当前文件并开始新文件
-                with open(current_file, "w", encoding="utf-8") as f:
-                    content_with_nav = add_navigation(current_content, file_idx, total_files)
-                    f.write("".join(content_with_nav) + timestamp)
-                all_files.append(current_file)
-                
-                # 开始新文件
-                file_idx += 1
-                current_file = get_filename(output_file, file_idx)
-                current_content = [course_content]
-                current_chars = len(course_content)
-            else:
-                # 添加到当前文件
-                current_content.append(course_content)
-                current_chars += len(course_content)
-        
-        # 写入最后一个文件
-        if current_content:
-            with open(current_file, "w", encoding="utf-8") as f:
+        for file_idx, current_content in enumerate(self.split_course_contents(all_course_contents, max_chars_per_file), 1):
+            current_file = get_filename(output_file, file_idx)
+            with self.profiler.phase("write"), open(current_file, "w", encoding="utf-8") as f:
                 content_with_nav = add_navigation(current_content, file_idx, total_files)
                 f.write("".join(content_with_nav) + timestamp)
             all_files.append(current_file)
         
-        print(f"\n课程大纲已成功生成为{len(all_files)}个Markdown文件:")
+        self._log(f"\n课程大纲已成功生成为{len(all_files)}个Markdown文件:")
         for file_path in all_files:
-            print(f"- {file_path}")
+            self._log(f"- {file_path}")
         
         return all_files
 
+def pop_option(argv: List[str], name: str, default=None):
+    """从参数列表中取出 `name value` 形式的选项，未提供时返回默认值"""
+    if name not in argv:
+        return default
+    index = argv.index(name)
+    if index + 1 >= len(argv):
+        raise ValueError(f"参数 {name} 缺少取值")
+    value = argv[index + 1]
+    del argv[index:index + 2]
+    return value
+
 if __name__ == "__main__":
+    mca = None
     try:
-        mca = MCARequest()
+        import sys
+        
+        # --hedge: 慢请求超过接口p95时发出对冲请求
+        hedging = "--hedge" in sys.argv
+        if hedging:
+            sys.argv.remove("--hedge")
+        
+        # --record <文件>: 录制请求和响应；--replay <文件>: 离线回放
+        record_path = pop_option(sys.argv, "--record")
+        replay_path = pop_option(sys.argv, "--replay")
+        replay_latency = pop_option(sys.argv, "--replay-latency")
+        replay_bandwidth = pop_option(sys.argv, "--replay-bandwidth")
+        
+        # --profile: 分阶段计时；--profile-cpu: 记录cProfile；--profile-memory: 记录内存峰值
+        use_cprofile = "--profile-cpu" in sys.argv
+        use_tracemalloc = "--profile-memory" in sys.argv
+        profiling = "--profile" in sys.argv or use_cprofile or use_tracemalloc
+        for flag in ("--profile", "--profile-cpu", "--profile-memory"):
+            if flag in sys.argv:
+                sys.argv.remove(flag)
+        profiler = PhaseProfiler(enabled=profiling, use_cprofile=use_cprofile, use_tracemalloc=use_tracemalloc)
+        
+        # --trace <文件>: 按课程记录获取、解析和渲染的span（OTLP/JSON Lines）
+        tracer = Tracer(pop_option(sys.argv, "--trace"))
+        
+        mca = MCARequest(hedging=hedging, profiler=profiler, tracer=tracer, verbose=True)
+        
+        # --all-versions: 获取每个课程所有版本的章节；--snapshot: 额外保存按内容寻址的快照清单
+        if "--all-versions" in sys.argv:
+            sys.argv.remove("--all-versions")
+            mca.all_versions = True
+        if "--snapshot" in sys.argv:
+            sys.argv.remove("--snapshot")
+            mca.object_store = ObjectStore(os.path.join(mca.data_dir, "objects"))
+        
+        # --sessions <配置文件>: 多身份会话池；--session-strategy round_robin|least_loaded: 调度策略
+        sessions_config = pop_option(sys.argv, "--sessions")
+        session_strategy = pop_option(sys.argv, "--session-strategy")
+        if sessions_config:
+            mca.use_session_pool(SessionPool.from_config(sessions_config, session_strategy))
+            print(f"会话池: {len(mca.sessions.members)} 个会话，调度策略 {mca.sessions.strategy}")
+        
+        # --workers <数量>: 丰富课程时的并发线程数
+        workers = pop_option(sys.argv, "--workers")
+        if workers:
+            mca.set_enrich_workers(int(workers))
+        
+        # --priority <规则>: 丰富顺序；--time-budget <秒> / --request-budget <数量>: 丰富预算
+        mca.enrich_priority = pop_option(sys.argv, "--priority")
+        try:
+            parse_priority(mca.enrich_priority)
+        except ValueError as e:
+            print(f"错误: {e}")
+            sys.exit(1)
+        time_budget = pop_option(sys.argv, "--time-budget")
+        request_budget = pop_option(sys.argv, "--request-budget")
+        mca.enrich_budget = EnrichBudget(float(time_budget) if time_budget else None,
+                                         int(request_budget) if request_budget else None)
+        
+        # --lazy: 不预先丰富全部课程，浏览时只获取选中的课程；--prefetch <数量>: 同时预取其后的课程数
+        if "--lazy" in sys.argv:
+            sys.argv.remove("--lazy")
+            mca.lazy = True
+        prefetch = pop_option(sys.argv, "--prefetch")
+        if prefetch:
+            mca.lazy_prefetch = int(prefetch)
+        
+        # --no-filter: 选择课程包时列出全部课程包，不使用即时过滤界面
+        if "--no-filter" in sys.argv:
+            sys.argv.remove("--no-filter")
+            mca.selection_filter = False
+        
+        # --page-size <数量>: 课程包列表每页数量
+        page_size = pop_option(sys.argv, "--page-size")
+        if page_size:
+            mca.package_page_size = int(page_size)
+        
+        # --compress gz|xz: 压缩保存丰富结果；--external-desc: 描述字段外置到单独的去重文件
+        mca.output_compression = pop_option(sys.argv, "--compress")
+        if mca.output_compression and mca.output_compression not in COMPRESSION_SUFFIXES:
+            print(f"错误: 不支持的压缩格式 '{mca.output_compression}'，可选: {', '.join(COMPRESSION_SUFFIXES)}")
+            sys.exit(1)
+        if "--external-desc" in sys.argv:
+            sys.argv.remove("--external-desc")
+            mca.externalize_descriptions = True
+        # --compact-json: 不压缩时也以紧凑格式保存丰富结果，写入更快、文件更小
+        if "--compact-json" in sys.argv:
+            sys.argv.remove("--compact-json")
+            mca.json_compact = True
+        if record_path:
+            mca.enable_recording(record_path)
+        elif replay_path:
+            if replay_latency not in (None, "recorded"):
+                replay_latency = float(replay_latency)
+            mca.enable_replay(replay_path, latency=replay_latency,
+                              bandwidth=float(replay_bandwidth) if replay_bandwidth else None)
+        # --cache-pack <文件>: 使用其他节点导出的缓存包，命中的版本列表和课程详情请求不访问网络
+        cache_pack_path = pop_option(sys.argv, "--cache-pack")
+        if cache_pack_path:
+            try:
+                mca.enable_cache_pack(cache_pack_path)
+            except (OSError, ValueError) as e:
+                print(f"错误: 无法打开缓存包: {e}")
+                sys.exit(1)
+        
+        # --workspace <名称>|new|auto|latest: 在data/runs/下的独立工作区中读写结果，多个运行可以在同一台机器上并行
+        # new为新的运行ID；auto在交互流程中按所选课程包和版本命名，在其他命令中同latest；latest为最近一次写入的工作区
+        workspace_name = pop_option(sys.argv, "--workspace")
+        is_command = len(sys.argv) > 1 and sys.argv[1] in ("--generate-md", "resume", "retry-failed", "--serve", "--pretty-json")
+        auto_workspace = workspace_name == "auto" and not is_command
+        workspace = None
+        if workspace_name in ("latest", "auto") and not auto_workspace:
+            workspace = Workspace.latest(mca.data_dir)
+            if workspace is None:
+                print(f"错误: 没有找到最新结果指针 {os.path.join(mca.data_dir, 'runs', 'latest.json')}")
+                sys.exit(1)
+        elif workspace_name == "new":
+            workspace = Workspace(mca.data_dir)
+        elif workspace_name and not auto_workspace:
+            workspace = Workspace(mca.data_dir, workspace_name)
+        if workspace is not None:
+            if len(sys.argv) > 1 and sys.argv[1] == "--serve":
+                # 服务只读取结果，文件都是原子替换的，不需要占用工作区
+                mca.data_dir = workspace.path
+            else:
+                try:
+                    mca.use_workspace(workspace)
+                except WorkspaceBusyError as e:
+                    print(f"错误: {e}")
+                    sys.exit(1)
         
         # 检查是否添加了命令行参数，支持直接生成MD文件的功能
-        import sys
         if len(sys.argv) > 1 and sys.argv[1] == "--generate-md":
+            # --export catalog,jsonl,stats: 在同一次遍历中额外生成目录摘要、JSONL导出和统计摘要
+            export = pop_option(sys.argv, "--export")
+            extra_sinks = [name.strip() for name in export.split(",") if name.strip()] if export else []
+            unknown = [name for name in extra_sinks if name not in SINK_TYPES]
+            if unknown:
+                print(f"错误: 未知的输出目标: {', '.join(unknown)}，可选: {', '.join(SINK_TYPES)}")
+                sys.exit(1)
             json_path = sys.argv[2] if len(sys.argv) > 2 else None
             md_path = sys.argv[3] if len(sys.argv) > 3 else None
             
@@ -1302,7 +2242,35 @@ if __name__ == "__main__":
                 except ValueError:
                     print(f"警告: 无效的分割大小 '{sys.argv[4]}'，将使用默认值（不分割）")
             
-            mca.generate_markdown_from_enriched_json(json_path, md_path, max_chars)
+            mca.generate_markdown_from_enriched_json(json_path, md_path, max_chars, extra_sinks=extra_sinks)
+            sys.exit(0)
+        
+        # 生成格式化副本：python mca_request.py --pretty-json [json_path] [output_path]
+        if len(sys.argv) > 1 and sys.argv[1] == "--pretty-json":
+            json_path = sys.argv[2] if len(sys.argv) > 2 else mca._latest_enriched_file()
+            if json_path is None or not os.path.exists(json_path):
+                print(f"错误: 没有找到JSON文件 {json_path or ''}")
+                sys.exit(1)
+            output_path = write_pretty_copy(json_path, sys.argv[3] if len(sys.argv) > 3 else None)
+            print(f"格式化副本已保存到: {output_path}")
+            sys.exit(0)
+        
+        # 继续获取待获取的课程：python mca_request.py resume [enriched_json_path]
+        if len(sys.argv) > 1 and sys.argv[1] == "resume":
+            mca.resume_enrichment(sys.argv[2] if len(sys.argv) > 2 else None)
+            sys.exit(0)
+        
+        # 重试失败课程：python mca_request.py retry-failed [dead_letter_file]
+        if len(sys.argv) > 1 and sys.argv[1] == "retry-failed":
+            mca.retry_failed(sys.argv[2] if len(sys.argv) > 2 else None)
+            sys.exit(0)
+        
+        # 常驻服务模式：python mca_request.py --serve [input_json_path] [port]
+        if len(sys.argv) > 1 and sys.argv[1] == "--serve":
+            from mca_server import serve
+            json_path = sys.argv[2] if len(sys.argv) > 2 else os.path.join(mca.data_dir, "course_outline_enriched_simple.json")
+            port = int(sys.argv[3]) if len(sys.argv) > 3 else 8765
+            serve(mca, json_path, port=port)
             sys.exit(0)
         
         # 步骤1: 获取课程列表并选择课程
@@ -1320,6 +2288,13 @@ if __name__ == "__main__":
                     mca.display_course_package_version(selected_version)
                     package_version_id = selected_version.get('id')
                     
+                    if package_version_id and auto_workspace:
+                        try:
+                            mca.use_workspace(Workspace(mca.data_dir, make_key(course_id, package_version_id)))
+                        except WorkspaceBusyError as e:
+                            print(f"错误: {e}")
+                            sys.exit(1)
+                    
                     if package_version_id:
                         # 步骤3: 获取课程大纲
                         print(f"\n正在获取课程大纲...")
@@ -1343,8 +2318,11 @@ if __name__ == "__main__":
                                 print("\n\n是否需要获取每个课程的详细信息？(y/n): ")
                                 enrich_option = input()
                                 if enrich_option.lower() == 'y' or enrich_option.lower() == '':
-                                    print("\n正在获取每个课程的详细信息...")
-                                    enriched_outline = mca.enrich_course_outline(outline_list)
+                                    if mca.lazy:
+                                        mca.explore_outline(outline_list)
+                                    else:
+                                        print("\n正在获取每个课程的详细信息...")
+                                        enriched_outline = mca.enrich_course_outline(outline_list)
                                     
                                     # 步骤5: 生成Markdown大纲
                                     print("\n\n是否需要生成Markdown格式的课程大纲？(y/n): ")
@@ -1386,8 +2364,11 @@ if __name__ == "__main__":
                                 print("\n\n是否需要获取每个课程的详细信息？(y/n): ")
                                 enrich_option = input()
                                 if enrich_option.lower() == 'y' or enrich_option.lower() == '':
-                                    print("\n正在获取每个课程的详细信息...")
-                                    enriched_outline = mca.enrich_course_outline(outline_list)
+                                    if mca.lazy:
+                                        mca.explore_outline(outline_list)
+                                    else:
+                                        print("\n正在获取每个课程的详细信息...")
+                                        enriched_outline = mca.enrich_course_outline(outline_list)
                                     
                                     print("\n\n是否需要生成Markdown格式的课程大纲？(y/n): ")
                                     md_option = input()
@@ -1431,8 +2412,11 @@ if __name__ == "__main__":
                                 print("\n\n是否需要获取每个课程的详细信息？(y/n): ")
                                 enrich_option = input()
                                 if enrich_option.lower() == 'y' or enrich_option.lower() == '':
-                                    print("\n正在获取每个课程的详细信息...")
-                                    enriched_outline = mca.enrich_course_outline(outline_list)
+                                    if mca.lazy:
+                                        mca.explore_outline(outline_list)
+                                    else:
+                                        print("\n正在获取每个课程的详细信息...")
+                                        enriched_outline = mca.enrich_course_outline(outline_list)
                                     
                                     print("\n\n是否需要生成Markdown格式的课程大纲？(y/n): ")
                                     md_option = input()
@@ -1477,4 +2461,11 @@ if __name__ == "__main__":
         # 添加详细错误信息
         import traceback
         print("\n详细错误信息:")
-        traceback.print_exc() 
\ No newline at end of file
+        traceback.print_exc()
+    finally:
+        if mca:
+            mca.save_cassette()
+            mca.profiler.save()
+            if mca.tracer.enabled:
+                mca.tracer.close()
+                print(f"追踪: {mca.tracer.traces} 条trace，{mca.tracer.spans_written} 个span已写入 {mca.tracer.path}") 
\ No newline at end of file
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""部分丰富的调度：按优先级排列课程，在时间或请求数预算内尽量多地获取
+
+预算用尽时停止发出新的获取，尚未获取的课程标记为待获取（enrichStatus: pending），
+之后运行 python mca_request.py resume 只补齐这些课程。
+"""
+
+import threading
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+# 未丰富课程的标记字段及取值
+ENRICH_STATUS_KEY = "enrichStatus"
+ENRICH_PENDING = "pending"
+
+# 支持的优先级规则
+PRIORITY_HELP = "order | duration | stage:ID,ID | ids:ID,ID"
+
+
+def parse_priority(spec: Optional[str]) -> Tuple[str, List[str]]:
+    """解析优先级规则
+
+    Args:
+        spec: order（大纲顺序）、duration（总时长长的优先）、stage:ID,ID（指定阶段优先）、
+              ids:ID,ID（指定课程优先）
+
+    Returns:
+        tuple: (规则名称, 参数列表)
+    """
+    if not spec:
+        return "order", []
+    name, _, args = spec.partition(":")
+    values = [v.strip() for v in args.split(",") if v.strip()]
+    if name not in ("order", "duration", "stage", "ids") or (name in ("stage", "ids") and not values):
+        raise ValueError(f"无效的优先级规则: {spec}，可选: {PRIORITY_HELP}")
+    return name, values
+
+
+def prioritize(tasks: List[tuple], spec: Optional[str]) -> List[tuple]:
+    """按优先级规则重新排列丰富任务，规则未覆盖的任务保持原有顺序排在后面
+
+    Args:
+        tasks: (课程对象, 课程ID, 课程名称, 映射信息) 列表
+        spec: 优先级规则，见parse_priority
+    """
+    name, values = parse_priority(spec)
+    if name == "order":
+        return list(tasks)
+    if name == "duration":
+        def key(item):
+            course = item[1][0]
+            return -int(course.get("durationTotal") or course.get("durationSum") or 0), item[0]
+    else:
+        rank = {value: i for i, value in enumerate(values)}
+        if name == "stage":
+            def key(item):
+                return rank.get(str(item[1][3].get("stageId")), len(rank)), item[0]
+        else:
+            def key(item):
+                return rank.get(str(item[1][1]), len(rank)), item[0]
+    return [task for _, task in sorted(enumerate(tasks), key=key)]
+
+
+class EnrichBudget:
+    """丰富的时间和请求数预算
+
+    Args:
+        seconds: 时间预算（秒），None表示不限制
+        requests: 请求数预算，None表示不限制
+    """
+
+    def __init__(self, seconds: Optional[float] = None, requests: Optional[int] = None):
+        self.seconds = seconds
+        self.requests = requests
+        self.started = None
+        self.request_base = 0
+        self.stopped_by = None
+        self._lock = threading.Lock()
+
+    @property
+    def limited(self) -> bool:
+        return self.seconds is not None or self.requests is not None
+
+    def start(self, requests_sent: int = 0):
+        """开始计时，requests_sent为开始时已发出的请求数"""
+        self.started = time.monotonic()
+        self.request_base = requests_sent
+        self.stopped_by = None
+
+    def exhausted(self, requests_sent: int) -> bool:
+        """预算是否已用尽；用尽后保持用尽状态"""
+        with self._lock:
+            if self.stopped_by:
+                return True
+            if self.seconds is not None and time.monotonic() - self.started >= self.seconds:
+                self.stopped_by = "time"
+            elif self.requests is not None and requests_sent - self.request_base >= self.requests:
+                self.stopped_by = "requests"
+            return self.stopped_by is not None
+
+    def describe(self) -> str:
+        parts = []
+        if self.seconds is not None:
+            parts.append(f"{self.seconds:g}秒")
+        if self.requests is not None:
+            parts.append(f"{self.requests}个请求")
+        return "、".join(parts) if parts else "不限"
+
+
+def mark_pending(course: Dict[str, Any]):
+    """标记课程尚未丰富"""
+    course[ENRICH_STATUS_KEY] = ENRICH_PENDING
+
+
+def is_pending(course: Dict[str, Any]) -> bool:
+    return course.get(ENRICH_STATUS_KEY) == ENRICH_PENDING
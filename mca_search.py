@@ -0,0 +1,485 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""课程包的即时过滤：按标题、名称、描述和ID建立二元组倒排索引，逐键缩小候选并分页显示
+
+索引随课程包分页到达逐步建立：第一页到达后即可开始过滤，其余页面在后台加载并加入索引。
+每个查询词先用单字或二元组的倒排表求交集得到候选，再在候选上确认子串匹配；
+查询在上一次查询后追加字符时，只在上一次的结果中继续筛选。
+"""
+
+import os
+import select
+import sys
+import threading
+import time
+import unicodedata
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Iterable
+
+# 参与检索的字段，前四个为标题类字段
+SEARCH_FIELDS = ("title", "name", "packageName", "courseName", "id", "description")
+
+# 分页显示时每页的课程包数量
+PAGE_SIZE = 10
+
+# 缓存最近查询结果的数量
+QUERY_CACHE_SIZE = 64
+
+# 描述只在列表中显示前这么多个字符
+DESC_PREVIEW_LENGTH = 50
+
+# 后台加载课程包期间，没有按键时检查新到达课程包的间隔（秒）
+REDRAW_INTERVAL = 0.2
+
+
+def normalize(text: Any) -> str:
+    """统一全角/半角和大小写，便于不区分大小写和全半角地匹配"""
+    return unicodedata.normalize("NFKC", str(text)).lower() if text is not None else ""
+
+
+def package_title(package: Dict[str, Any]) -> str:
+    """课程包的显示名称，与课程列表中的取值顺序一致"""
+    title = package.get("title", "未知名称")
+    if not title:
+        title = package.get("name", package.get("packageName", package.get("courseName", "未知名称")))
+    return title
+
+
+class PackageIndex:
+    """课程包的二元组/单字倒排索引
+
+    Args:
+        packages: 课程包列表，结果以列表中的下标表示；之后到达的课程包通过add追加
+    """
+
+    def __init__(self, packages: List[Dict[str, Any]]):
+        self.packages = []
+        # 标题类字段规范化后的文本，标题中包含查询词的课程包排在前面
+        self.titles = []
+        # 所有字段拼接后的文本，用于确认子串匹配
+        self.haystacks = []
+        self.unigrams = {}
+        self.bigrams = {}
+        # 查询 -> (按原有顺序的匹配, 排序后的匹配)
+        self._cache = {}
+        self._last = None
+        # 每次追加课程包后加1，过滤界面据此重新查询
+        self.generation = 0
+        self.build_seconds = 0.0
+        self._lock = threading.Lock()
+        self.add(packages)
+
+    def __len__(self):
+        return len(self.packages)
+
+    def add(self, packages: Iterable[Dict[str, Any]]):
+        """把课程包追加到索引中（可以由后台加载线程在过滤期间调用）"""
+        started = time.perf_counter()
+        with self._lock:
+            for package in packages:
+                i = len(self.haystacks)
+                fields = [normalize(package.get(name)) for name in SEARCH_FIELDS]
+                haystack = "\n".join(fields)
+                self.titles.append("\n".join(fields[:4]))
+                self.haystacks.append(haystack)
+                for ch in set(haystack):
+                    self.unigrams.setdefault(ch, []).append(i)
+                for gram in {haystack[j:j + 2] for j in range(len(haystack) - 1)}:
+                    self.bigrams.setdefault(gram, []).append(i)
+                self.packages.append(package)
+            # 已缓存的结果不包含新的课程包
+            self._cache.clear()
+            self._last = None
+            self.generation += 1
+        self.build_seconds += time.perf_counter() - started
+
+    def _candidates(self, term: str) -> List[int]:
+        """由倒排表求交集得到可能包含term的课程包（按原有顺序）
+
+        单字和两个字的查询词直接由倒排表得到确切结果，更长的查询词还需要确认子串匹配。
+        """
+        if len(term) == 1:
+            return self.unigrams.get(term, [])
+        postings = []
+        for j in range(len(term) - 1):
+            posting = self.bigrams.get(term[j:j + 2])
+            if not posting:
+                return []
+            postings.append(posting)
+        if len(postings) == 1:
+            return postings[0]
+        postings.sort(key=len)
+        result = set(postings[0])
+        for posting in postings[1:]:
+            result.intersection_update(posting)
+            if not result:
+                return []
+        return sorted(result)
+
+    def search(self, query: str) -> List[int]:
+        """查找所有字段合起来包含全部查询词（以空白分隔）的课程包
+
+        Returns:
+            list: 匹配的课程包下标，标题中包含第一个查询词的排在前面，其余保持原有顺序；
+                  空查询返回全部课程包
+        """
+        with self._lock:
+            return self._search(query)
+
+    def _search(self, query: str) -> List[int]:
+        query = normalize(query).strip()
+        terms = query.split()
+        if not terms:
+            return list(range(len(self.packages)))
+        cached = self._cache.get(query)
+        if cached is not None:
+            self._last = (query, cached[0])
+            return cached[1]
+
+        haystacks = self.haystacks
+        last = self._last
+        if last and query.startswith(last[0]) and len(terms) >= len(last[0].split()):
+            # 在上一次查询后追加字符：上一次的结果已经是超集，只需确认最后一个变化的查询词及新增的查询词
+            changed = terms[len(last[0].split()) - 1:]
+            matches = last[1]
+            for term in changed:
+                matches = [i for i in matches if term in haystacks[i]]
+        else:
+            terms_by_length = sorted(terms, key=len, reverse=True)
+            matches = self._candidates(terms_by_length[0])
+            if len(terms_by_length[0]) > 2:
+                matches = [i for i in matches if terms_by_length[0] in haystacks[i]]
+            for term in terms_by_length[1:]:
+                matches = [i for i in matches if term in haystacks[i]]
+
+        # 标题中包含第一个查询词的排在前面（稳定划分，不做整体排序）
+        first, titles = terms[0], self.titles
+        head = [i for i in matches if first in titles[i]]
+        if 0 < len(head) < len(matches):
+            ranked = head + [i for i in matches if first not in titles[i]]
+        else:
+            ranked = matches
+
+        if len(self._cache) >= QUERY_CACHE_SIZE:
+            self._cache.pop(next(iter(self._cache)))
+        self._cache[query] = (matches, ranked)
+        self._last = (query, matches)
+        return ranked
+
+
+class PackageLoader:
+    """在后台线程中把其余课程包逐个加入索引，过滤界面先显示已经到达的部分
+
+    Args:
+        index: 课程包索引
+        packages: 其余课程包的迭代器（如iter_course_packages），选择结束时停止读取并关闭
+    """
+
+    def __init__(self, index: PackageIndex, packages: Iterable[Dict[str, Any]]):
+        self.index = index
+        self.done = False
+        self.error = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(iter(packages),), daemon=True,
+                                        name="mca-package-loader")
+        self._thread.start()
+
+    def _run(self, packages):
+        try:
+            for package in packages:
+                if self._stop.is_set():
+                    break
+                self.index.add([package])
+        except Exception as e:
+            self.error = e
+        finally:
+            # 关闭生成器，取消尚未开始的分页请求
+            close = getattr(packages, "close", None)
+            if close:
+                close()
+            self.done = True
+
+    def stop(self):
+        self._stop.set()
+
+
+class FilterView:
+    """过滤结果的分页状态
+
+    Args:
+        index: 课程包索引
+        page_size: 每页显示的数量
+        loader: 正在后台加载其余课程包时的加载器
+    """
+
+    def __init__(self, index: PackageIndex, page_size: int = PAGE_SIZE, loader: Optional[PackageLoader] = None):
+        self.index = index
+        self.page_size = page_size
+        self.loader = loader
+        self.query = ""
+        self.generation = index.generation
+        self.matches = index.search("")
+        self.page = 0
+        self.cursor = 0
+        self.search_seconds = 0.0
+        self._shown = None
+
+    @property
+    def loading(self) -> bool:
+        return self.loader is not None and not self.loader.done
+
+    @property
+    def stale(self) -> bool:
+        """上次显示后是否有新的课程包到达或加载已结束"""
+        return self._shown != (self.index.generation, self.loading)
+
+    def refresh(self):
+        """有新的课程包到达时重新执行当前查询，保留页码和光标位置"""
+        if self.index.generation == self.generation:
+            return
+        self.generation = self.index.generation
+        self.matches = self.index.search(self.query)
+        self.page = min(self.page, self.page_count - 1)
+
+    def set_query(self, query: str):
+        started = time.perf_counter()
+        self.matches = self.index.search(query)
+        self.search_seconds = time.perf_counter() - started
+        self.query = query
+        self.page = 0
+        self.cursor = 0
+
+    @property
+    def page_count(self) -> int:
+        return max(1, (len(self.matches) + self.page_size - 1) // self.page_size)
+
+    def page_items(self) -> List[int]:
+        start = self.page * self.page_size
+        return self.matches[start:start + self.page_size]
+
+    def turn(self, delta: int):
+        self.page = min(max(self.page + delta, 0), self.page_count - 1)
+        self.cursor = 0
+
+    def move(self, delta: int):
+        """移动光标，越过页边界时翻页"""
+        items = self.page_items()
+        if not items:
+            return
+        position = self.page * self.page_size + self.cursor + delta
+        position = min(max(position, 0), len(self.matches) - 1)
+        self.page, self.cursor = divmod(position, self.page_size)
+
+    def selected(self) -> Optional[Dict[str, Any]]:
+        items = self.page_items()
+        if not items:
+            return None
+        return self.index.packages[items[min(self.cursor, len(items) - 1)]]
+
+    def render(self, highlight: bool = True) -> str:
+        """当前页的文本（只包含一页，不重绘整个列表）"""
+        self._shown = (self.generation, self.loading)
+        status = f"匹配 {len(self.matches)}/{len(self.index)} 个课程包（{self.search_seconds * 1000:.3f}ms），" \
+                 f"第 {self.page + 1}/{self.page_count} 页"
+        if self.loading:
+            status += "，正在加载其余课程包..."
+        elif self.loader is not None and self.loader.error is not None:
+            status += f"，加载其余课程包失败: {self.loader.error}"
+        lines = [f"过滤: {self.query}", status, "-" * 80]
+        for row, i in enumerate(self.page_items()):
+            package = self.index.packages[i]
+            description = package.get("description") or "无描述"
+            if len(description) > DESC_PREVIEW_LENGTH:
+                description = description[:DESC_PREVIEW_LENGTH] + "..."
+            marker = ">" if highlight and row == self.cursor else " "
+            number = self.page * self.page_size + row + 1
+            lines.append(f"{marker}{number:4}. {package_title(package)} (ID: {package.get('id')}, "
+                         f"价格: ¥{package.get('price', package.get('actualPrice', 0))})")
+            lines.append(f"       描述: {description}")
+        if not self.matches:
+            lines.append("  没有匹配的课程包")
+        return "\n".join(lines)
+
+
+# 方向键的转义序列，Windows的扫描码先转换为同样的序列
+ARROW_SEQUENCES = {"\x1b[A": "up", "\x1b[B": "down", "\x1b[C": "right", "\x1b[D": "left",
+                   "\x1bOA": "up", "\x1bOB": "down", "\x1bOC": "right", "\x1bOD": "left"}
+WINDOWS_ARROWS = {"H": "A", "P": "B", "M": "C", "K": "D"}
+
+
+@contextmanager
+def raw_terminal():
+    """在整个过滤过程中保持终端为原始模式（逐键读取、不回显），结束时恢复"""
+    if os.name == "nt":
+        yield
+        return
+    import termios
+    import tty
+    fd = sys.stdin.fileno()
+    old = termios.tcgetattr(fd)
+    try:
+        tty.setraw(fd)
+        yield
+    finally:
+        termios.tcsetattr(fd, termios.TCSADRAIN, old)
+
+
+def _read_input_posix() -> str:
+    fd = sys.stdin.fileno()
+    # 一次读取可能包含粘贴或输入法提交的多个字符，多字节字符被截断时补读剩余字节
+    data = os.read(fd, 64)
+    while True:
+        try:
+            return data.decode("utf-8")
+        except UnicodeDecodeError as e:
+            if e.reason != "unexpected end of data" or len(data) - e.start >= 4:
+                return data.decode("utf-8", errors="ignore")
+            data += os.read(fd, 1)
+
+
+def _read_input_windows() -> str:
+    import msvcrt
+    ch = msvcrt.getwch()
+    if ch in ("\x00", "\xe0"):
+        return "\x1b[" + WINDOWS_ARROWS.get(msvcrt.getwch(), "")
+    return ch
+
+
+def split_keys(text: str) -> List[str]:
+    """把一次读到的输入拆分为按键：方向键为up/down/left/right，控制字符单独一项，连续的可打印字符合为一项"""
+    keys = []
+    i = 0
+    while i < len(text):
+        sequence = text[i:i + 3]
+        if sequence in ARROW_SEQUENCES:
+            keys.append(ARROW_SEQUENCES[sequence])
+            i += 3
+        elif text[i].isprintable():
+            j = i
+            while j < len(text) and text[j].isprintable():
+                j += 1
+            keys.append(text[i:j])
+            i = j
+        else:
+            keys.append(text[i])
+            i += 1
+    return keys
+
+
+def input_ready(timeout: float) -> bool:
+    """等待最多timeout秒，返回是否有按键可以读取（需在raw_terminal中调用）"""
+    if os.name == "nt":
+        import msvcrt
+        deadline = time.monotonic() + timeout
+        while not msvcrt.kbhit():
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.02)
+        return True
+    return bool(select.select([sys.stdin.fileno()], [], [], timeout)[0])
+
+
+def read_keys() -> List[str]:
+    """读取一次输入并拆分为按键（需在raw_terminal中调用）"""
+    return split_keys(_read_input_windows() if os.name == "nt" else _read_input_posix())
+
+
+def supports_keys() -> bool:
+    """标准输入是否为可以逐键读取的终端"""
+    if not sys.stdin.isatty() or not sys.stdout.isatty():
+        return False
+    if os.name == "nt":
+        return True
+    try:
+        import termios  # noqa: F401
+        import tty  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _select_by_keys(view: FilterView) -> Optional[Dict[str, Any]]:
+    """逐键过滤：输入字符缩小列表，↑↓移动，←→翻页，回车选择，Esc退出"""
+    help_text = "输入关键词过滤（标题、描述、ID），↑↓ 选择，←→ 翻页，回车确认，Esc 退出"
+    with raw_terminal():
+        while True:
+            view.refresh()
+            # 清屏后只绘制当前页
+            sys.stdout.write("\x1b[H\x1b[J" + help_text + "\r\n" + view.render().replace("\n", "\r\n") + "\r\n")
+            sys.stdout.flush()
+            # 后台加载期间没有按键时定时检查，新到达的课程包无需按键即可显示
+            while view.loading and not view.stale and not input_ready(REDRAW_INTERVAL):
+                pass
+            if view.stale and not input_ready(0):
+                continue
+            for key in read_keys():
+                if key in ("\r", "\n"):
+                    selected = view.selected()
+                    if selected is not None:
+                        return selected
+                elif key in ("\x1b", "\x03"):
+                    return None
+                elif key in ("\x7f", "\x08"):
+                    view.set_query(view.query[:-1])
+                elif key == "up":
+                    view.move(-1)
+                elif key == "down":
+                    view.move(1)
+                elif key == "left":
+                    view.turn(-1)
+                elif key == "right":
+                    view.turn(1)
+                elif key.isprintable():
+                    view.set_query(view.query + key)
+
+
+def _select_by_lines(view: FilterView) -> Optional[Dict[str, Any]]:
+    """按行输入：数字选择当前结果中的编号，其他文本作为过滤条件，n/p翻页，0退出"""
+    print("输入关键词过滤（以/开头可以按数字ID过滤），输入编号选择，n/p 翻页，0 退出")
+    while True:
+        view.refresh()
+        print(view.render(highlight=False))
+        text = input("\n过滤或选择: ").strip()
+        if text == "0":
+            return None
+        if text.isdigit():
+            number = int(text)
+            if 1 <= number <= len(view.matches):
+                return view.index.packages[view.matches[number - 1]]
+            print(f"错误: 请输入1-{len(view.matches)}之间的编号")
+        elif text.lower() == "n":
+            view.turn(1)
+        elif text.lower() == "p":
+            view.turn(-1)
+        else:
+            view.set_query(text[1:] if text.startswith("/") else text)
+
+
+def select_package(packages: List[Dict[str, Any]], page_size: int = PAGE_SIZE,
+                   keys: Optional[bool] = None,
+                   more: Optional[Iterable[Dict[str, Any]]] = None) -> Optional[Dict[str, Any]]:
+    """建立索引并进入过滤选择界面
+
+    Args:
+        packages: 已经到达的课程包（如第一页）
+        page_size: 每页显示的数量
+        keys: 是否逐键过滤，None表示在终端中自动启用，否则按行输入
+        more: 其余课程包的迭代器，在后台加载并加入索引，过滤界面不等待它们
+
+    Returns:
+        dict: 选中的课程包，退出时返回None
+    """
+    index = PackageIndex(packages)
+    loader = PackageLoader(index, more) if more is not None else None
+    view = FilterView(index, page_size, loader)
+    if keys is None:
+        keys = supports_keys()
+    if loader is not None:
+        print(f"已为第一批 {len(packages)} 个课程包建立索引，其余课程包在后台加载")
+    else:
+        print(f"已为 {len(index)} 个课程包建立索引（{index.build_seconds * 1000:.1f}ms）")
+    try:
+        return _select_by_keys(view) if keys else _select_by_lines(view)
+    finally:
+        if loader is not None:
+            loader.stop()
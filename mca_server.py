@@ -0,0 +1,308 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""本地大纲服务：常驻内存加载丰富后的大纲，通过HTTP提供渲染好的Markdown
+
+接口：
+    GET /toc                       总目录
+    GET /courses                   课程列表（JSON）
+    GET /courses/<序号或课程ID>     单个课程的Markdown
+    GET /split?max_chars=N         分割文件索引
+    GET /split/<n>?max_chars=N     第n个分割文件的内容
+    GET /health                    服务状态（JSON）
+
+所有Markdown响应都带ETag，请求头If-None-Match匹配时返回304。
+丰富后的JSON文件在磁盘上发生变化时自动重新加载。
+"""
+
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, List, Optional, Tuple
+from urllib.parse import urlsplit, parse_qs, unquote
+
+from mca_storage import load_json_file, hydrate_if_manifest, find_existing, content_hash
+
+# 渲染结果缓存的默认条目上限
+DEFAULT_CACHE_SIZE = 256
+
+# 保留分组结果的不同max_chars数量
+SPLIT_CACHE_SIZE = 4
+
+
+class OutlineCatalog:
+    """常驻内存的大纲数据和渲染缓存
+
+    Args:
+        mca: MCARequest实例，用于复用其Markdown渲染方法
+        json_file_path: 丰富后的JSON文件路径（支持压缩文件和快照清单）
+        cache_size: 渲染结果缓存的条目上限，超出时淘汰最久未使用的条目
+    """
+
+    def __init__(self, mca, json_file_path: str, cache_size: int = DEFAULT_CACHE_SIZE):
+        self.mca = mca
+        self.json_file_path = json_file_path
+        self.cache_size = cache_size
+        self.courses = []
+        self.generation = 0
+        self.loaded_at = None
+        self.hits = 0
+        self.misses = 0
+        self._signature = None
+        self._by_id = {}
+        self._cache = OrderedDict()
+        # (generation, max_chars) -> 分割后的课程内容分组，不占用渲染缓存的条目
+        self._split_cache = OrderedDict()
+        self._lock = threading.RLock()
+        self.reload_if_changed()
+
+    def _file_signature(self) -> Optional[Tuple[str, int, int]]:
+        path = find_existing(self.json_file_path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return path, stat.st_mtime_ns, stat.st_size
+
+    def reload_if_changed(self) -> bool:
+        """文件变化时重新加载并清空渲染缓存
+
+        Returns:
+            bool: 是否重新加载
+        """
+        signature = self._file_signature()
+        if signature is None:
+            raise FileNotFoundError(f"文件不存在: {self.json_file_path}")
+        if signature == self._signature:
+            return False
+
+        with self._lock:
+            if signature == self._signature:
+                return False
+            path = signature[0]
+            data = hydrate_if_manifest(load_json_file(path), path)
+            courses = self.mca.extract_enriched_courses(data)
+            if courses is None:
+                raise ValueError(f"JSON数据中没有找到课程列表: {path}")
+            self.courses = courses
+            self._by_id = {}
+            for course in courses:
+                for key in ("courseNo", "id"):
+                    if course.get(key) is not None:
+                        self._by_id.setdefault(str(course[key]), course)
+            self._cache.clear()
+            self._split_cache.clear()
+            self._signature = signature
+            self.generation += 1
+            self.loaded_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            # 通过MCARequest._log输出：命令行模式打印，库模式交给logging
+            self.mca._log(f"已加载 {path}，共 {len(courses)} 个课程（第{self.generation}次加载）")
+            return True
+
+    def _lookup(self, key: Tuple) -> Optional[Tuple[bytes, str]]:
+        """从缓存取出渲染结果，未命中时返回None"""
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+            return entry
+
+    def _cached(self, key: Tuple, render) -> Tuple[bytes, str]:
+        """从缓存取出渲染结果，未命中时渲染并放入缓存"""
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is not None:
+                return entry
+            generation = self.generation
+        body = render().encode("utf-8")
+        entry = (body, '"%s"' % content_hash(body))
+        with self._lock:
+            self.misses += 1
+            if generation == self.generation:
+                self._cache[key] = entry
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return entry
+
+    def find_course(self, key: str) -> Optional[Dict[str, Any]]:
+        """按课程ID或从1开始的序号查找课程"""
+        course = self._by_id.get(key)
+        if course is None and key.isdigit() and 1 <= int(key) <= len(self.courses):
+            course = self.courses[int(key) - 1]
+        return course
+
+    def toc(self) -> Tuple[bytes, str]:
+        """总目录"""
+        def render():
+            lines = ["# 课程大纲总目录\n\n"]
+            for i, course in enumerate(self.courses, 1):
+                lines.append(self.mca.render_toc_line(i, course))
+            return "".join(lines)
+        return self._cached(("toc",), render)
+
+    def course(self, key: str) -> Optional[Tuple[bytes, str]]:
+        """单个课程的Markdown，找不到时返回None"""
+        course = self.find_course(key)
+        if course is None:
+            return None
+        return self._cached(("course", id(course)), lambda: self.mca.render_course_markdown(course))
+
+    def _split_groups(self, max_chars: int) -> List[List[str]]:
+        """按max_chars分割的课程内容，每次加载后每个max_chars只计算一次
+
+        课程内容已在渲染缓存中时直接使用，否则直接渲染而不放入缓存，避免一次分割淘汰掉全部缓存条目。
+        """
+        with self._lock:
+            key = (self.generation, max_chars)
+            groups = self._split_cache.get(key)
+            if groups is not None:
+                self._split_cache.move_to_end(key)
+                return groups
+            generation = self.generation
+            courses = self.courses
+        contents = []
+        for course in courses:
+            with self._lock:
+                entry = self._cache.get(("course", id(course)))
+            contents.append(entry[0].decode("utf-8") if entry else self.mca.render_course_markdown(course))
+        groups = self.mca.split_course_contents(contents, max_chars)
+        with self._lock:
+            if generation == self.generation:
+                self._split_cache[key] = groups
+                while len(self._split_cache) > SPLIT_CACHE_SIZE:
+                    self._split_cache.popitem(last=False)
+        return groups
+
+    def split_index(self, max_chars: int) -> Tuple[bytes, str]:
+        """分割文件索引"""
+        def render():
+            lines = ["# 课程大纲总目录\n\n", "## 文件索引\n\n"]
+            for i, _ in enumerate(self._split_groups(max_chars), 1):
+                lines.append(f"- [课程大纲 第{i}部分](/split/{i}?max_chars={max_chars})\n")
+            return "".join(lines)
+        return self._cached(("split_index", max_chars), render)
+
+    def split_part(self, max_chars: int, index: int) -> Optional[Tuple[bytes, str]]:
+        """第index个分割文件的内容，超出范围时返回None"""
+        entry = self._lookup(("split", max_chars, index))
+        if entry is not None:
+            return entry
+        groups = self._split_groups(max_chars)
+        if not 1 <= index <= len(groups):
+            return None
+        return self._cached(("split", max_chars, index), lambda: "".join(groups[index - 1]))
+
+    def status(self) -> Dict[str, Any]:
+        """服务状态"""
+        with self._lock:
+            return {
+                "file": self._signature[0] if self._signature else None,
+                "courses": len(self.courses),
+                "generation": self.generation,
+                "loadedAt": self.loaded_at,
+                "cacheEntries": len(self._cache),
+                "cacheSize": self.cache_size,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+class OutlineRequestHandler(BaseHTTPRequestHandler):
+    """大纲服务的请求处理"""
+
+    catalog = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str, etag: Optional[str] = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        if etag:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _send_markdown(self, entry: Optional[Tuple[bytes, str]]):
+        if entry is None:
+            self._send_error(404, "未找到")
+            return
+        body, etag = entry
+        if etag in (tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self._send(200, body, "text/markdown; charset=utf-8", etag)
+
+    def _send_json(self, obj: Any, status: int = 200):
+        self._send(status, json.dumps(obj, ensure_ascii=False).encode("utf-8"), "application/json; charset=utf-8")
+
+    def _send_error(self, status: int, message: str):
+        self._send_json({"error": message}, status)
+
+    def do_GET(self):
+        catalog = self.catalog
+        try:
+            catalog.reload_if_changed()
+        except (OSError, ValueError) as e:
+            # 文件正在写入或暂时不可用时继续使用已加载的数据
+            if not catalog.courses:
+                self._send_error(503, f"大纲数据不可用: {e}")
+                return
+
+        parts = urlsplit(self.path)
+        path = [unquote(p) for p in parts.path.strip("/").split("/") if p]
+        query = parse_qs(parts.query)
+
+        if not path or path == ["toc"]:
+            self._send_markdown(catalog.toc())
+        elif path == ["health"]:
+            self._send_json(catalog.status())
+        elif path == ["courses"]:
+            self._send_json([{
+                "index": i,
+                "id": course.get("courseNo", course.get("id")),
+                "courseName": (course.get("courseName") or "").strip(),
+            } for i, course in enumerate(catalog.courses, 1)])
+        elif len(path) == 2 and path[0] == "courses":
+            self._send_markdown(catalog.course(path[1]))
+        elif path[0] == "split" and len(path) <= 2:
+            try:
+                max_chars = int(query.get("max_chars", ["20000"])[0])
+                index = int(path[1]) if len(path) == 2 else None
+            except ValueError:
+                self._send_error(400, "max_chars和文件序号必须是整数")
+                return
+            if max_chars <= 0:
+                self._send_error(400, "max_chars必须大于0")
+                return
+            if index is None:
+                self._send_markdown(catalog.split_index(max_chars))
+            else:
+                self._send_markdown(catalog.split_part(max_chars, index))
+        else:
+            self._send_error(404, "未知的接口")
+
+    do_HEAD = do_GET
+
+
+def serve(mca, json_file_path: str, host: str = "127.0.0.1", port: int = 8765,
+          cache_size: int = DEFAULT_CACHE_SIZE):
+    """启动大纲服务并阻塞运行，Ctrl+C退出"""
+    catalog = OutlineCatalog(mca, json_file_path, cache_size=cache_size)
+    handler = type("BoundOutlineRequestHandler", (OutlineRequestHandler,), {"catalog": catalog})
+    server = ThreadingHTTPServer((host, port), handler)
+    print(f"大纲服务已启动: http://{host}:{server.server_port}/toc")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n大纲服务已停止")
+    finally:
+        server.server_close()
@@ -0,0 +1,383 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""共享大纲缓冲区：把大纲索引编码为带偏移表的二进制缓冲区，放入共享内存或内存映射文件，供多个工作进程只读使用
+
+渲染、统计或搜索在多个进程中运行时，每个进程不再各自读取并json.load丰富结果，而是附加同一块缓冲区，
+通过memoryview的访问器读取名称、ID、时长和汇总，既不复制也不重新解析。
+
+缓冲区结构（小端，各区段按8字节对齐）：
+    文件头    魔数(8) 版本(u32) 节点数(u32) 顶层类型(u32) 保留(u32)
+    区段表    每个区段一个 偏移(u64) 长度(u64)，顺序见SECTIONS
+    区段      数值列（类型、父节点、子树结束位置……）、字符串偏移列及UTF-8字符串区、8字节的节点哈希
+
+用法：
+    python mca_shared.py build <丰富结果> [输出文件]
+    python mca_shared.py stats <丰富结果或缓冲区文件> [--workers 4]
+"""
+
+import mmap
+import os
+import struct
+import sys
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from itertools import accumulate
+from multiprocessing import shared_memory
+from multiprocessing.util import Finalize
+from typing import Dict, Any, List, Optional, Callable, Iterator, Tuple
+
+from mca_index import OutlineIndex, KINDS, NODE_HASH_SIZE, index_path_for, load_or_build_index
+from mca_storage import atomic_write
+
+BUFFER_MAGIC = b"MCAOUTL\x00"
+BUFFER_VERSION = 1
+HEADER = struct.Struct("<8sIIII")
+SECTION = struct.Struct("<QQ")
+
+# 区段名称及数值列的array类型码（None表示字节区段）
+SECTIONS = (
+    ("kinds", "B"),
+    ("parents", "i"),
+    ("ends", "I"),
+    ("slots", "I"),
+    ("durations", "q"),
+    ("course_counts", "I"),
+    ("chapter_counts", "I"),
+    ("section_counts", "I"),
+    ("id_present", "B"),
+    ("name_offsets", "I"),
+    ("id_offsets", "I"),
+    ("name_data", None),
+    ("id_data", None),
+    ("own_hash_data", None),
+    ("hash_data", None),
+)
+
+# 区段对齐的字节数，保证数值列可以直接cast
+ALIGNMENT = 8
+
+# 缓冲区文件的后缀，与丰富结果和索引放在一起
+BUFFER_SUFFIX = ".outline.bin"
+
+# 工作进程中附加的缓冲区（由进程池的initializer设置）
+_worker_outline = None
+
+
+def _align(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _string_section(values) -> Tuple[bytes, bytes]:
+    """把字符串列编码为 (偏移列, UTF-8数据)，偏移列比字符串数多一个，第i个字符串为data[off[i]:off[i+1]]"""
+    encoded = [(value or "").encode("utf-8") for value in values]
+    offsets = array("I", [0])
+    offsets.extend(accumulate(len(value) for value in encoded))
+    return offsets.tobytes(), b"".join(encoded)
+
+
+def encode_outline(index: OutlineIndex) -> bytes:
+    """把大纲索引编码为共享缓冲区的字节内容"""
+    name_offsets, name_data = _string_section(index.names)
+    id_offsets, id_data = _string_section(index.ids)
+    sections = {
+        "kinds": array("B", index.kinds).tobytes(),
+        "parents": array("i", index.parents).tobytes(),
+        "ends": array("I", index.ends).tobytes(),
+        "slots": array("I", index.slots).tobytes(),
+        "durations": array("q", index.durations).tobytes(),
+        "course_counts": array("I", index.course_counts).tobytes(),
+        "chapter_counts": array("I", index.chapter_counts).tobytes(),
+        "section_counts": array("I", index.section_counts).tobytes(),
+        "id_present": bytes(0 if node_id is None else 1 for node_id in index.ids),
+        "name_offsets": name_offsets,
+        "id_offsets": id_offsets,
+        "name_data": name_data,
+        "id_data": id_data,
+        "own_hash_data": b"".join(bytes.fromhex(h) if h else bytes(NODE_HASH_SIZE) for h in index.own_hashes),
+        "hash_data": b"".join(bytes.fromhex(h) if h else bytes(NODE_HASH_SIZE) for h in index.hashes),
+    }
+    offset = _align(HEADER.size + SECTION.size * len(SECTIONS))
+    table = []
+    for name, _ in SECTIONS:
+        table.append((offset, len(sections[name])))
+        offset = _align(offset + len(sections[name]))
+
+    buffer = bytearray(offset)
+    HEADER.pack_into(buffer, 0, BUFFER_MAGIC, BUFFER_VERSION, len(index.kinds), KINDS.index(index.root_kind), 0)
+    for i, ((name, _), (start, length)) in enumerate(zip(SECTIONS, table)):
+        SECTION.pack_into(buffer, HEADER.size + i * SECTION.size, start, length)
+        buffer[start:start + length] = sections[name]
+    return bytes(buffer)
+
+
+class _StringColumn:
+    """字符串列的只读视图：取第i个字符串时只解码这一段，raw()返回不复制的memoryview"""
+
+    __slots__ = ("_offsets", "_data", "_present")
+
+    def __init__(self, offsets: memoryview, data: memoryview, present: Optional[memoryview] = None):
+        self._offsets = offsets
+        self._data = data
+        self._present = present
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def raw(self, pos: int) -> memoryview:
+        return self._data[self._offsets[pos]:self._offsets[pos + 1]]
+
+    def __getitem__(self, pos: int) -> Optional[str]:
+        if self._present is not None and not self._present[pos]:
+            return None
+        return str(self.raw(pos), "utf-8")
+
+    def __iter__(self) -> Iterator[Optional[str]]:
+        for pos in range(len(self)):
+            yield self[pos]
+
+
+class _HashColumn:
+    """8字节节点哈希列的只读视图，取值时返回与OutlineIndex相同的十六进制字符串"""
+
+    __slots__ = ("_data",)
+
+    def __init__(self, data: memoryview):
+        self._data = data
+
+    def __len__(self):
+        return len(self._data) // NODE_HASH_SIZE
+
+    def __getitem__(self, pos: int) -> str:
+        value = self._data[pos * NODE_HASH_SIZE:(pos + 1) * NODE_HASH_SIZE]
+        # 全零表示没有哈希（根节点）
+        return value.hex() if any(value) else ""
+
+    def __iter__(self) -> Iterator[str]:
+        for pos in range(len(self)):
+            yield self[pos]
+
+
+class SharedOutline(OutlineIndex):
+    """共享缓冲区上的大纲索引，查询接口与OutlineIndex相同（find、course、nodes、OutlineNode的各属性）
+
+    数值列是直接cast出来的memoryview，字符串和哈希按需解码单个元素，整个缓冲区不会被复制。
+    没有关联原始数据，node.data始终为None。
+
+    Args:
+        buffer: 支持缓冲区协议的对象（bytes、mmap、SharedMemory.buf等）
+        location: 在其他进程中重新打开这块缓冲区所需的信息，见open_location()
+
+    Raises:
+        ValueError: 不是共享大纲缓冲区或版本不支持
+    """
+
+    def __init__(self, buffer, location: Optional[Tuple[str, str]] = None):
+        super().__init__()
+        self.location = location
+        self._closer = None
+        self._view = memoryview(buffer)
+        self._views = [self._view]
+        if len(self._view) < HEADER.size:
+            raise ValueError("不是共享大纲缓冲区")
+        magic, version, count, root_kind, _ = HEADER.unpack_from(self._view, 0)
+        if magic != BUFFER_MAGIC:
+            raise ValueError("不是共享大纲缓冲区")
+        if version != BUFFER_VERSION:
+            raise ValueError(f"不支持的共享大纲缓冲区版本: {version}")
+        self.root_kind = KINDS[root_kind]
+        self.count = count
+
+        sections = {}
+        for i, (name, code) in enumerate(SECTIONS):
+            start, length = SECTION.unpack_from(self._view, HEADER.size + i * SECTION.size)
+            section = self._view[start:start + length]
+            self._views.append(section)
+            if code is not None and code != "B":
+                section = section.cast(code)
+                self._views.append(section)
+            sections[name] = section
+
+        self.kinds = sections["kinds"]
+        self.parents = sections["parents"]
+        self.ends = sections["ends"]
+        self.slots = sections["slots"]
+        self.durations = sections["durations"]
+        self.course_counts = sections["course_counts"]
+        self.chapter_counts = sections["chapter_counts"]
+        self.section_counts = sections["section_counts"]
+        self.names = _StringColumn(sections["name_offsets"], sections["name_data"])
+        self.ids = _StringColumn(sections["id_offsets"], sections["id_data"], sections["id_present"])
+        self.own_hashes = _HashColumn(sections["own_hash_data"])
+        self.hashes = _HashColumn(sections["hash_data"])
+        # ID到节点的映射在第一次按ID查找时才建立，只遍历节点的工作进程不需要解码全部ID
+        self._maps = None
+
+    def find(self, kind: str, node_id):
+        if self._maps is None:
+            self._build_maps()
+        return super().find(kind, node_id)
+
+    def to_dict(self) -> Dict[str, Any]:
+        saved = super().to_dict()
+        for key, value in saved.items():
+            if isinstance(value, (memoryview, _StringColumn, _HashColumn)):
+                saved[key] = value.tolist() if isinstance(value, memoryview) else list(value)
+        return saved
+
+    @classmethod
+    def open_file(cls, path: str) -> "SharedOutline":
+        """内存映射缓冲区文件，同一文件在各进程中共享操作系统的页缓存"""
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            outline = cls(mapped, ("file", os.path.abspath(path)))
+        except ValueError:
+            mapped.close()
+            raise
+        outline._closer = mapped.close
+        return outline
+
+    @classmethod
+    def attach(cls, name: str) -> "SharedOutline":
+        """附加到已经由share_outline()创建的共享内存块"""
+        # Python 3.13起可以不向resource_tracker登记，只附加的进程退出时不会删除共享内存
+        if sys.version_info >= (3, 13):
+            block = shared_memory.SharedMemory(name=name, track=False)
+        else:
+            block = shared_memory.SharedMemory(name=name)
+        try:
+            outline = cls(block.buf, ("shm", name))
+        except ValueError:
+            block.close()
+            raise
+        outline._closer = block.close
+        return outline
+
+    @classmethod
+    def open_location(cls, location: Tuple[str, str]) -> "SharedOutline":
+        """按location重新打开缓冲区，location可以传给其他进程"""
+        kind, target = location
+        if kind == "file":
+            return cls.open_file(target)
+        if kind == "shm":
+            return cls.attach(target)
+        raise ValueError(f"未知的缓冲区位置: {location}")
+
+    def close(self):
+        """释放全部memoryview并关闭映射（不删除共享内存，删除由创建者负责）"""
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        if self._closer is not None:
+            self._closer()
+            self._closer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def buffer_path_for(enriched_path: str) -> str:
+    """丰富结果对应的缓冲区文件路径，如 course_outline_enriched.json -> course_outline_enriched.outline.bin"""
+    return index_path_for(enriched_path)[:-len(".index.json")] + BUFFER_SUFFIX
+
+
+def save_outline_buffer(index: OutlineIndex, path: str) -> str:
+    """把大纲索引编码后写入缓冲区文件"""
+    atomic_write(path, encode_outline(index))
+    return path
+
+
+def share_outline(index: OutlineIndex, name: Optional[str] = None) -> shared_memory.SharedMemory:
+    """把大纲索引编码后放入新建的共享内存块
+
+    Returns:
+        SharedMemory: 共享内存块，工作进程用SharedOutline.attach(block.name)附加，全部使用完后由调用方close()并unlink()
+    """
+    data = encode_outline(index)
+    block = shared_memory.SharedMemory(name=name, create=True, size=len(data))
+    block.buf[:len(data)] = data
+    return block
+
+
+def _init_worker(location: Tuple[str, str]):
+    global _worker_outline
+    _worker_outline = SharedOutline.open_location(location)
+    # 工作进程退出前释放memoryview，否则关闭映射时会因为仍有导出的缓冲区而报错
+    Finalize(_worker_outline, _worker_outline.close, exitpriority=10)
+
+
+def _run_chunk(func: Callable[[SharedOutline, int], Any], positions: List[int]) -> List[Any]:
+    return [func(_worker_outline, pos) for pos in positions]
+
+
+def map_nodes(outline: SharedOutline, func: Callable[[SharedOutline, int], Any], kind: str = "course",
+              workers: int = 4, chunk_size: int = 64) -> List[Any]:
+    """在多个工作进程中对某一类节点执行func(outline, pos)，按大纲顺序返回结果
+
+    每个工作进程只在启动时附加一次缓冲区，任务只传递节点编号。func必须是模块级函数（可以被pickle）。
+    """
+    if outline.location is None:
+        raise ValueError("缓冲区没有位置信息，需要用open_file()或attach()打开")
+    code = KINDS.index(kind)
+    positions = [pos for pos, node_kind in enumerate(outline.kinds) if node_kind == code]
+    chunks = [positions[i:i + chunk_size] for i in range(0, len(positions), chunk_size)]
+    if workers <= 1 or len(chunks) <= 1:
+        return [func(outline, pos) for pos in positions]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(outline.location,)) as pool:
+        results = []
+        for chunk_results in pool.map(_run_chunk, [func] * len(chunks), chunks):
+            results.extend(chunk_results)
+    return results
+
+
+def course_stats(outline: SharedOutline, pos: int) -> Dict[str, Any]:
+    """一个课程的名称、所在阶段、时长和章节/小节数（供map_nodes使用）"""
+    parent = outline.parents[pos]
+    return {
+        "courseId": outline.ids[pos],
+        "courseName": outline.names[pos],
+        "stageName": outline.names[parent] if parent > 0 else None,
+        "duration": outline.durations[pos],
+        "chapterCount": outline.chapter_counts[pos],
+        "sectionCount": outline.section_counts[pos],
+    }
+
+
+def load_or_build_buffer(enriched_path: str) -> str:
+    """丰富结果旁边的缓冲区文件，不存在或比索引旧时重新生成，返回文件路径"""
+    path = buffer_path_for(enriched_path)
+    index = load_or_build_index(enriched_path)
+    index_file = index_path_for(enriched_path)
+    if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(index_file):
+        save_outline_buffer(index, path)
+    return path
+
+
+def main(argv: List[str]) -> int:
+    from mca_request import pop_option
+
+    workers = int(pop_option(argv, "--workers", "4"))
+    if len(argv) in (2, 3) and argv[0] == "build":
+        path = argv[2] if len(argv) == 3 else buffer_path_for(argv[1])
+        save_outline_buffer(load_or_build_index(argv[1]), path)
+        print(f"共享大纲缓冲区已保存到: {path}（{os.path.getsize(path) / 1024:.0f}KB）")
+        return 0
+    if len(argv) == 2 and argv[0] == "stats":
+        path = argv[1] if argv[1].endswith(BUFFER_SUFFIX) else load_or_build_buffer(argv[1])
+        with SharedOutline.open_file(path) as outline:
+            stats = map_nodes(outline, course_stats, "course", workers=workers)
+        for item in stats:
+            stage = f"{item['stageName']} / " if item["stageName"] else ""
+            print(f"{stage}{item['courseName']}: {item['chapterCount']} 章 {item['sectionCount']} 节，"
+                  f"{item['duration'] / 3600:.1f} 小时")
+        print(f"共 {len(stats)} 个课程，{sum(item['duration'] for item in stats) / 3600:.1f} 小时")
+        return 0
+    print(__doc__.split("用法：", 1)[1].rstrip())
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,424 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""丰富结果的存储：按内容寻址的章节对象与快照清单、压缩输出以及外置的描述内容"""
+
+import copy
+import gzip
+import hashlib
+import json
+import lzma
+import os
+import tempfile
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+# 快照清单的格式标识
+MANIFEST_FORMAT = "mca-manifest"
+MANIFEST_VERSION = 2
+
+# 支持的压缩格式及其文件后缀
+COMPRESSION_SUFFIXES = {"gz": ".gz", "xz": ".xz"}
+
+# 可外置到描述文件中的大字段（Markdown渲染不需要）
+DESCRIPTION_FIELDS = ("pcDetailDesc", "appDetailDesc")
+
+# 外置内容在原位置留下的引用键
+BLOB_REF_KEY = "$blob"
+
+# 紧凑格式写入时的缓冲区大小（字节）
+JSON_WRITE_BUFFER = 1 << 20
+
+# 紧凑格式写入时按容器逐层展开的深度（到课程的各个字段），更深的节点整体交给C编码器编码
+JSON_STREAM_DEPTH = 6
+
+# 格式化副本的文件名后缀
+PRETTY_SUFFIX = ".pretty.json"
+
+# 紧凑编码器：不设置indent时json使用C实现的编码器，比indent=2的纯Python编码快数倍
+_COMPACT_ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+
+def canonical_json(obj: Any) -> bytes:
+    """生成对象的规范化JSON编码（键排序、无多余空白），用于计算哈希"""
+    return json.dumps(obj, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+
+def content_hash(data: bytes) -> str:
+    """计算内容哈希（128位BLAKE2b，十六进制）"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def atomic_write(path: str, data: bytes):
+    """先写临时文件再重命名，避免读到写了一半的文件"""
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class ObjectStore:
+    """按内容哈希保存JSON对象，目录结构为 <root>/<哈希前2位>/<哈希其余部分>.json
+
+    相同内容只写入一次，已存在的对象不会重复写盘。
+    """
+
+    def __init__(self, root: str = os.path.join("data", "objects")):
+        self.root = root
+        self.written = 0
+        self.reused = 0
+        self._known = set()
+        self._cache = {}
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key[2:] + ".json")
+
+    def put(self, obj: Any) -> str:
+        """保存对象并返回其哈希"""
+        data = canonical_json(obj)
+        key = content_hash(data)
+        if key in self._known:
+            self.reused += 1
+            return key
+        path = self._path(key)
+        if os.path.exists(path):
+            self.reused += 1
+        else:
+            directory = os.path.dirname(path)
+            if not os.path.exists(directory):
+                os.makedirs(directory, exist_ok=True)
+            atomic_write(path, data)
+            self.written += 1
+        self._known.add(key)
+        return key
+
+    def get(self, key: str) -> Any:
+        """按哈希读取对象"""
+        obj = self._cache.get(key)
+        if obj is None:
+            with open(self._path(key), "rb") as f:
+                obj = json.loads(f.read().decode("utf-8"))
+            self._cache[key] = obj
+        return obj
+
+    def put_chapters(self, chapter_list: List[Dict[str, Any]]) -> List[str]:
+        """保存章节列表，小节单独保存，章节对象中以sectionRefs引用小节
+
+        Returns:
+            list: 章节哈希列表
+        """
+        refs = []
+        for chapter in chapter_list:
+            chapter_obj = {k: v for k, v in chapter.items() if k != "sectionList"}
+            chapter_obj["sectionRefs"] = [self.put(section) for section in chapter.get("sectionList") or []]
+            refs.append(self.put(chapter_obj))
+        return refs
+
+    def get_chapters(self, refs: List[str]) -> List[Dict[str, Any]]:
+        """按章节哈希列表还原完整的章节列表"""
+        chapter_list = []
+        for ref in refs:
+            chapter_obj = self.get(ref)
+            chapter = {k: v for k, v in chapter_obj.items() if k != "sectionRefs"}
+            chapter["sectionList"] = [self.get(s) for s in chapter_obj.get("sectionRefs", [])]
+            chapter_list.append(copy.deepcopy(chapter))
+        return chapter_list
+
+    def _thin_course(self, course: Dict[str, Any]) -> Dict[str, Any]:
+        """把课程中的chapterList替换为chapterRefs，描述字段替换为 {"$blob": 哈希}，其余字段及顺序不变
+
+        描述是每个课程最大的字段并且很少变化，放入对象存储后每份清单只保存引用。
+        """
+        thin = {}
+        for key, value in course.items():
+            if key == "chapterList":
+                thin["chapterRefs"] = self.put_chapters(value or [])
+            elif key in DESCRIPTION_FIELDS and isinstance(value, str) and value:
+                thin[key] = {BLOB_REF_KEY: self.put(value)}
+            elif key == "versionList":
+                thin["versionList"] = [self._thin_course(version) for version in value or []]
+            else:
+                thin[key] = value
+        return thin
+
+    def _hydrate_course(self, thin: Dict[str, Any]) -> Dict[str, Any]:
+        """_thin_course的逆操作"""
+        course = {}
+        for key, value in thin.items():
+            if key == "chapterRefs":
+                course["chapterList"] = self.get_chapters(value)
+            elif isinstance(value, dict) and len(value) == 1 and BLOB_REF_KEY in value:
+                course[key] = self.get(value[BLOB_REF_KEY])
+            elif key == "versionList":
+                course["versionList"] = [self._hydrate_course(version) for version in value]
+            else:
+                course[key] = value
+        return course
+
+    def build_manifest(self, outline_list: List[Dict[str, Any]], is_simple_format: bool) -> Dict[str, Any]:
+        """把丰富后的大纲转换为快照清单，章节内容写入对象存储
+
+        Args:
+            outline_list: 丰富后的大纲（简单列表或stageList）
+            is_simple_format: 是否为简单列表格式
+        """
+        if is_simple_format:
+            data = [self._thin_course(course) for course in outline_list]
+        else:
+            stages = []
+            for stage in outline_list:
+                thin_stage = dict(stage)
+                thin_stage["courseList"] = [self._thin_course(course) for course in stage.get("courseList", [])]
+                stages.append(thin_stage)
+            data = {"stageList": stages}
+        return {
+            "format": MANIFEST_FORMAT,
+            "version": MANIFEST_VERSION,
+            "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "objects": self.root,
+            "data": data,
+        }
+
+    def hydrate_manifest(self, manifest: Dict[str, Any]) -> Dict[str, Any]:
+        """把快照清单还原为丰富后JSON的结构（{"msg", "code", "data"}）"""
+        data = manifest.get("data")
+        if isinstance(data, list):
+            hydrated = [self._hydrate_course(course) for course in data]
+        else:
+            stages = []
+            for thin_stage in data.get("stageList", []):
+                stage = dict(thin_stage)
+                stage["courseList"] = [self._hydrate_course(course) for course in thin_stage.get("courseList", [])]
+                stages.append(stage)
+            hydrated = {"stageList": stages}
+        return {"msg": "请求成功", "code": 200, "data": hydrated}
+
+
+def is_manifest(data: Any) -> bool:
+    """判断加载的JSON是否为快照清单"""
+    return isinstance(data, dict) and data.get("format") == MANIFEST_FORMAT
+
+
+def hydrate_if_manifest(data: Any, manifest_path: Optional[str] = None) -> Any:
+    """如果是快照清单则从对象存储还原，否则原样返回
+
+    Args:
+        data: 已加载的JSON
+        manifest_path: 清单文件路径，清单中的对象目录不存在时尝试相对清单所在目录查找
+    """
+    if not is_manifest(data):
+        return data
+    root = data.get("objects", os.path.join("data", "objects"))
+    if not os.path.isdir(root) and manifest_path:
+        candidate = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(manifest_path))),
+                                 os.path.basename(root))
+        if os.path.isdir(candidate):
+            root = candidate
+    return ObjectStore(root).hydrate_manifest(data)
+
+
+def _open_text(path: str, mode: str, buffering: int = -1):
+    """按文件头（读取时）或后缀（写入时）选择gzip、xz或普通文本方式打开文件
+
+    buffering只对未压缩的文件生效，压缩文件由压缩流自行缓冲。
+    """
+    if "r" in mode:
+        with open(path, "rb") as f:
+            magic = f.read(6)
+        if magic[:2] == b"\x1f\x8b":
+            return gzip.open(path, mode + "t", encoding="utf-8")
+        if magic == b"\xfd7zXZ\x00":
+            return lzma.open(path, mode + "t", encoding="utf-8")
+        return open(path, mode, encoding="utf-8")
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8", compresslevel=6)
+    if path.endswith(".xz"):
+        return lzma.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8", buffering=buffering)
+
+
+def compressed_path(path: str, compression: Optional[str]) -> str:
+    """为路径加上压缩格式对应的后缀"""
+    if not compression:
+        return path
+    if compression not in COMPRESSION_SUFFIXES:
+        raise ValueError(f"不支持的压缩格式: {compression}，可选: {', '.join(COMPRESSION_SUFFIXES)}")
+    return path + COMPRESSION_SUFFIXES[compression]
+
+
+def find_existing(path: str) -> str:
+    """在原路径及其压缩版本（.gz、.xz）中选择最新修改的已存在文件，都不存在时返回原路径"""
+    candidates = [p for p in [path] + [path + suffix for suffix in COMPRESSION_SUFFIXES.values()]
+                  if os.path.exists(p)]
+    if not candidates:
+        return path
+    return max(candidates, key=os.path.getmtime)
+
+
+def load_json_file(path: str, resolve_blobs: bool = False) -> Any:
+    """读取JSON文件，自动识别gzip/xz压缩
+
+    Args:
+        path: 文件路径
+        resolve_blobs: 是否把外置的描述内容还原到原位置
+    """
+    with _open_text(path, "r") as f:
+        data = json.load(f)
+    if resolve_blobs:
+        data = resolve_description_blobs(data, path)
+    return data
+
+
+def iter_compact_json(obj: Any, depth: int = JSON_STREAM_DEPTH):
+    """分块生成对象的紧凑JSON编码
+
+    json.dump只能使用纯Python的逐项编码；这里在外层按容器逐层展开，深度用尽后的子树
+    交给C编码器一次编码，生成的块既足够大又不需要先拼出整个文件的字符串。
+    输出与json.dumps(obj, ensure_ascii=False, separators=(",", ":"))完全相同。
+
+    Args:
+        obj: 要编码的对象
+        depth: 逐层展开的深度，0表示整体编码
+    """
+    if depth > 0 and isinstance(obj, dict) and obj and all(isinstance(key, str) for key in obj):
+        separator = "{"
+        for key, value in obj.items():
+            yield separator + _COMPACT_ENCODER.encode(key) + ":"
+            yield from iter_compact_json(value, depth - 1)
+            separator = ","
+        yield "}"
+    elif depth > 0 and isinstance(obj, (list, tuple)) and obj:
+        separator = "["
+        for item in obj:
+            yield separator
+            yield from iter_compact_json(item, depth - 1)
+            separator = ","
+        yield "]"
+    else:
+        yield from _COMPACT_ENCODER.iterencode(obj, _one_shot=True)
+
+
+def write_json_file(obj: Any, path: str, compression: Optional[str] = None, compact: bool = False) -> str:
+    """原子写入JSON文件；压缩或指定compact时使用紧凑格式，否则保持indent=2
+
+    紧凑格式使用C编码器分块编码，写入JSON_WRITE_BUFFER大小的缓冲区；需要阅读时可以用
+    write_pretty_copy另外生成格式化的副本。
+
+    Args:
+        obj: 要写入的对象
+        path: 文件路径（不含压缩后缀）
+        compression: 压缩格式
+        compact: 不压缩时也使用紧凑格式
+
+    Returns:
+        str: 实际写入的文件路径（压缩时带后缀）
+    """
+    path = compressed_path(path, compression)
+    # 先写入同目录的临时文件（保留后缀以选择相同的压缩方式）再替换，读取方不会看到写了一半的文件
+    directory, name = os.path.split(path)
+    tmp_path = os.path.join(directory, f".tmp-{os.getpid()}-{name}")
+    try:
+        with _open_text(tmp_path, "w", buffering=JSON_WRITE_BUFFER) as f:
+            if compression or compact:
+                write = f.write
+                for chunk in iter_compact_json(obj):
+                    write(chunk)
+            else:
+                json.dump(obj, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path
+
+
+def is_compact_json_file(path: str) -> bool:
+    """判断已有的JSON文件是否为紧凑格式（压缩文件总是紧凑格式；indent=2的文件以"{"加换行开头）"""
+    if any(path.endswith(suffix) for suffix in COMPRESSION_SUFFIXES.values()):
+        return True
+    with open(path, "rb") as f:
+        head = f.read(2)
+    return len(head) == 2 and head[1:] not in (b"\n", b"\r")
+
+
+def write_pretty_copy(path: str, output_path: Optional[str] = None) -> str:
+    """为紧凑格式或压缩的JSON文件生成indent=2的格式化副本，原文件不变
+
+    Args:
+        path: JSON文件路径（可以是压缩文件）
+        output_path: 副本路径，默认为去掉压缩后缀和.json后再加上.pretty.json
+
+    Returns:
+        str: 副本路径
+    """
+    if output_path is None:
+        base = path
+        for suffix in COMPRESSION_SUFFIXES.values():
+            if base.endswith(suffix):
+                base = base[:-len(suffix)]
+        if base.endswith(".json"):
+            base = base[:-len(".json")]
+        output_path = base + PRETTY_SUFFIX
+    return write_json_file(load_json_file(path), output_path)
+
+
+def externalize_descriptions(data: Any, blob_path: str, compression: Optional[str] = None,
+                             fields=DESCRIPTION_FIELDS) -> Any:
+    """把描述字段移到单独的描述文件中，原位置替换为 {"$blob": 哈希}
+
+    相同内容只保存一次。返回的新数据在顶层记录描述文件名（blobFile），输入数据不会被修改。
+
+    Args:
+        data: 丰富后的JSON（{"msg", "code", "data"}）
+        blob_path: 描述文件路径（不含压缩后缀）
+        compression: 描述文件的压缩格式
+        fields: 需要外置的字段名
+    """
+    blobs = {}
+
+    def walk(node):
+        if isinstance(node, dict):
+            result = {}
+            for key, value in node.items():
+                if key in fields and isinstance(value, str) and value:
+                    ref = content_hash(value.encode("utf-8"))
+                    blobs[ref] = value
+                    result[key] = {BLOB_REF_KEY: ref}
+                else:
+                    result[key] = walk(value)
+            return result
+        if isinstance(node, list):
+            return [walk(item) for item in node]
+        return node
+
+    result = walk(data)
+    blob_path = write_json_file(blobs, blob_path, compression)
+    if isinstance(result, dict):
+        result["blobFile"] = os.path.basename(blob_path)
+    return result
+
+
+def resolve_description_blobs(data: Any, path: str) -> Any:
+    """把 {"$blob": 哈希} 引用还原为描述内容，描述文件与数据文件位于同一目录"""
+    if not isinstance(data, dict) or "blobFile" not in data:
+        return data
+    blobs = load_json_file(os.path.join(os.path.dirname(path), data["blobFile"]))
+
+    def walk(node):
+        if isinstance(node, dict):
+            if len(node) == 1 and BLOB_REF_KEY in node:
+                return blobs.get(node[BLOB_REF_KEY], "")
+            return {key: walk(value) for key, value in node.items()}
+        if isinstance(node, list):
+            return [walk(item) for item in node]
+        return node
+
+    result = walk(data)
+    del result["blobFile"]
+    return result
@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""按课程的结构化追踪：每个课程一条trace，记录获取版本、获取详情、JSON解析、丰富记账和渲染的span
+
+span带有状态、字节数、重试次数等属性，写入本地的JSON Lines文件供离线分析。每行是一个OTLP/JSON
+格式的 {"resourceSpans": [...]} 对象（与OpenTelemetry Collector文件导出器的格式相同），
+可以用otlpjsonfile接收器导入Jaeger、Tempo等后端，也可以直接用jq分析。
+未启用时span()几乎没有开销。
+"""
+
+import functools
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional
+
+# span类型（OTLP的SpanKind）
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_CLIENT = 3
+
+# span状态（OTLP的StatusCode）
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+# 资源和instrumentation scope的名称
+SERVICE_NAME = "mca-request"
+SCOPE_NAME = "mca_trace"
+SCOPE_VERSION = "1"
+
+# 追踪文件的写入缓冲区大小（字节）
+TRACE_WRITE_BUFFER = 1 << 16
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    """把属性值转换为OTLP/JSON的AnyValue（整数按规范编码为字符串）"""
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class Span:
+    """一个正在记录或已经结束的span"""
+
+    __slots__ = ("name", "kind", "trace_id", "span_id", "parent_id", "start_ns", "end_ns",
+                 "attributes", "status", "status_message")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], kind: int = SPAN_KIND_INTERNAL):
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id
+        self.span_id = "%016x" % random.getrandbits(64)
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = {}
+        self.status = STATUS_OK
+        self.status_message = ""
+
+    def set_attribute(self, key: str, value: Any):
+        if value is not None:
+            self.attributes[key] = value
+
+    def set_attributes(self, attributes: Dict[str, Any]):
+        for key, value in attributes.items():
+            self.set_attribute(key, value)
+
+    def set_error(self, message: str):
+        self.status = STATUS_ERROR
+        self.status_message = message
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in self.attributes.items()],
+            "status": {"code": self.status},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        if self.status_message:
+            span["status"]["message"] = self.status_message
+        return span
+
+
+class _NoopSpan:
+    """未启用追踪时返回的span，所有操作都不做任何事"""
+
+    def set_attribute(self, key, value):
+        pass
+
+    def set_attributes(self, attributes):
+        pass
+
+    def set_error(self, message):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+    """记录span并按trace写入追踪文件
+
+    span按线程嵌套：同一线程中在某个span内开始的span是它的子span。一个线程中最外层的span结束时，
+    它和它的子span作为一行写出。course()开始的span是课程trace的根，之后在该线程之外为同一课程
+    开始的span（如渲染）会挂到这个课程的trace下。
+
+    Args:
+        path: 追踪文件路径（JSON Lines，追加写入），None表示不启用
+        service_name: 资源属性service.name
+    """
+
+    def __init__(self, path: Optional[str] = None, service_name: str = SERVICE_NAME):
+        self.path = path
+        self.enabled = path is not None
+        self.service_name = service_name
+        self.spans_written = 0
+        self.traces = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._courses = {}
+        self._file = None
+
+    def _stack(self) -> List[Span]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def current(self):
+        """当前线程中正在记录的span，没有时返回不做任何事的span"""
+        if not self.enabled:
+            return NOOP_SPAN
+        stack = self._stack()
+        return stack[-1] if stack else NOOP_SPAN
+
+    @contextmanager
+    def span(self, name: str, kind: int = SPAN_KIND_INTERNAL, course_id=None, **attributes):
+        """记录一个span
+
+        Args:
+            name: span名称，如fetch_course_versions、json_decode、render
+            kind: SPAN_KIND_INTERNAL或SPAN_KIND_CLIENT
+            course_id: 没有外层span时，挂到这个课程的trace下
+            **attributes: span属性
+        """
+        if not self.enabled:
+            yield NOOP_SPAN
+            return
+        stack = self._stack()
+        if stack:
+            trace_id, parent_id = stack[-1].trace_id, stack[-1].span_id
+        else:
+            with self._lock:
+                trace_id, parent_id = self._courses.get(str(course_id), (None, None))
+            if trace_id is None:
+                trace_id = "%032x" % random.getrandbits(128)
+        span = Span(name, trace_id, parent_id, kind)
+        span.set_attributes(attributes)
+        buffer = getattr(self._local, "buffer", None)
+        if not stack or buffer is None:
+            buffer = self._local.buffer = []
+        stack.append(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.set_error(str(e) or type(e).__name__)
+            raise
+        finally:
+            stack.pop()
+            span.end_ns = time.time_ns()
+            buffer.append(span)
+            if not stack:
+                self._local.buffer = None
+                self._write(buffer)
+
+    @contextmanager
+    def course(self, course_id, course_name: Optional[str] = None, **attributes):
+        """开始一个课程的trace，之后为该课程开始的最外层span（如渲染）都挂到这个trace下"""
+        if not self.enabled:
+            yield NOOP_SPAN
+            return
+        with self.span("course", **{"mca.course.id": str(course_id), "mca.course.name": course_name},
+                       **attributes) as span:
+            with self._lock:
+                self._courses[str(course_id)] = (span.trace_id, span.span_id)
+            yield span
+
+    def _write(self, spans: List[Span]):
+        """把一组span作为一行OTLP/JSON写出（按开始时间排序）"""
+        spans.sort(key=lambda s: s.start_ns)
+        line = json.dumps({"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+            "scopeSpans": [{
+                "scope": {"name": SCOPE_NAME, "version": SCOPE_VERSION},
+                "spans": [span.to_otlp() for span in spans],
+            }],
+        }]}, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            if self._file is None:
+                directory = os.path.dirname(self.path)
+                if directory and not os.path.exists(directory):
+                    os.makedirs(directory, exist_ok=True)
+                self._file = open(self.path, "a", encoding="utf-8", buffering=TRACE_WRITE_BUFFER)
+            self._file.write(line + "\n")
+            self.spans_written += len(spans)
+            if any(span.parent_id is None for span in spans):
+                self.traces += 1
+
+    def flush(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def traced(name: str, kind: int = SPAN_KIND_INTERNAL):
+    """方法装饰器：用实例的tracer为整个方法记录一个span"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            with self.tracer.span(name, kind):
+                return func(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def load_spans(path: str) -> List[Dict[str, Any]]:
+    """读取追踪文件中的全部span（OTLP/JSON格式的字典）"""
+    spans = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            for resource_spans in json.loads(line).get("resourceSpans", []):
+                for scope_spans in resource_spans.get("scopeSpans", []):
+                    spans.extend(scope_spans.get("spans", []))
+    return spans
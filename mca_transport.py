@@ -0,0 +1,794 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""请求传输层：按接口的截止时间、对冲请求、延迟统计、熔断、多身份会话池以及录制/回放"""
+
+import base64
+import gzip
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import timedelta
+from typing import Dict, Any, List, Optional, Callable
+from urllib.parse import urlsplit, urlencode, parse_qsl
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from mca_storage import atomic_write
+from mca_workspace import lock_for, LockTimeout
+
+# 各接口模板的默认截止时间（秒）
+DEFAULT_TIMEOUTS = {
+    "coursePackage/homePage": 30,
+    "coursePackageVersion": 15,
+    "systemCourse/child": 30,
+    "course/outline/get": 30,
+    "courseversion/allVersionList": 15,
+    "courseWeb/{id}/pc": 20,
+}
+
+# 未配置的接口使用的截止时间（秒）
+FALLBACK_TIMEOUT = 30
+
+# 建立连接的超时上限（秒）
+CONNECT_TIMEOUT = 5
+
+
+def percentile(samples: List[float], p: float) -> float:
+    """计算样本的百分位数（最近秩法）
+
+    Args:
+        samples: 样本列表
+        p: 百分位，取值0-100
+
+    Returns:
+        float: 对应的百分位数，样本为空时返回0
+    """
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(p / 100.0 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+class EndpointStats:
+    """单个接口的延迟样本和对冲计数"""
+
+    def __init__(self, window: int = 512):
+        self.latencies = deque(maxlen=window)
+        self.requests = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.wasted = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        """返回当前统计数据的字典形式"""
+        samples = list(self.latencies)
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "wasted": self.wasted,
+            "p50": percentile(samples, 50),
+            "p95": percentile(samples, 95),
+            "p99": percentile(samples, 99),
+            "max": max(samples) if samples else 0.0,
+        }
+
+
+class RequestHedger:
+    """为请求设置截止时间，并在超过接口观测p95时发出对冲请求
+
+    对冲请求与原请求并行，先成功返回的响应被采用，另一个响应被丢弃并计入wasted。
+    只有幂等的GET请求会被对冲，其它请求仍然遵守截止时间。
+    """
+
+    def __init__(self, hedging: bool = False, timeouts: Optional[Dict[str, float]] = None,
+                 min_samples: int = 20, hedge_percentile: float = 95, max_workers: int = 8):
+        self.hedging = hedging
+        self.timeouts = dict(DEFAULT_TIMEOUTS)
+        if timeouts:
+            self.timeouts.update(timeouts)
+        self.min_samples = min_samples
+        self.hedge_percentile = hedge_percentile
+        self.max_workers = max_workers
+        self.stats = {}
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def get_timeout(self, endpoint: str) -> float:
+        """获取接口的截止时间"""
+        return self.timeouts.get(endpoint, FALLBACK_TIMEOUT)
+
+    def _get_stats(self, endpoint: str) -> EndpointStats:
+        with self._lock:
+            stats = self.stats.get(endpoint)
+            if stats is None:
+                stats = self.stats[endpoint] = EndpointStats()
+            return stats
+
+    def _hedge_delay(self, stats: EndpointStats) -> Optional[float]:
+        """返回触发对冲的等待时间，样本不足时返回None"""
+        with self._lock:
+            if len(stats.latencies) < self.min_samples:
+                return None
+            samples = list(stats.latencies)
+        return percentile(samples, self.hedge_percentile)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix="mca-hedge")
+            return self._executor
+
+    def _record(self, stats: EndpointStats, elapsed: Optional[float] = None, error: Optional[BaseException] = None):
+        with self._lock:
+            stats.requests += 1
+            if elapsed is not None:
+                stats.latencies.append(elapsed)
+            if isinstance(error, requests.Timeout):
+                stats.timeouts += 1
+            elif error is not None:
+                stats.errors += 1
+
+    def _timed_send(self, stats: EndpointStats, send: Callable[..., requests.Response],
+                    url: str, kwargs: Dict[str, Any]) -> requests.Response:
+        start = time.monotonic()
+        try:
+            response = send(url, **kwargs)
+        except BaseException as e:
+            self._record(stats, error=e)
+            raise
+        # 在会话池中排队等待的时间不是接口的延迟，不计入p95，否则限流时会触发更多对冲
+        elapsed = time.monotonic() - start - getattr(response, "queue_delay", 0.0)
+        self._record(stats, max(0.0, elapsed))
+        return response
+
+    def request(self, endpoint: str, send: Callable[..., requests.Response], url: str,
+                hedge: bool = True, **kwargs) -> requests.Response:
+        """发送请求
+
+        Args:
+            endpoint: 接口模板名称，用于选择截止时间和统计延迟
+            send: 实际发送请求的函数，如session.get
+            url: 请求地址
+            hedge: 是否允许对冲（仅用于幂等请求）
+            **kwargs: 传给send的其它参数
+
+        Returns:
+            requests.Response: 被采用的响应
+
+        Raises:
+            requests.Timeout: 超过截止时间仍未得到响应
+        """
+        deadline = self.get_timeout(endpoint)
+        kwargs.setdefault("timeout", (min(CONNECT_TIMEOUT, deadline), deadline))
+        stats = self._get_stats(endpoint)
+
+        delay = self._hedge_delay(stats) if self.hedging and hedge else None
+        if delay is None or delay >= deadline:
+            return self._timed_send(stats, send, url, kwargs)
+
+        executor = self._get_executor()
+        start = time.monotonic()
+        primary = executor.submit(self._timed_send, stats, send, url, kwargs)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+
+        # 超过p95仍未返回，发出对冲请求
+        with self._lock:
+            stats.hedged += 1
+        hedge_future = executor.submit(self._timed_send, stats, send, url, kwargs)
+        pending = {primary, hedge_future}
+        last_error = None
+        while pending:
+            remaining = deadline - (time.monotonic() - start)
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    last_error = future.exception()
+                    continue
+                other = hedge_future if future is primary else primary
+                with self._lock:
+                    if future is hedge_future:
+                        stats.hedge_wins += 1
+                    # 另一个请求的响应不会被使用
+                    if not other.done() or other.exception() is None:
+                        stats.wasted += 1
+                return future.result()
+
+        if not pending and last_error is not None:
+            raise last_error
+        raise requests.Timeout(f"{endpoint} 超过截止时间 {deadline} 秒")
+
+    def report(self) -> Dict[str, Dict[str, Any]]:
+        """返回各接口的统计数据"""
+        with self._lock:
+            return {endpoint: stats.snapshot() for endpoint, stats in self.stats.items()}
+
+    def format_report(self) -> str:
+        """生成各接口延迟和对冲统计的文本表格"""
+        lines = ["请求统计:",
+                 f"{'接口':<30} {'请求':>6} {'错误':>5} {'超时':>5} {'对冲':>5} {'对冲胜':>6} {'浪费':>5} "
+                 f"{'p50(s)':>8} {'p95(s)':>8} {'p99(s)':>8}"]
+        for endpoint, s in sorted(self.report().items()):
+            lines.append(f"{endpoint:<30} {s['requests']:>6} {s['errors']:>5} {s['timeouts']:>5} "
+                         f"{s['hedged']:>5} {s['hedge_wins']:>6} {s['wasted']:>5} "
+                         f"{s['p50']:>8.3f} {s['p95']:>8.3f} {s['p99']:>8.3f}")
+        return "\n".join(lines)
+
+
+class CircuitOpenError(requests.RequestException):
+    """接口处于熔断状态，请求没有发出"""
+
+
+class EndpointCircuit:
+    """单个接口的熔断状态"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, window: int):
+        self.state = self.CLOSED
+        self.outcomes = deque(maxlen=window)
+        self.opened_at = 0.0
+        self.probes = 0
+        self.trips = 0
+        self.rejected = 0
+
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / float(len(self.outcomes))
+
+
+class CircuitBreaker:
+    """按接口模板统计最近的错误率，错误率过高时熔断
+
+    关闭状态下记录最近window次请求的结果，样本数达到min_requests且错误率达到error_threshold时打开；
+    打开状态下直接拒绝请求，reset_timeout秒后进入半开状态，只放行half_open_probes个探测请求：
+    探测成功则关闭，失败则重新打开。指定state_file时状态会保存到文件，下次运行继续使用。
+    """
+
+    # 保存状态时等待状态文件锁的最长时间（秒），超时则放弃这次保存
+    SAVE_LOCK_TIMEOUT = 5.0
+
+    def __init__(self, window: int = 20, min_requests: int = 5, error_threshold: float = 0.5,
+                 reset_timeout: float = 30.0, half_open_probes: int = 1, state_file: Optional[str] = None):
+        self.window = window
+        self.min_requests = min_requests
+        self.error_threshold = error_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_probes = half_open_probes
+        self.state_file = state_file
+        self.circuits = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _circuit(self, endpoint: str) -> EndpointCircuit:
+        circuit = self.circuits.get(endpoint)
+        if circuit is None:
+            circuit = self.circuits[endpoint] = EndpointCircuit(self.window)
+        return circuit
+
+    def allow(self, endpoint: str) -> bool:
+        """判断是否允许向接口发出请求"""
+        changed = False
+        with self._lock:
+            circuit = self._circuit(endpoint)
+            if circuit.state == EndpointCircuit.OPEN:
+                if time.time() - circuit.opened_at < self.reset_timeout:
+                    circuit.rejected += 1
+                    return False
+                circuit.state = EndpointCircuit.HALF_OPEN
+                circuit.probes = 0
+                changed = True
+            if circuit.state == EndpointCircuit.HALF_OPEN:
+                if circuit.probes >= self.half_open_probes:
+                    circuit.rejected += 1
+                    allowed = False
+                else:
+                    circuit.probes += 1
+                    allowed = True
+            else:
+                allowed = True
+        if changed:
+            self._save(endpoint)
+        return allowed
+
+    def is_open(self, endpoint: str) -> bool:
+        """接口是否处于熔断中（且尚未到探测时间）"""
+        with self._lock:
+            circuit = self.circuits.get(endpoint)
+            return (circuit is not None and circuit.state == EndpointCircuit.OPEN
+                    and time.time() - circuit.opened_at < self.reset_timeout)
+
+    def record(self, endpoint: str, success: bool):
+        """记录一次请求的结果"""
+        changed = False
+        with self._lock:
+            circuit = self._circuit(endpoint)
+            if circuit.state == EndpointCircuit.HALF_OPEN:
+                circuit.probes = max(0, circuit.probes - 1)
+                circuit.outcomes.clear()
+                if success:
+                    circuit.state = EndpointCircuit.CLOSED
+                else:
+                    circuit.state = EndpointCircuit.OPEN
+                    circuit.opened_at = time.time()
+                    circuit.outcomes.append(False)
+                changed = True
+            else:
+                circuit.outcomes.append(success)
+                if (circuit.state == EndpointCircuit.CLOSED and len(circuit.outcomes) >= self.min_requests
+                        and circuit.error_rate() >= self.error_threshold):
+                    circuit.state = EndpointCircuit.OPEN
+                    circuit.opened_at = time.time()
+                    circuit.trips += 1
+                    changed = True
+        if changed:
+            self._save(endpoint)
+
+    def report(self) -> Dict[str, Dict[str, Any]]:
+        """返回各接口的熔断状态"""
+        with self._lock:
+            return {endpoint: {
+                "state": c.state,
+                "error_rate": c.error_rate(),
+                "trips": c.trips,
+                "rejected": c.rejected,
+            } for endpoint, c in self.circuits.items()}
+
+    def format_report(self) -> str:
+        """生成各接口熔断状态的文本表格"""
+        lines = ["接口熔断状态:",
+                 f"{'接口':<30} {'状态':>10} {'错误率':>8} {'熔断次数':>8} {'拒绝请求':>8}"]
+        for endpoint, c in sorted(self.report().items()):
+            lines.append(f"{endpoint:<30} {c['state']:>10} {c['error_rate']:>8.1%} {c['trips']:>8} {c['rejected']:>8}")
+        return "\n".join(lines)
+
+    def _read_state(self) -> Dict[str, Dict[str, Any]]:
+        if not self.state_file or not os.path.exists(self.state_file):
+            return {}
+        try:
+            with open(self.state_file, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return saved if isinstance(saved, dict) else {}
+
+    def _load(self):
+        for endpoint, item in self._read_state().items():
+            circuit = self._circuit(endpoint)
+            circuit.state = item.get("state", EndpointCircuit.CLOSED)
+            if circuit.state == EndpointCircuit.HALF_OPEN:
+                # 上次运行中未完成的探测不再计数，重新进入打开状态等待探测
+                circuit.state = EndpointCircuit.OPEN
+            circuit.opened_at = item.get("opened_at", 0.0)
+            circuit.trips = item.get("trips", 0)
+            circuit.outcomes.extend(item.get("outcomes", []))
+
+    def _save(self, endpoint: str):
+        """保存endpoint的状态变化
+
+        状态文件可能被同一台机器上并行的多个运行共用：在文件锁内读取磁盘上的状态，只用本次变化的接口覆盖，
+        其他接口保留磁盘上的内容（其他运行刚打开的熔断同时合并到内存中），最后整体替换文件。
+        """
+        if not self.state_file:
+            return
+        try:
+            with lock_for(self.state_file, timeout=self.SAVE_LOCK_TIMEOUT):
+                saved = self._read_state()
+                with self._lock:
+                    for other, item in saved.items():
+                        circuit = self.circuits.get(other)
+                        if (other != endpoint and circuit is not None and circuit.state == EndpointCircuit.CLOSED
+                                and item.get("state") == EndpointCircuit.OPEN
+                                and item.get("opened_at", 0.0) > circuit.opened_at):
+                            circuit.state = EndpointCircuit.OPEN
+                            circuit.opened_at = item["opened_at"]
+                    for name, c in self.circuits.items():
+                        if name == endpoint or name not in saved:
+                            saved[name] = {
+                                "state": c.state,
+                                "opened_at": c.opened_at,
+                                "trips": max(c.trips, saved.get(name, {}).get("trips", 0)),
+                                "outcomes": list(c.outcomes),
+                            }
+                atomic_write(self.state_file, json.dumps(saved, ensure_ascii=False, indent=2).encode("utf-8"))
+        except (OSError, LockTimeout):
+            pass
+
+
+# 会话池的调度策略
+POOL_STRATEGIES = ("round_robin", "least_loaded")
+
+
+class PooledSession:
+    """会话池中的一个身份：独立的Session（请求头、Cookie、代理）及其请求计数
+
+    Args:
+        name: 身份名称，用于统计输出
+        session: 该身份使用的requests.Session
+        rate: 该身份允许的最大请求速率（次/秒），None表示不限制
+    """
+
+    def __init__(self, name: str, session: requests.Session, rate: Optional[float] = None):
+        self.name = name
+        self.session = session
+        self.rate = rate
+        self.inflight = 0
+        self.requests = 0
+        self.errors = 0
+        self.throttled = 0
+        self.next_slot = 0.0
+        self.cooldown_until = 0.0
+        self.recent = deque(maxlen=256)
+
+    def current_rate(self, now: float, window: float = 10.0) -> float:
+        """最近window秒内的请求速率（次/秒）"""
+        count = sum(1 for t in self.recent if now - t <= window)
+        return count / window
+
+
+class SessionPool:
+    """多个会话身份组成的池，按轮询或最少并发调度请求
+
+    网关按会话限流，单个Session的配额是吞吐量上限；池中每个身份有自己的请求头、Cookie和代理，
+    请求分摊到各身份上。收到429的身份按Retry-After暂停调度，设置了rate的身份按速率排队。
+
+    Args:
+        sessions: 池中的身份列表
+        strategy: 调度策略，round_robin（轮询）或least_loaded（当前并发最少）
+    """
+
+    def __init__(self, sessions: List[PooledSession], strategy: str = "round_robin"):
+        if not sessions:
+            raise ValueError("会话池至少需要一个会话")
+        if strategy not in POOL_STRATEGIES:
+            raise ValueError(f"不支持的调度策略: {strategy}，可选: {', '.join(POOL_STRATEGIES)}")
+        self.members = sessions
+        self.strategy = strategy
+        self._next = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def single(cls, session: Optional[requests.Session] = None) -> "SessionPool":
+        """只有一个默认会话的池"""
+        return cls([PooledSession("default", session or requests.Session())])
+
+    @classmethod
+    def from_config(cls, path: str, strategy: Optional[str] = None) -> "SessionPool":
+        """从JSON配置文件创建会话池
+
+        配置格式：
+            {"strategy": "round_robin",
+             "sessions": [{"name": "a", "headers": {...}, "cookies": {...}, "proxy": "http://...", "rate": 5}]}
+
+        Args:
+            path: 配置文件路径
+            strategy: 调度策略，None时使用配置文件中的设置
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            config = json.load(f)
+        members = []
+        for index, item in enumerate(config.get("sessions") or [], 1):
+            session = requests.Session()
+            session.headers.update(item.get("headers") or {})
+            session.cookies.update(item.get("cookies") or {})
+            if item.get("proxy"):
+                session.proxies.update({"http": item["proxy"], "https": item["proxy"]})
+            members.append(PooledSession(item.get("name") or f"session{index}", session, item.get("rate")))
+        return cls(members, strategy or config.get("strategy", "round_robin"))
+
+    @property
+    def primary(self) -> requests.Session:
+        """第一个会话"""
+        return self.members[0].session
+
+    def mount(self, adapter: BaseAdapter):
+        """为池中所有会话挂载同一个适配器（连接池、录制或回放）"""
+        for member in self.members:
+            member.session.mount("https://", adapter)
+            member.session.mount("http://", adapter)
+
+    def _choose(self, now: float) -> PooledSession:
+        # 优先选择不在429冷却中的身份，全部冷却时选最早恢复的
+        ready = [m for m in self.members if m.cooldown_until <= now]
+        if not ready:
+            return min(self.members, key=lambda m: m.cooldown_until)
+        if self.strategy == "least_loaded":
+            return min(ready, key=lambda m: (m.inflight, max(m.next_slot, now), m.requests))
+        for _ in range(len(self.members)):
+            member = self.members[self._next % len(self.members)]
+            self._next += 1
+            if member in ready:
+                return member
+        return ready[0]
+
+    def acquire(self) -> PooledSession:
+        """选出一个身份并占用，必要时等待该身份的速率限制或冷却结束，用完需调用release"""
+        with self._lock:
+            now = time.monotonic()
+            member = self._choose(now)
+            start = max(now, member.next_slot, member.cooldown_until)
+            if member.rate:
+                member.next_slot = start + 1.0 / member.rate
+            member.inflight += 1
+            member.requests += 1
+        delay = start - now
+        if delay > 0:
+            time.sleep(delay)
+        with self._lock:
+            member.recent.append(time.monotonic())
+        return member
+
+    def release(self, member: PooledSession, response: Optional[requests.Response] = None):
+        """归还身份并记录请求结果；收到429时按Retry-After暂停该身份"""
+        with self._lock:
+            member.inflight -= 1
+            if response is None or response.status_code >= 500:
+                member.errors += 1
+            elif response.status_code == 429:
+                member.throttled += 1
+                try:
+                    retry_after = float(response.headers.get("Retry-After") or 1)
+                except ValueError:
+                    retry_after = 1.0
+                member.cooldown_until = max(member.cooldown_until, time.monotonic() + retry_after)
+
+    def request(self, method: str, url: str, member: Optional[PooledSession] = None, **kwargs) -> requests.Response:
+        """用调度选出的身份发送请求
+
+        Args:
+            method: HTTP方法
+            url: 请求地址
+            member: 已经通过acquire占用的身份，None时在这里选出并等待
+            **kwargs: 传给requests的其它参数
+
+        Returns:
+            requests.Response: 响应，queue_delay属性为等待速率限制或冷却的秒数
+        """
+        start = time.monotonic()
+        if member is None:
+            member = self.acquire()
+        queue_delay = time.monotonic() - start
+        response = None
+        try:
+            response = member.session.request(method, url, **kwargs)
+            response.queue_delay = queue_delay
+            return response
+        finally:
+            self.release(member, response)
+
+    def report(self) -> Dict[str, Dict[str, Any]]:
+        """返回各身份的请求计数"""
+        with self._lock:
+            now = time.monotonic()
+            return {m.name: {
+                "requests": m.requests,
+                "errors": m.errors,
+                "throttled": m.throttled,
+                "inflight": m.inflight,
+                "rate": m.current_rate(now),
+            } for m in self.members}
+
+    def format_report(self) -> str:
+        """生成各身份请求计数的文本表格"""
+        lines = [f"会话池统计（{self.strategy}）:",
+                 f"{'会话':<20} {'请求':>6} {'错误':>5} {'限流':>5} {'速率(次/s)':>10}"]
+        for name, r in self.report().items():
+            lines.append(f"{name:<20} {r['requests']:>6} {r['errors']:>5} {r['throttled']:>5} {r['rate']:>10.2f}")
+        return "\n".join(lines)
+
+
+# 匹配请求时忽略的请求体字段（每次请求都会变化）
+VOLATILE_BODY_FIELDS = ("clientTime",)
+
+
+def request_key(method: str, url: str, body: Optional[bytes] = None) -> str:
+    """生成请求的匹配键：方法 + 排序后的查询参数 + 去除易变字段的请求体"""
+    parts = urlsplit(url)
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    key = f"{method.upper()} {parts.scheme}://{parts.netloc}{parts.path}"
+    if query:
+        key += f"?{query}"
+    if body:
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        try:
+            payload = json.loads(body.decode("utf-8"))
+        except (UnicodeDecodeError, ValueError):
+            key += " #" + hashlib.sha1(body).hexdigest()
+        else:
+            if isinstance(payload, dict):
+                for field in VOLATILE_BODY_FIELDS:
+                    payload.pop(field, None)
+            key += " " + json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return key
+
+
+class Cassette:
+    """请求/响应录制文件（gzip压缩的JSON Lines）
+
+    第一行是文件头，其余每行是一次请求及其响应。同一请求被录制多次时按录制顺序回放，
+    用完后重复使用最后一条。
+    """
+
+    VERSION = 1
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries = {}
+        self.count = 0
+        self._cursor = {}
+        self._lock = threading.Lock()
+
+    def add(self, key: str, entry: Dict[str, Any]):
+        """记录一次请求及其响应"""
+        with self._lock:
+            self.entries.setdefault(key, []).append(entry)
+            self.count += 1
+
+    def next(self, key: str) -> Optional[Dict[str, Any]]:
+        """按录制顺序取出下一条匹配的响应"""
+        with self._lock:
+            recorded = self.entries.get(key)
+            if not recorded:
+                return None
+            index = self._cursor.get(key, 0)
+            self._cursor[key] = index + 1
+            return recorded[min(index, len(recorded) - 1)]
+
+    def iter_responses(self):
+        """遍历录制的响应，生成 (请求键, 记录, 响应内容)，同一请求的多条记录按录制顺序排列"""
+        with self._lock:
+            items = [(key, list(recorded)) for key, recorded in self.entries.items()]
+        for key, recorded in items:
+            for entry in recorded:
+                yield key, entry, _decode_content(entry)
+
+    def save(self):
+        """写入录制文件"""
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with self._lock:
+            with gzip.open(self.path, "wt", encoding="utf-8") as f:
+                f.write(json.dumps({"version": self.VERSION, "count": self.count}) + "\n")
+                for key, recorded in self.entries.items():
+                    for entry in recorded:
+                        f.write(json.dumps(dict(entry, key=key), ensure_ascii=False, separators=(",", ":")) + "\n")
+
+    @classmethod
+    def load(cls, path: str) -> "Cassette":
+        """读取录制文件"""
+        cassette = cls(path)
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            header = json.loads(f.readline())
+            if header.get("version") != cls.VERSION:
+                raise ValueError(f"不支持的录制文件版本: {header.get('version')}")
+            for line in f:
+                entry = json.loads(line)
+                cassette.add(entry.pop("key"), entry)
+        return cassette
+
+
+def _encode_content(content: bytes) -> Dict[str, str]:
+    try:
+        return {"text": content.decode("utf-8")}
+    except UnicodeDecodeError:
+        return {"base64": base64.b64encode(content).decode("ascii")}
+
+
+def _decode_content(entry: Dict[str, Any]) -> bytes:
+    if "base64" in entry:
+        return base64.b64decode(entry["base64"])
+    return entry.get("text", "").encode("utf-8")
+
+
+def _read_timeout(timeout) -> Optional[float]:
+    if isinstance(timeout, tuple):
+        return timeout[1]
+    return timeout
+
+
+def build_response(request, status: int, reason: Optional[str], headers: Dict[str, str], content: bytes,
+                   connection=None, elapsed: float = 0.0) -> requests.Response:
+    """用录制或缓存的内容构造响应对象"""
+    response = requests.Response()
+    response.status_code = status
+    response.reason = reason
+    response.headers = CaseInsensitiveDict(headers)
+    response.encoding = get_encoding_from_headers(response.headers)
+    response._content = content
+    response.url = request.url
+    response.request = request
+    response.connection = connection
+    response.elapsed = timedelta(seconds=elapsed)
+    return response
+
+
+class RecordingAdapter(HTTPAdapter):
+    """转发真实请求，同时把请求和响应写入录制文件"""
+
+    def __init__(self, cassette: Cassette, **kwargs):
+        super().__init__(**kwargs)
+        self.cassette = cassette
+
+    def send(self, request, **kwargs):
+        start = time.monotonic()
+        response = super().send(request, **kwargs)
+        content = response.content
+        entry = {
+            "method": request.method,
+            "url": request.url,
+            "status": response.status_code,
+            "reason": response.reason,
+            "headers": {k: v for k, v in response.headers.items()
+                        if k.lower() in ("content-type", "etag", "last-modified")},
+            "elapsed": round(time.monotonic() - start, 4),
+        }
+        entry.update(_encode_content(content))
+        self.cassette.add(request_key(request.method, request.url, request.body), entry)
+        return response
+
+
+class ReplayAdapter(BaseAdapter):
+    """从录制文件回放响应，不访问网络
+
+    Args:
+        cassette: 录制文件
+        latency: 模拟延迟；None表示不延迟，"recorded"表示按录制时的耗时，数字表示固定秒数
+        bandwidth: 模拟带宽（字节/秒），None表示不限制
+    """
+
+    def __init__(self, cassette: Cassette, latency=None, bandwidth: Optional[float] = None):
+        super().__init__()
+        self.cassette = cassette
+        self.latency = latency
+        self.bandwidth = bandwidth
+
+    def _delay(self, entry: Dict[str, Any], size: int) -> float:
+        if self.latency == "recorded":
+            delay = entry.get("elapsed", 0.0)
+        else:
+            delay = float(self.latency or 0.0)
+        if self.bandwidth:
+            delay += size / float(self.bandwidth)
+        return delay
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        entry = self.cassette.next(request_key(request.method, request.url, request.body))
+        if entry is None:
+            raise requests.ConnectionError(f"录制文件中没有该请求: {request.method} {request.url}", request=request)
+
+        content = _decode_content(entry)
+        delay = self._delay(entry, len(content))
+        read_timeout = _read_timeout(timeout)
+        if read_timeout is not None and delay > read_timeout:
+            time.sleep(read_timeout)
+            raise requests.ReadTimeout(f"回放延迟 {delay:.3f} 秒超过超时 {read_timeout} 秒", request=request)
+        if delay > 0:
+            time.sleep(delay)
+        return build_response(request, entry["status"], entry.get("reason"), entry.get("headers", {}), content,
+                              connection=self, elapsed=delay)
+
+    def close(self):
+        pass
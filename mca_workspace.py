@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""并行运行的隔离：每次运行使用独立的工作区目录，共享文件加建议性文件锁，并原子更新"最新结果"指针
+
+目录结构：
+    data/runs/<工作区>/           一次运行的丰富结果、映射文件和Markdown输出
+    data/runs/<工作区>/.lock      运行期间持有的排它锁，同一工作区同时只能有一个运行
+    data/runs/latest.json         最近一次完成写入的工作区及其产物
+    data/objects/                 快照对象存储，按内容寻址，各工作区共享
+    data/endpoint_health.json     接口熔断状态，各工作区共享，在文件锁内合并写入
+"""
+
+import json
+import os
+import re
+import time
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+from mca_storage import atomic_write
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# 工作区所在的子目录和最新结果指针的文件名
+RUNS_DIR = "runs"
+LATEST_FILE = "latest.json"
+
+# 等待文件锁时的轮询间隔（秒）
+LOCK_POLL_INTERVAL = 0.05
+
+
+class LockTimeout(Exception):
+    """在超时时间内没有获得文件锁"""
+
+
+class WorkspaceBusyError(Exception):
+    """工作区正在被另一个运行使用"""
+
+
+class FileLock:
+    """基于锁文件的建议性排它锁（POSIX使用flock，Windows使用msvcrt.locking）
+
+    锁与打开的文件绑定，进程退出时由操作系统自动释放，不会留下失效的锁。
+    同一进程内的不同FileLock对象之间同样互斥。
+
+    Args:
+        path: 锁文件路径，不存在时自动创建
+        timeout: 等待锁的最长时间（秒），None表示一直等待
+    """
+
+    def __init__(self, path: str, timeout: Optional[float] = None):
+        self.path = path
+        self.timeout = timeout
+        self._file = None
+
+    @property
+    def locked(self) -> bool:
+        return self._file is not None
+
+    def _try_lock(self, f) -> bool:
+        try:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """获取锁
+
+        Args:
+            blocking: 为False时只尝试一次，锁被占用立即返回False
+
+        Returns:
+            bool: 是否获得锁
+
+        Raises:
+            LockTimeout: 阻塞等待超过timeout
+        """
+        if self._file is not None:
+            return True
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        f = open(self.path, "a+")
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        while not self._try_lock(f):
+            if not blocking:
+                f.close()
+                return False
+            if deadline is not None and time.monotonic() >= deadline:
+                f.close()
+                raise LockTimeout(f"等待文件锁超时: {self.path}")
+            time.sleep(LOCK_POLL_INTERVAL)
+        self._file = f
+        return True
+
+    def release(self):
+        """释放锁（锁文件保留，供下次加锁使用）"""
+        if self._file is None:
+            return
+        try:
+            if fcntl:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            else:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+
+def lock_for(path: str, timeout: Optional[float] = None) -> FileLock:
+    """共享文件旁边的锁（<path>.lock），读改写共享文件时使用"""
+    return FileLock(path + ".lock", timeout=timeout)
+
+
+def make_key(course_id, package_version_id) -> str:
+    """按课程包和版本生成工作区名称"""
+    return sanitize_key(f"{course_id}_{package_version_id}")
+
+
+def new_run_id() -> str:
+    """按时间和进程号生成唯一的运行ID"""
+    return f"run_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{os.getpid()}"
+
+
+def sanitize_key(key: str) -> str:
+    """把工作区名称限制为可用作目录名的字符"""
+    key = re.sub(r"[^\w.-]+", "_", str(key)).strip("._")
+    if not key:
+        raise ValueError("工作区名称不能为空")
+    return key
+
+
+def runs_dir(root: str = "data") -> str:
+    return os.path.join(root, RUNS_DIR)
+
+
+def read_latest(root: str = "data") -> Optional[Dict[str, Any]]:
+    """读取最新结果指针，不存在时返回None"""
+    path = os.path.join(runs_dir(root), LATEST_FILE)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+class Workspace:
+    """一次运行的工作区目录
+
+    运行期间持有工作区的排它锁；不同工作区的运行互不影响，可以在同一台机器上并行。
+
+    Args:
+        root: 数据根目录
+        key: 工作区名称，如make_key生成的 <课程包ID>_<版本ID> 或new_run_id生成的运行ID
+    """
+
+    def __init__(self, root: str = "data", key: Optional[str] = None):
+        self.root = root
+        self.key = sanitize_key(key) if key else new_run_id()
+        self.path = os.path.join(runs_dir(root), self.key)
+        self._lock = FileLock(os.path.join(self.path, ".lock"))
+
+    @classmethod
+    def latest(cls, root: str = "data") -> Optional["Workspace"]:
+        """最新结果指针指向的工作区，没有指针时返回None"""
+        pointer = read_latest(root)
+        if not pointer or not pointer.get("workspace"):
+            return None
+        return cls(root, pointer["workspace"])
+
+    @property
+    def locked(self) -> bool:
+        return self._lock.locked
+
+    def open(self, wait: Optional[float] = 0) -> "Workspace":
+        """创建工作区目录并获取排它锁
+
+        Args:
+            wait: 锁被占用时等待的秒数，0表示立即失败，None表示一直等待
+
+        Raises:
+            WorkspaceBusyError: 工作区正在被另一个运行使用
+        """
+        if not os.path.exists(self.path):
+            os.makedirs(self.path, exist_ok=True)
+        if wait == 0:
+            acquired = self._lock.acquire(blocking=False)
+        else:
+            self._lock.timeout = wait
+            try:
+                acquired = self._lock.acquire()
+            except LockTimeout:
+                acquired = False
+        if not acquired:
+            raise WorkspaceBusyError(f"工作区 {self.key} 正在被另一个运行使用: {self.path}")
+        return self
+
+    def close(self):
+        self._lock.release()
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def publish(self) -> Dict[str, Any]:
+        """把本工作区记为最新结果，原子替换指针文件
+
+        应在产物写完之后调用，读取方通过指针总能看到完整的结果；产物列表为工作区中当前的全部文件。
+
+        Returns:
+            dict: 新的指针内容
+        """
+        pointer_file = os.path.join(runs_dir(self.root), LATEST_FILE)
+        files = sorted(name for name in os.listdir(self.path)
+                       if not name.startswith(".") and os.path.isfile(os.path.join(self.path, name)))
+        pointer = {
+            "workspace": self.key,
+            "path": self.path,
+            "updated": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "files": files,
+        }
+        with lock_for(pointer_file):
+            atomic_write(pointer_file, json.dumps(pointer, ensure_ascii=False, indent=2).encode("utf-8"))
+        return pointer